@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
+# Selects the URLs with the async views (see app/asgi_urls.py).
+os.environ.setdefault('APP_SERVER', 'asgi')
 
 application = get_asgi_application()
@@ -0,0 +1,18 @@
+"""
+URL configuration of the ASGI deployment (see app/asgi.py).
+
+The same URLs as app/urls.py, with the health check and the hot read endpoints of the
+recipe API served by native async views.
+"""
+from django.urls import include, path
+
+from app import urls
+from core import views as core_views
+
+urlpatterns = [
+    path('api/health-check/', core_views.async_health_check, name='health-check'),
+    path('api/recipe/', include('recipe.async_urls')),
+] + [
+    pattern for pattern in urls.urlpatterns
+    if getattr(pattern, 'name', None) != 'health-check' and getattr(pattern, 'namespace', None) != 'recipe'
+]
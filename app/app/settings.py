@@ -11,10 +11,14 @@ https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 
 import os
+import sys
 from pathlib import Path
 
 ENVIRONMENT = os.environ.get('ENV')
 
+# Whether this process runs the test suite (manage.py test).
+TESTING = sys.argv[1:2] == ['test']
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -46,6 +50,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'core',
     'rest_framework',
     'rest_framework.authtoken',
@@ -55,6 +60,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so it times the whole request (see core/metrics.py).
+    'core.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -68,7 +75,9 @@ if ENVIRONMENT == 'development':
     CORS_ORIGIN_ALLOW_ALL = True
     MIDDLEWARE.append('corsheaders.middleware.CorsMiddleware')
 
-ROOT_URLCONF = 'app.urls'
+# The ASGI deployment (APP_SERVER=asgi, set by app/asgi.py) serves the hot read endpoints with async views.
+APP_SERVER = os.environ.get('APP_SERVER', 'wsgi')
+ROOT_URLCONF = 'app.asgi_urls' if APP_SERVER == 'asgi' else 'app.urls'
 
 TEMPLATES = [
     {
@@ -102,6 +111,58 @@ DATABASES = {
     }
 }
 
+# Read replicas (optional): DB_REPLICA_HOSTS=host[:port],... adds a "replica<N>" connection per host, with the
+# database and credentials of the primary. The reads of the recipe API go to them (see core/db_router.py),
+# except for the users who wrote in the last DB_REPLICA_PIN_SECONDS, which must be longer than the replication lag.
+DATABASE_REPLICAS = []
+for index, replica_host in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')), start=1):
+    replica_host, _, replica_port = replica_host.strip().partition(':')
+    DATABASES[f'replica{index}'] = {
+        **DATABASES['default'],
+        'HOST': replica_host,
+        'PORT': replica_port,
+        'TEST': {'MIRROR': 'default'},  # The tests don't create databases on the replicas.
+    }
+    DATABASE_REPLICAS.append(f'replica{index}')
+
+if TESTING:
+    # The stand-in replica of the tests (see core/tests/test_db_router.py): a second database on the primary's
+    # server, which nothing is replicated to. It isn't in DATABASE_REPLICAS, so only the tests that set it there
+    # read from it, and it is only connected to (and its test database created) by the tests that use it.
+    DATABASES['test_replica'] = {
+        **DATABASES['default'],
+        'TEST': {'NAME': f"test_{DATABASES['default']['NAME']}_replica"},
+    }
+
+DATABASE_ROUTERS = ['core.db_router.ReplicaRouter']
+DATABASE_REPLICA_PIN_SECONDS = int(os.environ.get('DB_REPLICA_PIN_SECONDS', 10))
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+# The cache must be shared by all the worker processes, so that the invalidations made by one
+# worker are seen by the others (the default local-memory cache is per process). Redis has
+# atomic increments (the cache versions and counters) and evicts by LRU when it is full, rather
+# than culling random entries like the file-based cache (see the redis service of docker-compose).
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.redis.RedisCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'redis://redis:6379/0'),
+    }
+}
+if CACHES['default']['BACKEND'] != 'django.core.cache.backends.redis.RedisCache':
+    # The other backends cull entries beyond MAX_ENTRIES (300 by default).
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRIES', 100_000))}
+if TESTING:
+    # The tests don't need a Redis server, nor flush the one of the dev environment (see core/tests/base.py).
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 100_000},
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -154,8 +215,70 @@ AUTH_USER_MODEL = 'core.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    # JSON rendered and parsed with orjson (they fall back to DRF's JSON classes without it).
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'core.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
+# Page size of the recipe list, and the maximum page size a client can ask for with ?page_size=
+RECIPE_PAGE_SIZE = int(os.environ.get('RECIPE_PAGE_SIZE', 50))
+RECIPE_MAX_PAGE_SIZE = int(os.environ.get('RECIPE_MAX_PAGE_SIZE', 200))
+
+# Maximum number of results of the tag/ingredient autocomplete (?prefix= and ?similar=)
+RECIPE_AUTOCOMPLETE_LIMIT = int(os.environ.get('RECIPE_AUTOCOMPLETE_LIMIT', 10))
+
+# Maximum number of operations in a batch request to /api/recipe/recipes/batch/
+RECIPE_BATCH_MAX_SIZE = int(os.environ.get('RECIPE_BATCH_MAX_SIZE', 100))
+
+# Number of recipes read from the database at a time by /api/recipe/recipes/export/
+RECIPE_EXPORT_CHUNK_SIZE = int(os.environ.get('RECIPE_EXPORT_CHUNK_SIZE', 500))
+
+# Maximum size (in bytes) of a recipe image upload request (nginx's client_max_body_size is 10M),
+# accepted image formats (Pillow names), and maximum number of pixels of an image.
+RECIPE_IMAGE_MAX_UPLOAD_SIZE = int(os.environ.get('RECIPE_IMAGE_MAX_UPLOAD_SIZE', 10 * 1024 * 1024))
+RECIPE_IMAGE_FORMATS = ['JPEG', 'PNG', 'WEBP', 'GIF']
+RECIPE_IMAGE_MAX_PIXELS = int(os.environ.get('RECIPE_IMAGE_MAX_PIXELS', 40_000_000))
+
+# Background jobs (see core/jobs.py): worker threads per run_worker process, seconds between
+# polls of an idle worker, seconds a running job is leased for (it runs again after that if the
+# worker died), and the retries of a failing job (the delay doubles on each attempt).
+JOBS_WORKER_THREADS = int(os.environ.get('JOBS_WORKER_THREADS', 4))
+JOBS_POLL_INTERVAL = float(os.environ.get('JOBS_POLL_INTERVAL', 1))
+JOBS_LEASE = int(os.environ.get('JOBS_LEASE', 600))
+JOBS_MAX_ATTEMPTS = int(os.environ.get('JOBS_MAX_ATTEMPTS', 5))
+JOBS_RETRY_BACKOFF = int(os.environ.get('JOBS_RETRY_BACKOFF', 10))
+JOBS_RETRY_MAX_DELAY = int(os.environ.get('JOBS_RETRY_MAX_DELAY', 3600))
+
+# Sizes (maximum width/height in pixels) of the recipe image variants, generated by a background job.
+RECIPE_IMAGE_SIZES = [int(size) for size in os.environ.get('RECIPE_IMAGE_SIZES', '160,480,1080').split(',')]
+
+# Per-user cache of the recipe, tag and ingredient read responses (see recipe/cache.py)
+RECIPE_CACHE_ENABLED = bool(int(os.environ.get('RECIPE_CACHE_ENABLED', 1)))
+RECIPE_CACHE_TIMEOUT = int(os.environ.get('RECIPE_CACHE_TIMEOUT', 300))  # In seconds.
+
+# Cache of the token lookups of CachedTokenAuthentication (see core/authentication.py).
+# Entries in the process (0 disables the cache) and their time to live in seconds.
+AUTH_TOKEN_CACHE_SIZE = int(os.environ.get('AUTH_TOKEN_CACHE_SIZE', 1024))
+AUTH_TOKEN_CACHE_TTL = int(os.environ.get('AUTH_TOKEN_CACHE_TTL', 30))
+# Also cache them in the default cache, shared by the processes.
+AUTH_TOKEN_SHARED_CACHE = bool(int(os.environ.get('AUTH_TOKEN_SHARED_CACHE', 0)))
+AUTH_TOKEN_SHARED_CACHE_TTL = int(os.environ.get('AUTH_TOKEN_SHARED_CACHE_TTL', 300))
+
 SPECTACULAR_SETTINGS = {
     'COMPONENT_SPLIT_REQUEST': True,  # So we can upload images through the UI.
+    # So the error responses declared with many=True are lists too (the 400 of the recipe batch).
+    'ENABLE_LIST_MECHANICS_ON_NON_2XX': True,
 }
+
+# Per-request metrics: Server-Timing header and per-route histograms at /api/metrics/ (staff tokens only,
+# see core/metrics.py).
+METRICS_ENABLED = bool(int(os.environ.get('METRICS_ENABLED', 1)))
+# Seconds between the copies of the histograms of each process to the shared cache.
+METRICS_FLUSH_INTERVAL = int(os.environ.get('METRICS_FLUSH_INTERVAL', 10))
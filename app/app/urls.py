@@ -24,6 +24,7 @@ from core import views as core_views
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/health-check/', core_views.health_check, name='health-check'),
+    path('api/metrics/', core_views.request_metrics, name='metrics'),
     # SpectacularAPIView is used to generate the OpenAPI schema
     path('api/schema/', SpectacularAPIView.as_view(), name='api-schema'),
     # SpectacularSwaggerView is used to generate the Swagger UI with the OpenAPI schema
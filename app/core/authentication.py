@@ -0,0 +1,213 @@
+"""
+Token authentication with a cache of the token lookups.
+
+TokenAuthentication runs a query (token joined to its user) on every request. The
+lookups are cached in-process (LRU with a time to live) and, optionally, in the
+shared Django cache, so they are also reused across worker processes.
+
+Each token has a generation in the shared cache, which the cached entries are stored
+with. When a token is deleted or its user is saved (password, is_active or any other
+change), the generation is bumped: the entries of every process stop matching it, and
+the next request looks the token up again. A cached lookup costs one shared cache read.
+When the shared cache is unavailable, the tokens are looked up in the database without
+any caching, so that an outage of the cache doesn't fail every request.
+
+aauthenticate() is the same authentication for the async views (see recipe/async_views.py),
+with the shared cache and the database awaited.
+"""
+import copy
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication, get_authorization_header
+
+
+SHARED_KEY = 'auth-token:{}'
+GENERATION_KEY = 'auth-token:generation:{}'
+
+logger = logging.getLogger(__name__)
+
+_local = OrderedDict()  # {token key: (expiry time, (token, generation))}, from the least to the most recently used.
+_lock = threading.Lock()
+
+
+def _new_generation():
+    """Return a generation number that has never been used."""
+    # Like the recipe cache versions: if a generation is evicted from the cache, its
+    # replacement never matches the entries stored with the previous one.
+    return time.time_ns()
+
+
+def _generation_timeout():
+    """Return the time to live of the generations, the longest time an entry is cached."""
+    # A generation recreated after it expires is new, so this only bounds the memory.
+    return max(settings.AUTH_TOKEN_CACHE_TTL, settings.AUTH_TOKEN_SHARED_CACHE_TTL)
+
+
+def get_generation(key):
+    """Return the current generation of a token, or None if the shared cache is unavailable."""
+    generation_key = GENERATION_KEY.format(key)
+    try:
+        generation = cache.get(generation_key)
+        if generation is None:
+            cache.add(generation_key, _new_generation(), _generation_timeout())
+            generation = cache.get(generation_key)
+    except Exception:  # The errors of the cache backend (e.g. redis.ConnectionError) have no common base class.
+        logger.warning('Reading the generation of a token from the cache failed.', exc_info=True)
+        return None
+
+    return generation
+
+
+async def aget_generation(key):
+    """Async version of get_generation()."""
+    generation_key = GENERATION_KEY.format(key)
+    try:
+        generation = await cache.aget(generation_key)
+        if generation is None:
+            await cache.aadd(generation_key, _new_generation(), _generation_timeout())
+            generation = await cache.aget(generation_key)
+    except Exception:
+        logger.warning('Reading the generation of a token from the cache failed.', exc_info=True)
+        return None
+
+    return generation
+
+
+def _get_local(key, generation):
+    """Return a token of a generation from the in-process cache, or None."""
+    with _lock:
+        entry = _local.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic() or entry[1][1] != generation:
+            del _local[key]
+            return None
+        _local.move_to_end(key)
+        return entry[1][0]
+
+
+def _set_local(key, token, generation):
+    """Add a token of a generation to the in-process cache, evicting the least recently used ones."""
+    with _lock:
+        _local[key] = (time.monotonic() + settings.AUTH_TOKEN_CACHE_TTL, (token, generation))
+        _local.move_to_end(key)
+        while len(_local) > settings.AUTH_TOKEN_CACHE_SIZE:
+            _local.popitem(last=False)
+
+
+def _shared_token(entry, generation):
+    """Return the token of an entry of the shared cache if it is of a generation, or None."""
+    if entry is None or entry[1] != generation:
+        return None
+    return entry[0]
+
+
+def invalidate_token(key):
+    """Remove a token from the caches of all the processes."""
+    with _lock:
+        _local.pop(key, None)
+    generation_key = GENERATION_KEY.format(key)
+    try:
+        cache.incr(generation_key)
+    except ValueError:  # The key doesn't exist (yet, or anymore).
+        cache.set(generation_key, _new_generation(), _generation_timeout())
+    if settings.AUTH_TOKEN_SHARED_CACHE:
+        cache.delete(SHARED_KEY.format(key))
+
+
+def clear():
+    """Remove all the tokens from the in-process cache."""
+    with _lock:
+        _local.clear()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication that caches the token lookups."""
+
+    def authenticate_credentials(self, key):
+        if settings.AUTH_TOKEN_CACHE_SIZE <= 0:
+            return super().authenticate_credentials(key)
+
+        # Read before the token: a lookup that races with an invalidation is cached with the old generation.
+        generation = get_generation(key)
+        if generation is None:
+            # Without the generations, the cached tokens can't be checked: neither cache tier is used.
+            return super().authenticate_credentials(key)
+        token = _get_local(key, generation)
+        if token is None and settings.AUTH_TOKEN_SHARED_CACHE:
+            token = _shared_token(cache.get(SHARED_KEY.format(key)), generation)
+            if token is not None:
+                _set_local(key, token, generation)
+        if token is None:
+            # Only valid tokens of active users are cached, the errors are raised here.
+            user, token = super().authenticate_credentials(key)
+            _set_local(key, token, generation)
+            if settings.AUTH_TOKEN_SHARED_CACHE:
+                cache.set(SHARED_KEY.format(key), (token, generation), settings.AUTH_TOKEN_SHARED_CACHE_TTL)
+
+        return self._checked(token)
+
+    def _checked(self, token):
+        """Return (user, token) of a cached token, if its user is still active."""
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+
+        # Each request gets its own copies, so changes to request.user don't leak into the cache.
+        token = copy.copy(token)
+        token.user = copy.copy(token.user)
+        return (token.user, token)
+
+    def get_key(self, request):
+        """Return the token key of the Authorization header, or None (like TokenAuthentication.authenticate)."""
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+
+        if len(auth) == 1:
+            raise exceptions.AuthenticationFailed(_('Invalid token header. No credentials provided.'))
+        elif len(auth) > 2:
+            raise exceptions.AuthenticationFailed(_('Invalid token header. Token string should not contain spaces.'))
+        try:
+            return auth[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed(
+                _('Invalid token header. Token string should not contain invalid characters.')
+            )
+
+    async def aauthenticate(self, request):
+        """Async version of authenticate(), for the async views."""
+        key = self.get_key(request)
+        if key is None:
+            return None
+
+        generation = await aget_generation(key) if settings.AUTH_TOKEN_CACHE_SIZE > 0 else None
+        # Without a generation (no caching, or the shared cache is unavailable), neither cache tier is used.
+        cached = generation is not None
+        token = None
+        if cached:
+            token = _get_local(key, generation)
+            if token is None and settings.AUTH_TOKEN_SHARED_CACHE:
+                token = _shared_token(await cache.aget(SHARED_KEY.format(key)), generation)
+                if token is not None:
+                    _set_local(key, token, generation)
+        if token is None:
+            model = self.get_model()
+            try:
+                token = await model.objects.select_related('user').aget(key=key)
+            except model.DoesNotExist:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            if not token.user.is_active:
+                raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+            if cached:
+                _set_local(key, token, generation)
+                if settings.AUTH_TOKEN_SHARED_CACHE:
+                    await cache.aset(SHARED_KEY.format(key), (token, generation), settings.AUTH_TOKEN_SHARED_CACHE_TTL)
+
+        return self._checked(token)
@@ -0,0 +1,101 @@
+"""
+Database router that sends the reads of the API views to the read replicas.
+
+The views with ReplicaReadsMixin read from a random replica of DATABASE_REPLICAS while
+they answer a safe (GET/HEAD/OPTIONS) request. Everything else, including all the writes,
+the authentication and the reads of the background jobs, uses the primary (default).
+
+A replica may lag behind the primary, so a user that just wrote would not always read
+its own writes back. When the data of a user changes (see recipe/signals.py), the user
+is pinned to the primary for DATABASE_REPLICA_PIN_SECONDS: the pin is stored in the
+shared cache, so it holds in all the worker processes.
+"""
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.permissions import SAFE_METHODS
+
+
+PIN_KEY = 'db-router:pinned:{user_id}'
+
+# Whether the reads of the current request go to the replicas.
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+def pin_to_primary(user_id):
+    """Send the reads of a user to the primary for the next DATABASE_REPLICA_PIN_SECONDS."""
+    if settings.DATABASE_REPLICAS:
+        cache.set(PIN_KEY.format(user_id=user_id), True, timeout=settings.DATABASE_REPLICA_PIN_SECONDS)
+
+
+def reads_from_replicas(request):
+    """Return whether the reads of an (authenticated) request can go to the replicas."""
+    return (
+        bool(settings.DATABASE_REPLICAS)
+        and request.method in SAFE_METHODS
+        and cache.get(PIN_KEY.format(user_id=request.user.id)) is None
+    )
+
+
+async def areads_from_replicas(request):
+    """Async version of reads_from_replicas()."""
+    return (
+        bool(settings.DATABASE_REPLICAS)
+        and request.method in SAFE_METHODS
+        and await cache.aget(PIN_KEY.format(user_id=request.user.id)) is None
+    )
+
+
+def use_replicas():
+    """Send the reads of the current context to the replicas, and return the token that stops it."""
+    return _replica_reads.set(True)
+
+
+def stop_replicas(token):
+    """Send the reads of the current context back to the primary."""
+    _replica_reads.reset(token)
+
+
+class ReplicaRouter:
+    """Route the reads of the replica contexts (see use_replicas) to the replicas, and the rest to the primary."""
+
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get() and settings.DATABASE_REPLICAS:
+            return random.choice(settings.DATABASE_REPLICAS)
+
+        # Not None: the objects read from a replica must not pull the queries of their relations there.
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # Not None either, the saves of an object read from a replica would go to that replica.
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replicas hold the same data as the primary.
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+
+        return None
+
+
+class ReplicaReadsMixin:
+    """Answer the safe requests of a view from the replicas, unless the user is pinned to the primary."""
+
+    _replica_token = None
+
+    def initial(self, request, *args, **kwargs):
+        # After the authentication (on the primary: a new token may not be replicated yet) and the permissions.
+        super().initial(request, *args, **kwargs)
+        if reads_from_replicas(request):
+            self._replica_token = use_replicas()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if self._replica_token is not None:
+            stop_replicas(self._replica_token)
+            self._replica_token = None
+
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -0,0 +1,129 @@
+"""
+Background jobs, queued in a PostgreSQL table.
+
+enqueue(func, *args) inserts a Job row in the current transaction, so the job only
+becomes visible to the workers (the run_worker command) when the transaction commits,
+and it is dropped if it rolls back. The function must be importable (module level),
+and the arguments JSON serializable.
+
+Each worker thread claims the next runnable job with SELECT ... FOR UPDATE SKIP LOCKED
+(the rows locked by the other workers are skipped instead of waited for), and leases
+it for JOBS_LEASE seconds: if the worker dies, the job runs again once the lease expires.
+So a job can run more than once, and must be idempotent.
+
+A job that raises is retried JOBS_MAX_ATTEMPTS times in total, waiting
+JOBS_RETRY_BACKOFF seconds after the first failure and twice as long after each next one
+(up to JOBS_RETRY_MAX_DELAY). Then it is kept with the failed status and its traceback.
+
+The workers must use the same cache as the app (CACHE_BACKEND/CACHE_LOCATION): the jobs
+that change data invalidate the app's cached responses through it.
+"""
+import logging
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from core.models import Job
+
+
+logger = logging.getLogger(__name__)
+
+
+def func_path(func):
+    """Return the dotted path of a function, checking it can be imported."""
+    path = f'{func.__module__}.{func.__qualname__}'
+    try:
+        imported = import_string(path)
+    except ImportError:
+        imported = None
+    if imported is not func:
+        raise ValueError(f'{func!r} is not a module level function, it cannot be run by the workers.')
+
+    return path
+
+
+def enqueue(func, *args, priority=0, delay=0, max_attempts=None):
+    """Queue a call of func(*args) to run in the background, and return its job."""
+    return Job.objects.create(
+        func=func_path(func),
+        args=list(args),
+        priority=priority,
+        run_at=timezone.now() + timedelta(seconds=delay),
+        max_attempts=max_attempts or settings.JOBS_MAX_ATTEMPTS,
+    )
+
+
+def retry_delay(attempts):
+    """Return the seconds to wait before retrying a job that failed attempts times."""
+    return min(settings.JOBS_RETRY_BACKOFF * 2 ** (attempts - 1), settings.JOBS_RETRY_MAX_DELAY)
+
+
+def claim():
+    """Lease the next runnable job (highest priority first), or return None."""
+    with transaction.atomic():
+        now = timezone.now()
+        job = (
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(status=Job.QUEUED, run_at__lte=now)
+            .order_by('-priority', 'run_at', 'id')
+            .first()
+        )
+        if job is None:
+            return None
+
+        job.attempts += 1
+        job.run_at = now + timedelta(seconds=settings.JOBS_LEASE)
+        job.save(update_fields=['attempts', 'run_at'])
+        return job
+
+
+def run(job):
+    """Run a claimed job, and delete it, or schedule its retry."""
+    started = time.perf_counter()
+    try:
+        import_string(job.func)(*job.args)
+    except Exception:
+        error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            logger.exception('Job %s %s failed, after %s attempts', job.id, job, job.attempts)
+            Job.objects.filter(id=job.id).update(status=Job.FAILED, last_error=error)
+        else:
+            delay = retry_delay(job.attempts)
+            logger.warning('Job %s %s failed, retrying in %ss', job.id, job, delay, exc_info=True)
+            Job.objects.filter(id=job.id).update(
+                run_at=timezone.now() + timedelta(seconds=delay), last_error=error,
+            )
+        return
+
+    logger.info('Job %s %s done in %.3fs', job.id, job, time.perf_counter() - started)
+    Job.objects.filter(id=job.id).delete()
+
+
+def run_next():
+    """Run the next runnable job, and return whether there was one."""
+    job = claim()
+    if job is None:
+        return False
+
+    run(job)
+    return True
+
+
+def work(stop, burst=False, close_connections=False):
+    """Run jobs until stop (a threading.Event) is set, or until there are none left in burst mode."""
+    try:
+        while not stop.is_set():
+            if close_connections:
+                close_old_connections()  # Like at the start of a request (CONN_MAX_AGE, broken connections).
+            if not run_next():
+                if burst:
+                    break
+                stop.wait(settings.JOBS_POLL_INTERVAL)
+    finally:
+        if close_connections:
+            connection.close()  # The connection of this thread.
@@ -0,0 +1,101 @@
+"""
+Django command to benchmark the serialization of the recipe list.
+
+It compares RecipeSerializer(many=True) on prefetched recipes with serialize_recipe_list on
+.values() rows (the queries included, and the rendering to JSON), and checks both render the
+same bytes. The recipes are created in a transaction that is rolled back at the end.
+"""
+import time
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Prefetch
+from rest_framework.renderers import JSONRenderer
+
+from core.models import Recipe, Tag, Ingredient
+from recipe.serializers import RECIPE_LIST_FIELDS, RecipeSerializer, serialize_recipe_list
+
+
+class Rollback(Exception):
+    """Raised to roll back the benchmark data."""
+
+
+class Command(BaseCommand):
+    """Django command to benchmark the recipe list serialization."""
+
+    help = 'Benchmark RecipeSerializer against the fast recipe list serialization.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000], help='Numbers of recipes.')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs of each size (the best one is reported).')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        self.stdout.write(f'{"recipes":>8} {"serializer":>12} {"fast":>12} {"speedup":>8}')
+        try:
+            with transaction.atomic():
+                user = get_user_model().objects.create_user('benchmark@example.com', 'benchmark')
+                tags = Tag.objects.bulk_create([Tag(user=user, name=f'Tag {i}') for i in range(20)])
+                ingredients = Ingredient.objects.bulk_create([
+                    Ingredient(user=user, name=f'Ingredient {i}') for i in range(50)
+                ])
+                created = 0
+                for size in sorted(options['sizes']):
+                    self.create_recipes(user, tags, ingredients, created, size - created)
+                    created = size
+                    self.benchmark(user, size, options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def create_recipes(self, user, tags, ingredients, start, count):
+        """Create recipes with 3 tags and 5 ingredients each."""
+        recipes = Recipe.objects.bulk_create([
+            Recipe(user=user, title=f'Recipe {i}', time_minutes=i % 120, price=Decimal(i % 10000) / 100,
+                   link=f'https://example.com/recipes/{i}')
+            for i in range(start, start + count)
+        ])
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe_id=recipe.id, tag_id=tags[(recipe.id + j) % len(tags)].id)
+            for recipe in recipes for j in range(3)
+        ])
+        Recipe.ingredients.through.objects.bulk_create([
+            Recipe.ingredients.through(
+                recipe_id=recipe.id, ingredient_id=ingredients[(recipe.id + j) % len(ingredients)].id
+            )
+            for recipe in recipes for j in range(5)
+        ])
+
+    def benchmark(self, user, size, repeat):
+        """Time both serializations of the recipes of a user."""
+        recipes = Recipe.objects.filter(user=user).order_by('-id')
+        renderer = JSONRenderer()
+
+        def serializer():
+            queryset = recipes.prefetch_related(
+                Prefetch('tags', queryset=Tag.objects.only('id', 'name').order_by('id')),
+                Prefetch('ingredients', queryset=Ingredient.objects.only('id', 'name').order_by('id')),
+            )
+            return renderer.render(RecipeSerializer(queryset, many=True).data)
+
+        def fast():
+            return renderer.render(serialize_recipe_list(list(recipes.values(*RECIPE_LIST_FIELDS))))
+
+        if serializer() != fast():
+            raise CommandError(f'The serializations of {size} recipes are different.')
+
+        timings = []
+        for run in (serializer, fast):
+            best = None
+            for _ in range(repeat):
+                started = time.perf_counter()
+                run()
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            timings.append(best)
+
+        self.stdout.write(
+            f'{size:>8} {timings[0] * 1000:>10.1f}ms {timings[1] * 1000:>10.1f}ms {timings[0] / timings[1]:>7.1f}x'
+        )
@@ -0,0 +1,249 @@
+"""
+Django command to bulk import recipes from a newline-delimited JSON file.
+
+Each line is a recipe object, in the same shape as the recipe export:
+
+    {"title": "...", "time_minutes": 10, "price": "5.00", "description": "...", "link": "...",
+     "tags": [{"name": "Vegan"}], "ingredients": ["Tofu"], "user": "user@example.com"}
+
+"user" is optional when --user is given. Recipes, tags, ingredients and their through
+rows are loaded with PostgreSQL COPY, one transaction per batch. The byte offset of the
+next line is saved in the same transaction, so an interrupted import resumes from the
+last committed batch when it is run again.
+"""
+import io
+import json
+import os
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core.models import ImportCheckpoint, Recipe, Tag, Ingredient
+from recipe.signals import data_changed
+
+
+def copy_value(value):
+    """Format a value for the COPY text format."""
+    if value is None:
+        return '\\N'
+
+    return (
+        str(value)
+        .replace('\\', '\\\\')
+        .replace('\t', '\\t')
+        .replace('\n', '\\n')
+        .replace('\r', '\\r')
+    )
+
+
+def copy_rows(cursor, table, columns, rows):
+    """Load rows into a table with COPY."""
+    if not rows:
+        return
+
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join(copy_value(value) for value in row))
+        buffer.write('\n')
+    buffer.seek(0)
+    cursor.copy_expert(f'COPY {table} ({", ".join(columns)}) FROM STDIN', buffer)
+
+
+def next_ids(cursor, model, count):
+    """Reserve count ids from the sequence of a model's table."""
+    if not count:
+        return []
+
+    cursor.execute(
+        'SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)',
+        [model._meta.db_table, 'id', count],
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def item_names(items):
+    """Return the unique names of a list of tags/ingredients (names or {"name": ...} objects)."""
+    names = (item['name'] if isinstance(item, dict) else item for item in items or [])
+    return list(dict.fromkeys(str(name) for name in names))
+
+
+def check_length(model, field_name, value):
+    """Raise ValueError if a string is longer than its model field."""
+    max_length = model._meta.get_field(field_name).max_length
+    if len(value) > max_length:
+        raise ValueError(f'{model.__name__.lower()} {field_name} longer than {max_length} characters')
+
+    return value
+
+
+def check_digits(model, field_name, value):
+    """Raise ValueError if a (quantized) decimal has more digits than its model field."""
+    field = model._meta.get_field(field_name)
+    if not value.is_finite() or value.adjusted() >= field.max_digits - field.decimal_places:
+        raise ValueError(f'{model.__name__.lower()} {field_name} {value} has more than {field.max_digits} digits')
+
+    return value
+
+
+class Command(BaseCommand):
+    """Django command to bulk import recipes."""
+
+    help = 'Import recipes from a newline-delimited JSON file with PostgreSQL COPY.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='NDJSON file with one recipe per line.')
+        parser.add_argument('--user', help='Email of the owner of the recipes without a "user".')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Recipes per transaction.')
+        parser.add_argument('--restart', action='store_true', help='Ignore the saved progress of this file.')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        path = os.path.abspath(options['path'])
+        self.default_user = options['user']
+        self.users = {}  # {email: user id}
+        # {model: {user id: {name: id}}}, so the names are de-duplicated in memory.
+        self.names = {Tag: {}, Ingredient: {}}
+
+        checkpoint, _ = ImportCheckpoint.objects.get_or_create(source=path)
+        if options['restart']:
+            checkpoint.offset = checkpoint.recipes = 0
+            checkpoint.save()
+        if checkpoint.offset:
+            self.stdout.write(f'Resuming after {checkpoint.recipes} recipes...')
+
+        started = time.monotonic()
+        imported = 0
+        with open(path, 'rb') as file:
+            file.seek(checkpoint.offset)
+            while True:
+                offset = file.tell()
+                lines = [line for line in (file.readline() for _ in range(options['batch_size'])) if line]
+                if not lines:
+                    break
+
+                with transaction.atomic():
+                    count = self.import_batch(lines, offset)
+                    checkpoint.offset = file.tell()
+                    checkpoint.recipes += count
+                    checkpoint.save()
+
+                imported += count
+                rate = imported / max(time.monotonic() - started, 1e-6)
+                self.stdout.write(f'Imported {checkpoint.recipes} recipes ({rate:.0f} rows/sec)')
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {imported} recipes in {elapsed:.1f}s ({imported / max(elapsed, 1e-6):.0f} rows/sec)'
+        ))
+
+    def get_user_id(self, email):
+        """Return the id of the user with an email."""
+        if email not in self.users:
+            user_id = get_user_model().objects.filter(email=email).values_list('id', flat=True).first()
+            if user_id is None:
+                raise CommandError(f'User {email} does not exist.')
+            self.users[email] = user_id
+
+        return self.users[email]
+
+    def parse(self, line, offset):
+        """Parse a line of the file into (user id, recipe row values, tag names, ingredient names)."""
+        try:
+            data = json.loads(line)
+            email = data.get('user') or self.default_user
+            if not email:
+                raise ValueError('the recipe has no "user", and --user was not given')
+            price = Decimal(str(data['price'])).quantize(Decimal('0.01'))
+            time_minutes = int(data['time_minutes'])
+            if not -2**31 <= time_minutes < 2**31:
+                raise ValueError(f'recipe time_minutes {time_minutes} out of range')
+            # COPY would fail on the values the columns can't hold, without saying which line they are on.
+            values = (
+                check_length(Recipe, 'title', str(data['title'])),
+                str(data.get('description') or ''),
+                time_minutes,
+                check_digits(Recipe, 'price', price),
+                check_length(Recipe, 'link', str(data.get('link') or '')),
+            )
+            tags = [check_length(Tag, 'name', name) for name in item_names(data.get('tags'))]
+            ingredients = [check_length(Ingredient, 'name', name) for name in item_names(data.get('ingredients'))]
+        except (ValueError, KeyError, TypeError, InvalidOperation) as error:
+            raise CommandError(f'Invalid recipe at byte {offset}: {error!r}')
+
+        return self.get_user_id(email), values, tags, ingredients
+
+    def get_name_ids(self, cursor, model, wanted):
+        """Return {user id: {name: id}} for the wanted names, creating the missing ones with COPY."""
+        known = self.names[model]
+        new_users = [user_id for user_id in wanted if user_id not in known]
+        for user_id in new_users:
+            known[user_id] = {}
+        # Load the existing names of the users seen for the first time.
+        for user_id, name, obj_id in model.objects.filter(user_id__in=new_users).values_list('user_id', 'name', 'id'):
+            known[user_id].setdefault(name, obj_id)
+
+        missing = [(user_id, name) for user_id, names in wanted.items() for name in names if name not in known[user_id]]
+        ids = next_ids(cursor, model, len(missing))
+        copy_rows(cursor, model._meta.db_table, ['id', 'user_id', 'name'], [
+            (obj_id, user_id, name) for obj_id, (user_id, name) in zip(ids, missing)
+        ])
+        for obj_id, (user_id, name) in zip(ids, missing):
+            known[user_id][name] = obj_id
+
+        return known
+
+    def import_batch(self, lines, offset):
+        """Import a batch of lines, and return the number of recipes imported."""
+        recipes = []
+        for line in lines:
+            if line.strip():
+                recipes.append(self.parse(line, offset))
+            offset += len(line)
+
+        now = timezone.now()
+        with connection.cursor() as cursor:
+            tag_ids = self.get_name_ids(cursor, Tag, self.group_names(recipes, 2))
+            ingredient_ids = self.get_name_ids(cursor, Ingredient, self.group_names(recipes, 3))
+
+            recipe_ids = next_ids(cursor, Recipe, len(recipes))
+            copy_rows(
+                cursor,
+                Recipe._meta.db_table,
+                # COPY doesn't apply the model defaults (the image variants are generated on upload).
+                [
+                    'id', 'user_id', 'title', 'description', 'time_minutes', 'price', 'link', 'updated_at',
+                    'image_variants',
+                ],
+                [
+                    (recipe_id, user_id, *values, now, '{}')
+                    for recipe_id, (user_id, values, _, _) in zip(recipe_ids, recipes)
+                ],
+            )
+            copy_rows(cursor, Recipe.tags.through._meta.db_table, ['recipe_id', 'tag_id'], [
+                (recipe_id, tag_ids[user_id][name])
+                for recipe_id, (user_id, _, tags, _) in zip(recipe_ids, recipes)
+                for name in tags
+            ])
+            copy_rows(cursor, Recipe.ingredients.through._meta.db_table, ['recipe_id', 'ingredient_id'], [
+                (recipe_id, ingredient_ids[user_id][name])
+                for recipe_id, (user_id, _, _, ingredients) in zip(recipe_ids, recipes)
+                for name in ingredients
+            ])
+
+        # COPY doesn't send the model signals.
+        for user_id in {user_id for user_id, _, _, _ in recipes}:
+            data_changed(user_id)
+
+        return len(recipes)
+
+    def group_names(self, recipes, index):
+        """Return {user id: set of names} of the tags (index 2) or ingredients (index 3) of recipes."""
+        names = {}
+        for recipe in recipes:
+            names.setdefault(recipe[0], set()).update(recipe[index])
+
+        return names
@@ -0,0 +1,80 @@
+"""
+Django command to run the background jobs (see core/jobs.py).
+
+Each process runs --threads worker threads, each claiming and running one job at a time.
+SIGINT/SIGTERM stop the workers once their current jobs finish.
+"""
+import multiprocessing
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from core import jobs
+
+
+class Command(BaseCommand):
+    """Django command to run the background jobs."""
+
+    help = 'Run the background jobs queued with core.jobs.enqueue().'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threads', type=int, default=settings.JOBS_WORKER_THREADS, help='Worker threads per process.'
+        )
+        parser.add_argument('--processes', type=int, default=1, help='Worker processes.')
+        parser.add_argument('--burst', action='store_true', help='Exit when there are no runnable jobs left.')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        threads, processes, burst = options['threads'], options['processes'], options['burst']
+        if threads < 1 or processes < 1:
+            raise CommandError('--threads and --processes must be at least 1.')
+
+        self.stdout.write(f'Running jobs with {processes} process(es) of {threads} thread(s)...')
+        if processes == 1:
+            self.work(threads, burst)
+        else:
+            connections.close_all()  # The forked processes must open their own connections.
+            context = multiprocessing.get_context('fork')
+            children = [context.Process(target=self.work, args=(threads, burst)) for _ in range(processes)]
+            for child in children:
+                child.start()
+            # Forward the stop signals to the children, which stop like a single process does.
+            self.on_stop(lambda: [child.terminate() for child in children if child.is_alive()])
+            for child in children:
+                child.join()
+        self.stdout.write(self.style.SUCCESS('Workers stopped.'))
+
+    def on_stop(self, callback):
+        """Call callback on SIGINT/SIGTERM, and return the previous handlers."""
+        previous = {}
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            previous[signum] = signal.signal(signum, lambda *_: callback())
+
+        return previous
+
+    def work(self, threads, burst):
+        """Run the worker threads of this process until they stop."""
+        stop = threading.Event()
+        previous = self.on_stop(stop.set)
+        try:
+            if threads == 1:
+                # In this thread. A long running worker checks its connection like each request does; a burst
+                # run is short, and keeps the connection (and the transaction) it was called with.
+                jobs.work(stop, burst, close_connections=not burst)
+                return
+
+            workers = [
+                threading.Thread(target=jobs.work, args=(stop, burst), kwargs={'close_connections': True})
+                for _ in range(threads)
+            ]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        finally:
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
@@ -0,0 +1,281 @@
+"""
+Per-request performance metrics: Server-Timing spans and per-route histograms.
+
+RequestMetricsMiddleware (see core/middleware.py) times each request: its SQL queries,
+and the view, serializer and render spans that the code marks with timer() (the views
+with TimedViewMixin). The spans overlap (the view includes the authentication, the queries
+and the serializer, but not the rendering). They are sent in the Server-Timing header,
+and added to histograms by route (URL name) and method.
+
+The histograms of each process are kept in memory, and copied to the shared cache every
+METRICS_FLUSH_INTERVAL seconds by a thread of the process, so /api/metrics/ (whichever
+worker process answers it, to the staff only) can sum those of all the processes, in the
+Prometheus text format. The copies expire: the processes that stopped copying theirs
+(exited, or replaced by a deploy) are dropped, and their last copy is added to the retired
+totals so the sums never go backwards. A copy evicted from the cache before that is lost (Prometheus sees a
+counter reset).
+"""
+import logging
+import os
+import socket
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+logger = logging.getLogger(__name__)
+
+PROCESSES_KEY = 'metrics:processes'
+SNAPSHOT_KEY = 'metrics:snapshot:{process}'
+RETIRED_KEY = 'metrics:retired'
+
+# A process that didn't copy its histograms for this many flush intervals is gone. Its copy lives
+# twice as long, so it can be added to the retired totals.
+STALE_FLUSHES = 6
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+# {metric: (help, buckets)}, the metrics of each request.
+HISTOGRAMS = {
+    'http_request_duration_seconds': ('Time to answer the requests.', SECONDS_BUCKETS),
+    'http_request_view_seconds': ('Time spent in the views, without rendering.', SECONDS_BUCKETS),
+    'http_request_serializer_seconds': ('Time spent serializing the responses.', SECONDS_BUCKETS),
+    'http_request_render_seconds': ('Time spent rendering the responses.', SECONDS_BUCKETS),
+    'http_request_db_seconds': ('Time spent in SQL queries.', SECONDS_BUCKETS),
+    'http_request_db_queries': ('Number of SQL queries.', COUNT_BUCKETS),
+}
+
+_current = ContextVar('request_timings', default=None)
+
+# {(metric, route, method): [count of each bucket..., count above the last bucket, sum]}
+_histograms = {}
+_lock = threading.Lock()
+_flusher_pid = None
+
+
+class RequestTimings:
+    """The timings of a request, in seconds."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans = {'view': 0.0, 'serializer': 0.0, 'render': 0.0, 'db': 0.0}
+        self.queries = 0
+        self.active = set()  # The spans being timed (the nested ones aren't counted twice).
+
+    def server_timing(self, total):
+        """Return the Server-Timing header value."""
+        spans = [f'db;dur={self.spans["db"] * 1000:.3f};desc="{self.queries} queries"']
+        spans += [f'{name};dur={self.spans[name] * 1000:.3f}' for name in ('view', 'serializer', 'render')]
+        spans.append(f'total;dur={total * 1000:.3f}')
+        return ', '.join(spans)
+
+
+def execute_wrapper(execute, sql, params, many, context):
+    """Database execute wrapper that times the queries of the current request (see core/signals.py)."""
+    # Installed on every connection: the async ORM runs the queries in threads, which have their own
+    # connections, but see the timings of the request through the context variable.
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.spans['db'] += time.perf_counter() - start
+        timings.queries += 1
+
+
+def start_request():
+    """Start timing a request, and return its timings and the token that ends it."""
+    timings = RequestTimings()
+    return timings, _current.set(timings)
+
+
+def end_request(token):
+    """Stop timing the current request."""
+    _current.reset(token)
+
+
+@contextmanager
+def timer(name):
+    """Add the time of the block to a span of the current request (nothing outside a request)."""
+    timings = _current.get()
+    if timings is None or name in timings.active:
+        yield
+        return
+
+    timings.active.add(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.spans[name] += time.perf_counter() - start
+        timings.active.discard(name)
+
+
+def timed(name):
+    """Decorator that adds the time of each call to a span of the current request."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class TimedViewMixin:
+    """Add the time of a DRF view (authentication and handler, without the rendering) to the view span."""
+
+    def dispatch(self, request, *args, **kwargs):
+        with timer('view'):
+            return super().dispatch(request, *args, **kwargs)
+
+
+class TimedSerializerMixin:
+    """Add the time to represent the objects of a serializer to the serializer span."""
+
+    def to_representation(self, instance):
+        with timer('serializer'):
+            return super().to_representation(instance)
+
+
+def observe(metric, route, method, value):
+    """Add a value to a histogram."""
+    buckets = HISTOGRAMS[metric][1]
+    with _lock:
+        histogram = _histograms.get((metric, route, method))
+        if histogram is None:
+            histogram = _histograms[(metric, route, method)] = [0] * (len(buckets) + 2)
+        histogram[bisect_left(buckets, value)] += 1  # The first bucket with value <= bound.
+        histogram[-1] += value
+
+
+def record(route, method, timings, total):
+    """Add the timings of a request to the histograms."""
+    observe('http_request_duration_seconds', route, method, total)
+    for name in ('view', 'serializer', 'render', 'db'):
+        observe(f'http_request_{name}_seconds', route, method, timings.spans[name])
+    observe('http_request_db_queries', route, method, timings.queries)
+    _start_flusher()
+
+
+def process_id():
+    """Return the id of this process (read on each call: the workers are forked after the imports)."""
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def _start_flusher():
+    """Start the thread that copies the histograms of this process to the shared cache, once per process."""
+    global _flusher_pid
+    with _lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()  # A forked worker process doesn't have the thread of its parent.
+
+    threading.Thread(target=_flush_periodically, name='metrics-flush', daemon=True).start()
+
+
+def _flush_periodically():
+    """Copy the histograms to the shared cache every METRICS_FLUSH_INTERVAL seconds, even when idle."""
+    while True:
+        time.sleep(settings.METRICS_FLUSH_INTERVAL)
+        try:
+            flush()
+        except Exception:
+            logger.exception('Copying the metrics to the cache failed.')
+
+
+def flush():
+    """Copy the histograms of this process to the shared cache."""
+    with _lock:
+        histograms = {key: list(histogram) for key, histogram in _histograms.items()}
+
+    process = process_id()
+    timeout = 2 * STALE_FLUSHES * settings.METRICS_FLUSH_INTERVAL
+    cache.set(SNAPSHOT_KEY.format(process=process), {'time': time.time(), 'histograms': histograms}, timeout)
+    processes = cache.get(PROCESSES_KEY) or set()
+    if process not in processes:
+        # Two processes registering at once may drop one: it registers again on its next flush.
+        cache.set(PROCESSES_KEY, processes | {process}, timeout=None)
+
+
+def _add(totals, histograms):
+    """Add histograms to totals."""
+    for key, histogram in histograms.items():
+        total = totals.setdefault(key, [0] * len(histogram))
+        for index, value in enumerate(histogram):
+            total[index] += value
+
+
+def collect():
+    """Return the histograms of all the processes, summed, and retire the processes that are gone."""
+    flush()
+    processes = cache.get(PROCESSES_KEY) or set()
+    keys = {process: SNAPSHOT_KEY.format(process=process) for process in processes}
+    snapshots = cache.get_many(list(keys.values()))
+    stale_before = time.time() - STALE_FLUSHES * settings.METRICS_FLUSH_INTERVAL
+
+    totals, retiring, live = {}, [], set()
+    for process, key in keys.items():
+        snapshot = snapshots.get(key)
+        if snapshot is None:  # Expired or evicted.
+            continue
+        if snapshot['time'] < stale_before:
+            # Only the collector that deletes the copy adds it to the retired totals.
+            if cache.delete(key):
+                retiring.append(snapshot['histograms'])
+            continue
+        live.add(process)
+        _add(totals, snapshot['histograms'])
+
+    retired = cache.get(RETIRED_KEY) or {}
+    if retiring:
+        for histograms in retiring:
+            _add(retired, histograms)
+        cache.set(RETIRED_KEY, retired, timeout=None)
+    if live != processes:
+        cache.set(PROCESSES_KEY, live, timeout=None)
+    _add(totals, retired)
+
+    return totals
+
+
+def reset():
+    """Clear the histograms of this process."""
+    with _lock:
+        _histograms.clear()
+
+
+def _labels(route, method, le=None):
+    """Return the Prometheus labels of a histogram line."""
+    labels = f'route="{route}",method="{method}"'
+    return labels if le is None else f'{labels},le="{le}"'
+
+
+def prometheus_text(histograms):
+    """Return histograms in the Prometheus text exposition format."""
+    lines = []
+    for metric, (help_text, buckets) in HISTOGRAMS.items():
+        lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} histogram']
+        for (name, route, method), histogram in sorted(histograms.items()):
+            if name != metric:
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets, histogram):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{{_labels(route, method, bound)}}} {cumulative}')
+            count = cumulative + histogram[len(buckets)]
+            lines.append(f'{metric}_bucket{{{_labels(route, method, "+Inf")}}} {count}')
+            lines.append(f'{metric}_sum{{{_labels(route, method)}}} {histogram[-1]}')
+            lines.append(f'{metric}_count{{{_labels(route, method)}}} {count}')
+
+    return '\n'.join(lines) + '\n'
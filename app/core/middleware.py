@@ -0,0 +1,53 @@
+"""
+Middleware for the app.
+"""
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from core import metrics
+
+
+class RequestMetricsMiddleware:
+    """Time the requests: Server-Timing header and per-route histograms (see core/metrics.py)."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+
+        timings, token = metrics.start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        return self.finish(request, response, timings)
+
+    async def __acall__(self, request):
+        if not settings.METRICS_ENABLED:
+            return await self.get_response(request)
+
+        timings, token = metrics.start_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        return self.finish(request, response, timings)
+
+    def finish(self, request, response, timings):
+        """Add the Server-Timing header to a response, and the timings of its request to the histograms."""
+        total = time.perf_counter() - timings.start
+        response['Server-Timing'] = timings.server_timing(total)
+        match = request.resolver_match
+        metrics.record(match.view_name if match else 'unmatched', request.method, timings, total)
+        return response
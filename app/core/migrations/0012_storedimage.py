@@ -0,0 +1,43 @@
+# Generated by Django 5.1.15 on 2026-10-18 03:37
+
+import core.models
+import core.storage
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_references(apps, schema_editor):
+    """Create the stored images of the existing recipe images, with their number of recipes."""
+    Recipe = apps.get_model('core', 'Recipe')
+    StoredImage = apps.get_model('core', 'StoredImage')
+    images = Recipe.objects.exclude(image__isnull=True).exclude(image='')
+    variants = dict(images.exclude(image_variants={}).values_list('image', 'image_variants'))
+    StoredImage.objects.bulk_create([
+        StoredImage(name=name, references=references, variants=variants.get(name, {}))
+        for name, references in images.values_list('image').annotate(references=Count('id')).order_by()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('references', models.PositiveIntegerField(default=0)),
+                ('variants', models.JSONField(blank=True, default=dict)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(null=True, storage=core.storage.ContentAddressedStorage(), upload_to=core.models.recipe_image_file_path),
+        ),
+        migrations.RunPython(count_references, migrations.RunPython.noop),
+    ]
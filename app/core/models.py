@@ -1,24 +1,59 @@
 """
 Database models.
 """
-import uuid
+import hashlib
 import os
+import threading
+from functools import partial
 
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.contrib.auth.models import (
     AbstractBaseUser,
     BaseUserManager,
     PermissionsMixin
 )
 
+from core.storage import ContentAddressedStorage
+
+
+# Text search configuration (language) of the recipe search.
+SEARCH_CONFIG = 'english'
+
+
+# The recipe images (and their variants) are stored once per content, see StoredImage.
+recipe_image_storage = ContentAddressedStorage()
+
+
+def content_hash(content):
+    """Return the SHA-256 hex digest of a file."""
+    digest = getattr(content, 'content_hash', None)  # Computed while it was uploaded (see recipe/uploads.py).
+    if digest is None:
+        sha256 = hashlib.sha256()
+        for chunk in content.chunks():
+            sha256.update(chunk)
+        digest = sha256.hexdigest()
+        content.seek(0)
+
+    return digest
+
+
+def recipe_image_path(content, filename):
+    """Return the path of a recipe image, named by the hash of its content."""
+    image_format = getattr(content, 'image_format', None)  # Read while it was uploaded.
+    ext = f'.{image_format.lower()}' if image_format else os.path.splitext(filename)[1].lower()
+    digest = content_hash(content)
+
+    # Spread over 256 directories, so that none of them gets too large.
+    return os.path.join('uploads', 'recipe', digest[:2], f'{digest}{ext}')
+
 
 def recipe_image_file_path(instance, filename):
     """Generate file path for new recipe image."""
-    ext = os.path.splitext(filename)[1]
-    filename = f'{uuid.uuid4()}{ext}'
-
-    return os.path.join('uploads', 'recipe', filename)
+    return recipe_image_path(instance.image.file, filename)
 
 
 # The BaseUserManager class is a helper class that Django provides that we can use to create a user or superuser
@@ -89,12 +124,118 @@ class Recipe(models.Model):
     tags = models.ManyToManyField('Tag')
     ingredients = models.ManyToManyField('Ingredient')
     # The upload_to argument specifies the directory to which the file is uploaded
-    image = models.ImageField(null=True, upload_to=recipe_image_file_path)
+    image = models.ImageField(null=True, upload_to=recipe_image_file_path, storage=recipe_image_storage)
+    # Paths of the resized/WebP versions of the image, by size and format (from StoredImage.variants).
+    image_variants = models.JSONField(default=dict, blank=True)
+    # Set on every save, and when the tags/ingredients of the recipe change (see core/signals.py).
+    updated_at = models.DateTimeField(auto_now=True)
+    # Full-text search document, computed and stored by PostgreSQL whenever the row is written.
+    # Matches in the title (weight A) rank higher than matches in the description (weight B).
+    search_vector = models.GeneratedField(
+        expression=(
+            SearchVector('title', weight='A', config=SEARCH_CONFIG)
+            + SearchVector('description', weight='B', config=SEARCH_CONFIG)
+        ),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+
+    class Meta:
+        indexes = [
+            # Recipe lists are filtered by user and ordered by newest first.
+            models.Index(fields=['user', '-id'], name='recipe_user_id_desc_idx'),
+            GinIndex(fields=['search_vector'], name='recipe_search_vector_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
 
+# The names of the images acquired with a new row by the transaction of each thread, until it commits.
+_acquired = threading.local()
+
+
+class StoredImageManager(models.Manager):
+    """Manager for the stored images, which counts their references."""
+
+    # The row of an image is locked while its references change. Its files are only deleted once
+    # its last release commits, under the lock of a new row of the same name (see delete_files()).
+    def acquire(self, name):
+        """Add a reference to a stored image (before saving its file, in the same transaction).
+
+        Return whether the image is new, in which case its file must be saved (again, if a
+        previous one is being deleted).
+        """
+        with transaction.atomic():
+            stored, created = self.select_for_update().get_or_create(name=name)
+            self.filter(pk=stored.pk).update(references=models.F('references') + 1)
+
+        if created:
+            # The file saved next has no other reference: if the transaction (or the savepoint)
+            # rolls back, the on_commit() callback is dropped and delete_rolled_back() deletes it.
+            names = vars(_acquired).setdefault('names', set())
+            names.add(name)
+            transaction.on_commit(partial(names.discard, name))
+
+        return created
+
+    def delete_rolled_back(self):
+        """Delete the files of the new images acquired by the rolled back transactions of this thread.
+
+        Called once the transaction is over (see core/signals.py), as Django has no rollback hook.
+        """
+        if transaction.get_connection().in_atomic_block:
+            return
+
+        names = vars(_acquired).get('names', set())
+        while names:
+            # Unless the image was acquired again (and its file saved again) in the meantime.
+            self.delete_files(names.pop(), {})
+
+    def release(self, name):
+        """Remove a reference to a stored image, deleting its file and variants after the last one commits."""
+        with transaction.atomic():
+            stored = self.select_for_update().filter(name=name).first()
+            if stored is None:
+                return
+            if stored.references > 1:
+                self.filter(pk=stored.pk).update(references=models.F('references') - 1)
+                return
+
+            stored.delete()
+
+        # If the transaction rolls back, the references (and so the files) are kept.
+        transaction.on_commit(partial(self.delete_files, name, stored.variants))
+
+    def delete_files(self, name, variants):
+        """Delete the file of a released image and its variants, unless the image was acquired again."""
+        with transaction.atomic():
+            # Inserting the name waits for a concurrent acquire to commit or roll back (unique index),
+            # and the next acquires wait for this row, so the files are never deleted from under them.
+            stored, created = self.get_or_create(name=name)
+            if not created:
+                return
+
+            stored.delete()
+            recipe_image_storage.delete(name)
+            for formats in variants.values():
+                for path in formats.values():
+                    recipe_image_storage.delete(path)
+
+
+class StoredImage(models.Model):
+    """A recipe image file, with the number of recipes that use it."""
+    name = models.CharField(max_length=255, unique=True)
+    references = models.PositiveIntegerField(default=0)
+    # The resized/WebP versions of the image, shared by all the recipes that use it (see recipe/images.py).
+    variants = models.JSONField(default=dict, blank=True)
+
+    objects = StoredImageManager()
+
+    def __str__(self):
+        return self.name
+
+
 class Tag(models.Model):
     """Tag for filtering recipes."""
     name = models.CharField(max_length=255)
@@ -103,6 +244,17 @@ class Tag(models.Model):
         on_delete=models.CASCADE
     )
 
+    class Meta:
+        indexes = [
+            # Tag lists are filtered by user and ordered by name.
+            models.Index(fields=['user', 'name'], name='tag_user_name_idx'),
+            # Autocomplete (prefix and similarity lookups of the names of a user), with pg_trgm
+            # trigrams for the names, and btree_gin for the user.
+            GinIndex(
+                fields=['user', 'name'], opclasses=['int8_ops', 'gin_trgm_ops'], name='tag_user_name_trgm_idx'
+            ),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -115,5 +267,57 @@ class Ingredient(models.Model):
         on_delete=models.CASCADE
     )
 
+    class Meta:
+        indexes = [
+            # Ingredient lists are filtered by user and ordered by name.
+            models.Index(fields=['user', 'name'], name='ingredient_user_name_idx'),
+            # Autocomplete (prefix and similarity lookups of the names of a user), with pg_trgm
+            # trigrams for the names, and btree_gin for the user.
+            GinIndex(
+                fields=['user', 'name'], opclasses=['int8_ops', 'gin_trgm_ops'], name='ingredient_user_name_trgm_idx'
+            ),
+        ]
+
     def __str__(self):
         return self.name
+
+
+class ImportCheckpoint(models.Model):
+    """Progress of a recipe import (see the import_recipes command)."""
+    source = models.CharField(max_length=1024, unique=True)  # Absolute path of the imported file.
+    offset = models.BigIntegerField(default=0)  # Byte offset of the first line not imported yet.
+    recipes = models.BigIntegerField(default=0)  # Number of recipes imported so far.
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.source
+
+
+class Job(models.Model):
+    """A background job, run by the run_worker command (see core/jobs.py)."""
+    QUEUED = 'queued'
+    FAILED = 'failed'  # All the attempts failed, kept to be inspected.
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (FAILED, 'Failed')]
+
+    func = models.CharField(max_length=255)  # Dotted path of the function.
+    args = models.JSONField(default=list, blank=True)
+    priority = models.SmallIntegerField(default=0)  # Higher first.
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    # When the job can run: when it is enqueued, after a failed attempt (the retry backoff), or
+    # once the lease of a running attempt expires (the worker died, the job is run again).
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField()
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # The next job to run: queued, runnable, by priority. Failed jobs are left out.
+            models.Index(
+                fields=['-priority', 'run_at', 'id'], condition=models.Q(status='queued'), name='job_queued_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.func}{tuple(self.args)}'
@@ -0,0 +1,48 @@
+"""
+JSON renderer backed by orjson.
+"""
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from core.metrics import timed
+
+try:
+    import orjson
+except ImportError:  # Optional: without it, the renderer is DRF's JSONRenderer.
+    orjson = None
+
+
+# Datetimes go through DRF's encoder (like the types orjson doesn't know, such as Decimal or lazy
+# strings), so they are formatted like the default renderer does.
+ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME if orjson else 0
+
+
+class ORJSONRenderer(JSONRenderer):
+    """Renderer which serializes to JSON with orjson, with the same output as JSONRenderer.
+
+    It falls back to JSONRenderer when orjson isn't installed, for the outputs orjson can't
+    produce: indented (e.g. the browsable API), ASCII-only or non-compact JSON, and for the data
+    orjson rejects (e.g. dicts with non-string keys, which OPT_NON_STR_KEYS would slow down). Unlike
+    JSONRenderer, NaN and infinite floats are rendered as null instead of raising an error.
+    """
+    default = JSONEncoder().default
+
+    @timed('render')
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """Render data into JSON, returning a bytestring."""
+        if data is None:
+            return b''
+
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if orjson is None or indent is not None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=self.default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Like JSONRenderer, \u2028 and \u2029 are escaped, so the JSON is a strict javascript subset.
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
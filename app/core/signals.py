@@ -0,0 +1,107 @@
+"""
+Signal handlers for the models.
+"""
+from django.contrib.auth import get_user_model
+from django.core.signals import request_finished
+from django.db.backends.signals import connection_created
+from django.db.models.signals import pre_save, post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from core import metrics
+from core.authentication import invalidate_token
+from core.models import Recipe, StoredImage, Tag, Ingredient
+
+
+def touch_recipes(recipes):
+    """Set the updated_at of a queryset of recipes to the current time."""
+    recipes.update(updated_at=timezone.now())
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def touch_recipes_on_m2m_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """Update the recipes whose tags/ingredients changed."""
+    if not reverse:  # instance is the recipe.
+        if (action in ('post_add', 'post_remove') and pk_set) or action == 'post_clear':
+            touch_recipes(Recipe.objects.filter(pk=instance.pk))
+    elif action in ('post_add', 'post_remove') and pk_set:  # instance is a tag/ingredient.
+        touch_recipes(Recipe.objects.filter(pk__in=pk_set))
+    elif action == 'pre_clear':
+        # The recipes of the tag/ingredient are unknown once the relation is cleared.
+        touch_recipes(instance.recipe_set.all())
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def touch_recipes_on_rename(sender, instance, created, **kwargs):
+    """Update the recipes that show a tag/ingredient when it is saved."""
+    if not created:
+        touch_recipes(instance.recipe_set.all())
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def touch_recipes_on_delete(sender, instance, **kwargs):
+    """Update the recipes that show a tag/ingredient before it is deleted."""
+    # The through rows are deleted by the cascade, which doesn't send m2m_changed.
+    touch_recipes(instance.recipe_set.all())
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    """Remove a deleted token from the authentication cache."""
+    invalidate_token(instance.key)
+
+
+@receiver(post_save, sender=get_user_model())
+def invalidate_user_tokens(sender, instance, created, **kwargs):
+    """Remove the tokens of a user from the authentication cache when the user changes."""
+    # Any change, not only the password or is_active, so the cached users aren't stale.
+    if not created:
+        for key in Token.objects.filter(user=instance).values_list('key', flat=True):
+            invalidate_token(key)
+
+
+@receiver(pre_save, sender=Recipe)
+def acquire_new_image(sender, instance, **kwargs):
+    """Reference the new image of a recipe before its file is saved, and remember the replaced one."""
+    image = instance.image
+    if image and not image._committed:  # A new file, saved by the ImageField when the recipe is saved.
+        if instance.pk is not None:
+            instance._replaced_image = Recipe.objects.filter(pk=instance.pk).values_list('image', flat=True).first()
+        name = sender._meta.get_field('image').generate_filename(instance, image.name)
+        if not StoredImage.objects.acquire(name):
+            # The file is already stored, and its committed references keep it: it isn't saved again.
+            image.name = name
+            image._committed = True
+
+
+@receiver(post_save, sender=Recipe)
+def release_replaced_image(sender, instance, **kwargs):
+    """Remove the reference to the replaced image of a recipe."""
+    replaced = vars(instance).pop('_replaced_image', None)
+    if replaced:
+        StoredImage.objects.release(replaced)
+
+
+@receiver(post_delete, sender=Recipe)
+def release_deleted_image(sender, instance, **kwargs):
+    """Remove the reference to the image of a deleted recipe."""
+    if instance.image:
+        StoredImage.objects.release(instance.image.name)
+
+
+@receiver(request_finished)
+def delete_rolled_back_images(sender, **kwargs):
+    """Delete the files of the new images of the request if its transaction rolled back."""
+    StoredImage.objects.delete_rolled_back()
+
+
+@receiver(connection_created)
+def time_queries(sender, connection, **kwargs):
+    """Time the queries of the requests on each new database connection (see core/metrics.py)."""
+    # A connection object reconnects (CONN_MAX_AGE, errors) with the same wrappers.
+    if metrics.execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(metrics.execute_wrapper)
@@ -0,0 +1,36 @@
+"""
+Content-addressed file storage.
+
+The files are named by the hash of their content (see core.models.recipe_image_file_path),
+so a name that already exists holds the same bytes, and the URL of a file never changes
+content (it can be cached forever). The files of the recipe images that are already
+stored aren't saved again (see core.signals.acquire_new_image).
+"""
+import os
+import uuid
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible(path='core.storage.ContentAddressedStorage')
+class ContentAddressedStorage(FileSystemStorage):
+    """File system storage that stores each content once."""
+
+    def __init__(self, **kwargs):
+        # Two uploads of the same new file may race to save it: both write the same bytes,
+        # instead of the second one being renamed.
+        kwargs.setdefault('allow_overwrite', True)
+        super().__init__(**kwargs)
+
+    def _save(self, name, content):
+        # Always written, as an existing file may be about to be deleted (see StoredImageManager), but
+        # under a temporary name renamed over the existing one, so that it is never read half written.
+        temp_name = super()._save(f'{name}.{uuid.uuid4().hex}.tmp', content)
+        try:
+            os.replace(self.path(temp_name), self.path(name))
+        except OSError:
+            self.delete(temp_name)
+            raise
+
+        return name
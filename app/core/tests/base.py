@@ -0,0 +1,21 @@
+"""
+Base classes of the tests.
+"""
+from django.core.cache import cache
+from django.test import TestCase as DjangoTestCase
+
+from core import authentication
+
+
+class TestCase(DjangoTestCase):
+    """TestCase that starts every test with empty caches.
+
+    The tests run on the local-memory cache (see TESTING in app/settings.py), which, unlike the
+    database, isn't rolled back between the tests: without this the cache versions, cached
+    responses and tokens of a test would leak into the next ones.
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        authentication.clear()
@@ -1,11 +1,12 @@
 """
 Test for the Django admin modifications.
 """
-from django.test import TestCase
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.test import Client
 
+from core.tests.base import TestCase
+
 
 class AdminSiteTests(TestCase):
     """Tests for Django admin."""
@@ -13,6 +14,7 @@ class AdminSiteTests(TestCase):
     # * This setUp function is a function that is ran before every test that we run
     def setUp(self):
         """Create user and client, and save it in database."""
+        super().setUp()
         self.client = Client()  # Create a test client that we can use to make requests to our app
         self.admin_user = get_user_model().objects.create_superuser(
             email="admij@example.com",
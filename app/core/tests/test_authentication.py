@@ -0,0 +1,174 @@
+"""
+Tests for the cached token authentication.
+"""
+from unittest.mock import patch
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import RequestFactory, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIClient
+
+from core import authentication
+from core.tests.base import TestCase
+
+
+ME_URL = reverse('user:me')
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """Test the cached token authentication."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = get_user_model().objects.create_user('user@example.com', 'testpass123', name='Test')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_token_lookup_cached(self):
+        """Test the token is only looked up in the database on the first request."""
+        with self.assertNumQueries(1):
+            res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['email'], self.user.email)
+
+    def test_invalid_token(self):
+        """Test an unknown token is rejected, and not cached."""
+        self.client.credentials(HTTP_AUTHORIZATION='Token unknown')
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_token_deleted(self):
+        """Test a deleted token is rejected."""
+        self.client.get(ME_URL)
+
+        self.token.delete()
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_user_deactivated(self):
+        """Test the token of a deactivated user is rejected."""
+        self.client.get(ME_URL)
+
+        self.user.is_active = False
+        self.user.save()
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_user_changes_invalidate(self):
+        """Test the cached user is refreshed when the user changes (e.g. the password)."""
+        self.client.get(ME_URL)
+
+        res = self.client.patch(ME_URL, {'name': 'New name', 'password': 'newpass123'})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.data['name'], 'New name')
+
+    def test_invalidated_in_other_processes(self):
+        """Test a token deleted by another process is rejected, though it is in this process's cache."""
+        self.client.get(ME_URL)
+        local = authentication._local.copy()
+
+        self.token.delete()  # Clears the cache of this process, and bumps the token's generation.
+        authentication._local.update(local)  # The cache of another process.
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(AUTH_TOKEN_SHARED_CACHE=True)
+    def test_stale_shared_entry(self):
+        """Test an entry cached in the shared cache before an invalidation is ignored."""
+        auth = authentication.CachedTokenAuthentication()
+        auth.authenticate_credentials(self.token.key)
+        entry = cache.get(authentication.SHARED_KEY.format(self.token.key))
+
+        self.user.is_active = False
+        self.user.save()
+        cache.set(authentication.SHARED_KEY.format(self.token.key), entry)  # Written by a racing lookup.
+        authentication.clear()
+
+        with self.assertRaises(AuthenticationFailed):
+            auth.authenticate_credentials(self.token.key)
+
+    @override_settings(AUTH_TOKEN_SHARED_CACHE=True)
+    def test_cache_unavailable(self):
+        """Test the tokens are looked up in the database, without caching, when the shared cache fails."""
+        auth = authentication.CachedTokenAuthentication()
+        request = RequestFactory().get(ME_URL, HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        with (
+            patch.object(cache, 'get', side_effect=ConnectionError),
+            patch.object(cache, 'aget', side_effect=ConnectionError),
+            self.assertLogs('core.authentication', 'WARNING'),
+        ):
+            for _ in range(2):
+                with self.assertNumQueries(1):
+                    user, _ = auth.authenticate_credentials(self.token.key)
+                self.assertEqual(user, self.user)
+                with self.assertNumQueries(1):
+                    user, _ = async_to_sync(auth.aauthenticate)(request)
+                self.assertEqual(user, self.user)
+
+        self.assertFalse(authentication._local)
+
+    def test_request_user_is_a_copy(self):
+        """Test changes to request.user don't change the cached user."""
+        auth = authentication.CachedTokenAuthentication()
+        user, _ = auth.authenticate_credentials(self.token.key)
+        user.name = 'Changed'
+
+        user, _ = auth.authenticate_credentials(self.token.key)
+
+        self.assertEqual(user.name, 'Test')
+
+    @override_settings(AUTH_TOKEN_CACHE_SIZE=1)
+    def test_lru_eviction(self):
+        """Test the least recently used tokens are evicted."""
+        other = get_user_model().objects.create_user('other@example.com', 'testpass123')
+        other_token = Token.objects.create(user=other)
+        auth = authentication.CachedTokenAuthentication()
+        auth.authenticate_credentials(self.token.key)
+        auth.authenticate_credentials(other_token.key)
+
+        with self.assertNumQueries(1):
+            auth.authenticate_credentials(self.token.key)
+
+    def test_ttl_expiry(self):
+        """Test the cached tokens expire."""
+        auth = authentication.CachedTokenAuthentication()
+        with patch('core.authentication.time.monotonic', return_value=1000):
+            auth.authenticate_credentials(self.token.key)
+
+        with patch('core.authentication.time.monotonic', return_value=1000 + 3600):
+            with self.assertNumQueries(1):
+                auth.authenticate_credentials(self.token.key)
+
+    @override_settings(AUTH_TOKEN_SHARED_CACHE=True)
+    def test_shared_cache(self):
+        """Test the shared cache is used when the in-process cache is empty (e.g. in another worker)."""
+        auth = authentication.CachedTokenAuthentication()
+        auth.authenticate_credentials(self.token.key)
+        authentication.clear()
+
+        with self.assertNumQueries(0):
+            user, _ = auth.authenticate_credentials(self.token.key)
+        self.assertEqual(user, self.user)
+
+        self.token.delete()
+        authentication.clear()
+        self.assertIsNone(cache.get(authentication.SHARED_KEY.format(self.token.key)))
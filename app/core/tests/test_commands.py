@@ -3,14 +3,24 @@ Test custom Django management command.
 """
 
 # Path is used (here) to mock the behaviour of the database
+import json
+import os
+import tempfile
+from decimal import Decimal
+from io import StringIO
 from unittest.mock import patch
 
 from psycopg2 import OperationalError as Psycopg2Error
 
+from django.contrib.auth import get_user_model
 from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.db.utils import OperationalError
 from django.test import SimpleTestCase
 
+from core.models import ImportCheckpoint, Recipe, Tag, Ingredient
+from core.tests.base import TestCase
+
 
 # Mock the "check" method used in the Command class of
 # the wait_for_db command.
@@ -44,3 +54,112 @@ class CommandTest(SimpleTestCase):
 
         self.assertEqual(patched_check.call_count, 6)
         patched_check.assert_called_with(databases=['default'])
+
+
+class ImportRecipesCommandTests(TestCase):
+    """Test the import_recipes command."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = get_user_model().objects.create_user('user@example.com', 'testpass123')
+        self.file = tempfile.NamedTemporaryFile('w', suffix='.ndjson', delete=False)
+        self.addCleanup(os.remove, self.file.name)
+
+    def write_lines(self, lines):
+        """Write lines (recipes, or raw strings) to the import file."""
+        with open(self.file.name, 'w') as file:
+            for line in lines:
+                file.write((line if isinstance(line, str) else json.dumps(line)) + '\n')
+
+    def import_recipes(self, *args):
+        """Run the command on the import file, and return its output."""
+        out = StringIO()
+        call_command('import_recipes', self.file.name, '--user', self.user.email, *args, stdout=out)
+        return out.getvalue()
+
+    def test_import_recipes(self):
+        """Test importing recipes with their tags and ingredients."""
+        existing_tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.write_lines([
+            {
+                'title': 'Curry\twith "tabs"\\', 'time_minutes': 30, 'price': '7.50', 'description': 'Line 1\nLine 2',
+                'tags': [{'name': 'Vegan'}, {'name': 'Dinner'}, {'name': 'Vegan'}], 'ingredients': ['Tofu', 'Rice'],
+            },
+            {'title': 'Salad', 'time_minutes': 5, 'price': 3, 'tags': ['Vegan'], 'ingredients': ['Tofu']},
+        ])
+
+        out = self.import_recipes('--batch-size', '1')
+
+        self.assertIn('rows/sec', out)
+        curry, salad = Recipe.objects.filter(user=self.user).order_by('id')
+        self.assertEqual(curry.title, 'Curry\twith "tabs"\\')
+        self.assertEqual(curry.description, 'Line 1\nLine 2')
+        self.assertEqual(curry.price, Decimal('7.50'))
+        self.assertEqual(sorted(t.name for t in curry.tags.all()), ['Dinner', 'Vegan'])
+        self.assertEqual(list(salad.tags.all()), [existing_tag])
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(Ingredient.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(list(salad.ingredients.all()), list(curry.ingredients.filter(name='Tofu')))
+        # The ids come from the table sequences, so the ORM can keep creating rows.
+        Recipe.objects.create(user=self.user, title='New', time_minutes=1, price=Decimal('1.00'))
+        Tag.objects.create(user=self.user, name='Lunch')
+
+    def test_import_resumes_after_error(self):
+        """Test an import stopped by an invalid line resumes without duplicates."""
+        recipe = {'title': 'Soup', 'time_minutes': 20, 'price': '4.00'}
+        self.write_lines([recipe, recipe, '{"title": "No price"}', recipe])
+
+        with self.assertRaises(CommandError):
+            self.import_recipes('--batch-size', '2')
+
+        self.assertEqual(Recipe.objects.count(), 2)
+        self.write_lines([recipe, recipe, recipe, recipe])
+        out = self.import_recipes('--batch-size', '2')
+
+        self.assertIn('Resuming after 2 recipes', out)
+        self.assertEqual(Recipe.objects.count(), 4)
+        self.assertEqual(ImportCheckpoint.objects.get().recipes, 4)
+
+    def test_import_values_too_large(self):
+        """Test the values the columns can't hold fail with the offset of their line, before COPY."""
+        recipe = {'title': 'Soup', 'time_minutes': 20, 'price': '4.00'}
+        for invalid in [
+            {'title': 'x' * 256},
+            {'price': '1000'},
+            {'price': '999.999'},
+            {'time_minutes': 2**31},
+            {'link': 'https://example.com/' + 'x' * 256},
+            {'tags': ['x' * 256]},
+            {'ingredients': [{'name': 'x' * 256}]},
+        ]:
+            with self.subTest(invalid=invalid):
+                self.write_lines([recipe, {**recipe, **invalid}])
+
+                with self.assertRaisesRegex(CommandError, rf'^Invalid recipe at byte {len(json.dumps(recipe)) + 1}:'):
+                    self.import_recipes('--restart')
+
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_import_unknown_user(self):
+        """Test importing recipes of a user that doesn't exist fails."""
+        self.write_lines([{'title': 'Soup', 'time_minutes': 20, 'price': '4.00', 'user': 'other@example.com'}])
+
+        with self.assertRaises(CommandError):
+            self.import_recipes()
+
+        self.assertFalse(Recipe.objects.exists())
+
+
+class BenchmarkRecipeListCommandTests(TestCase):
+    """Test the benchmark_recipe_list command."""
+
+    def test_benchmark(self):
+        """Test the benchmark reports each size, and leaves no data behind."""
+        out = StringIO()
+
+        call_command('benchmark_recipe_list', '--sizes', '2', '5', '--repeat', '1', stdout=out)
+
+        lines = out.getvalue().splitlines()
+        self.assertEqual([line.split()[0] for line in lines[1:]], ['2', '5'])
+        self.assertFalse(Recipe.objects.exists())
+        self.assertFalse(get_user_model().objects.exists())
@@ -0,0 +1,114 @@
+"""
+Tests for the read replica database router.
+
+The replica is a second local database that nothing is replicated to (see DATABASES in
+app/settings.py), so a read shows where it went: the data written in a test is only on
+the primary.
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import router
+from django.test import override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core import db_router
+from core.models import Recipe, Tag
+from core.tests.base import TestCase
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+
+
+@override_settings(DATABASE_REPLICAS=['test_replica'], RECIPE_CACHE_ENABLED=False)
+class ReplicaRouterTests(TestCase):
+    """Test the reads of the recipe APIs go to the replica, and stick to the primary after a write."""
+
+    databases = {'default', 'test_replica'}
+
+    def setUp(self):
+        super().setUp()
+        self.user = get_user_model().objects.create_user('user@example.com', 'testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        Recipe.objects.create(user=self.user, title='On the primary', time_minutes=5, price=Decimal('5.00'))
+        Tag.objects.create(user=self.user, name='On the primary')
+
+    def test_reads_from_replica(self):
+        """Test the list and detail reads of the API go to the replica."""
+        for url in (RECIPES_URL, TAGS_URL):
+            res = self.client.get(url)
+
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertFalse(res.data['results'] if url == RECIPES_URL else res.data)  # Not replicated.
+
+        res = self.client.get(reverse('recipe:recipe-detail', args=[Recipe.objects.get().id]))
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_write_pins_user_to_primary(self):
+        """Test the reads of a user that just wrote go to the primary, and the other users' to the replica."""
+        payload = {'title': 'New recipe', 'time_minutes': 10, 'price': '2.50'}
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.post(RECIPES_URL, payload)
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(len(res.data['results']), 2)
+
+        other = get_user_model().objects.create_user('other@example.com', 'testpass123')
+        self.client.force_authenticate(other)
+        with self.assertNumQueries(0, using='default'):
+            self.client.get(RECIPES_URL)
+
+    def test_batch_pins_user_to_primary(self):
+        """Test a batch that only creates recipes (with bulk queries, no signals) pins the user too."""
+        data = {'title': 'New recipe', 'time_minutes': 10, 'price': '2.50'}
+        payload = {'operations': [{'action': 'create', 'data': data}]}
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.post(reverse('recipe:recipe-batch'), payload, format='json')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(len(res.data['results']), 2)
+
+    @override_settings(ROOT_URLCONF='app.asgi_urls')
+    async def test_async_views_read_from_replica(self):
+        """Test the async views of the ASGI deployment read from the replica too."""
+        token = await Token.objects.acreate(user=self.user)
+
+        res = await self.async_client.get(RECIPES_URL, headers={'Authorization': f'Token {token.key}'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.json()['results'], [])
+
+    def test_pin_expires(self):
+        """Test the reads go back to the replica when the pin expires."""
+        db_router.pin_to_primary(self.user.id)
+        self.assertEqual(len(self.client.get(RECIPES_URL).data['results']), 1)
+
+        cache.delete(db_router.PIN_KEY.format(user_id=self.user.id))  # Expired.
+        self.assertEqual(len(self.client.get(RECIPES_URL).data['results']), 0)
+
+    def test_writes_to_primary(self):
+        """Test the writes, and the reads outside the views, use the primary."""
+        token = db_router.use_replicas()
+        try:
+            self.assertEqual(router.db_for_read(Recipe), 'test_replica')
+            self.assertEqual(router.db_for_write(Recipe), 'default')
+        finally:
+            db_router.stop_replicas(token)
+
+        self.assertEqual(router.db_for_read(Recipe), 'default')
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas(self):
+        """Test all the reads use the primary without replicas."""
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(len(res.data['results']), 1)
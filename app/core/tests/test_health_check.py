@@ -1,15 +1,17 @@
 """
 Tests for the health check API.
 """
-from django.test import TestCase
 from django.urls import reverse
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
+from core.tests.base import TestCase
+
 
 class HealthCheckTests(TestCase):
     def setUp(self):
+        super().setUp()
         self.client = APIClient()
 
     def test_health_check(self):
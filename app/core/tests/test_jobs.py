@@ -0,0 +1,160 @@
+"""
+Tests for the background jobs.
+"""
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from core import jobs
+from core.models import Job
+from core.tests.base import TestCase
+
+
+CALLS = []
+
+
+def record(*args):
+    """Job that records its arguments."""
+    CALLS.append(args)
+
+
+def fail():
+    """Job that always fails."""
+    raise ValueError('Failed')
+
+
+@override_settings(JOBS_MAX_ATTEMPTS=3, JOBS_RETRY_BACKOFF=10, JOBS_RETRY_MAX_DELAY=15, JOBS_LEASE=60)
+class JobTests(TestCase):
+    """Test the job queue."""
+
+    def setUp(self):
+        super().setUp()
+        CALLS.clear()
+
+    def test_enqueue(self):
+        """Test enqueuing a job stores its function path and arguments."""
+        job = jobs.enqueue(record, 1, 'two', priority=5)
+
+        self.assertEqual(job.func, 'core.tests.test_jobs.record')
+        self.assertEqual(job.args, [1, 'two'])
+        self.assertEqual(job.priority, 5)
+        self.assertEqual(job.max_attempts, 3)
+        self.assertEqual(job.status, Job.QUEUED)
+
+    def test_enqueue_not_importable(self):
+        """Test functions the workers can't import are rejected."""
+        def local():
+            pass
+
+        for func in (local, lambda: None):
+            with self.assertRaises(ValueError):
+                jobs.enqueue(func)
+
+    def test_run_next(self):
+        """Test running a job calls its function and deletes it."""
+        jobs.enqueue(record, 1, 'two')
+
+        self.assertTrue(jobs.run_next())
+
+        self.assertEqual(CALLS, [(1, 'two')])
+        self.assertFalse(Job.objects.exists())
+        self.assertFalse(jobs.run_next())
+
+    def test_priority_order(self):
+        """Test the jobs run by priority, then in the order they were queued."""
+        jobs.enqueue(record, 'low', priority=-1)
+        jobs.enqueue(record, 'first')
+        jobs.enqueue(record, 'high', priority=10)
+        jobs.enqueue(record, 'second')
+
+        while jobs.run_next():
+            pass
+
+        self.assertEqual(CALLS, [('high',), ('first',), ('second',), ('low',)])
+
+    def test_delayed_job(self):
+        """Test a delayed job doesn't run before its time."""
+        jobs.enqueue(record, 'later', delay=60)
+
+        self.assertFalse(jobs.run_next())
+
+        with patch('core.jobs.timezone.now', return_value=timezone.now() + timedelta(seconds=61)):
+            self.assertTrue(jobs.run_next())
+
+    def test_claim_skips_locked_jobs(self):
+        """Test the jobs are claimed with FOR UPDATE SKIP LOCKED."""
+        jobs.enqueue(record)
+
+        with CaptureQueriesContext(connection) as queries:
+            jobs.claim()
+
+        self.assertTrue(any('FOR UPDATE SKIP LOCKED' in query['sql'] for query in queries))
+
+    def test_retry_with_backoff(self):
+        """Test a failing job is retried later, with a growing delay."""
+        job = jobs.enqueue(fail)
+        now = timezone.now()
+
+        with patch('core.jobs.timezone.now', return_value=now), self.assertLogs('core.jobs', 'WARNING'):
+            jobs.run_next()
+        job.refresh_from_db()
+        self.assertEqual(job.attempts, 1)
+        self.assertEqual(job.run_at, now + timedelta(seconds=10))
+        self.assertIn('ValueError: Failed', job.last_error)
+        self.assertFalse(jobs.run_next())  # Not before the retry delay.
+
+        with patch('core.jobs.timezone.now', return_value=now + timedelta(seconds=10)), \
+                self.assertLogs('core.jobs', 'WARNING'):
+            jobs.run_next()
+        job.refresh_from_db()
+        self.assertEqual(job.attempts, 2)
+        self.assertEqual(job.run_at, now + timedelta(seconds=10 + 15))  # Doubled, up to the maximum delay.
+
+    def test_failed_after_max_attempts(self):
+        """Test a job that fails all its attempts is kept as failed, and not run again."""
+        job = jobs.enqueue(fail, max_attempts=1)
+
+        with self.assertLogs('core.jobs', 'ERROR'):
+            jobs.run_next()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        with patch('core.jobs.timezone.now', return_value=timezone.now() + timedelta(days=1)):
+            self.assertFalse(jobs.run_next())
+
+    def test_lease_expiry(self):
+        """Test a claimed job that never finished (its worker died) runs again after its lease."""
+        jobs.enqueue(record, 'again')
+        jobs.claim()
+
+        self.assertFalse(jobs.run_next())
+        with patch('core.jobs.timezone.now', return_value=timezone.now() + timedelta(seconds=61)):
+            self.assertTrue(jobs.run_next())
+
+        self.assertEqual(CALLS, [('again',)])
+
+
+class RunWorkerCommandTests(TestCase):
+    """Test the run_worker command."""
+
+    def setUp(self):
+        super().setUp()
+        CALLS.clear()
+
+    def test_run_worker_burst(self):
+        """Test the worker runs the queued jobs, and exits in burst mode."""
+        for i in range(3):
+            jobs.enqueue(record, i)
+        jobs.enqueue(fail)
+
+        with self.assertLogs('core.jobs', 'WARNING'):
+            call_command('run_worker', burst=True, threads=1, stdout=StringIO())
+
+        self.assertEqual(CALLS, [(0,), (1,), (2,)])
+        self.assertEqual(Job.objects.get().func, 'core.tests.test_jobs.fail')  # Retried later.
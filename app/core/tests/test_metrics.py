@@ -0,0 +1,175 @@
+"""
+Tests for the per-request metrics.
+"""
+import re
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core import authentication, metrics
+from core.models import Recipe
+from core.tests.base import TestCase
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+METRICS_URL = reverse('metrics')
+
+
+def server_timing(response):
+    """Return {span: (duration in ms, description)} of the Server-Timing header of a response."""
+    spans = {}
+    for entry in response['Server-Timing'].split(', '):
+        name, *params = entry.split(';')
+        params = dict(param.split('=', 1) for param in params)
+        spans[name] = (float(params['dur']), params.get('desc', '').strip('"'))
+
+    return spans
+
+
+def metric_value(text, line):
+    """Return the value of a line of the Prometheus text (the metric and its labels)."""
+    match = re.search(rf'^{re.escape(line)} (\S+)$', text, re.MULTILINE)
+    return float(match.group(1)) if match else None
+
+
+@override_settings(RECIPE_CACHE_ENABLED=False)
+class RequestMetricsTests(TestCase):
+    """Test the Server-Timing header and the metrics endpoint."""
+
+    def setUp(self):
+        super().setUp()
+        metrics.reset()
+        self.user = get_user_model().objects.create_user('user@example.com', 'testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.staff_client = APIClient()
+        self.staff_client.force_authenticate(
+            get_user_model().objects.create_user('staff@example.com', 'testpass123', is_staff=True)
+        )
+        for i in range(3):
+            Recipe.objects.create(user=self.user, title=f'Recipe {i}', time_minutes=5, price=5)
+
+    def test_server_timing(self):
+        """Test the response has the queries, view, serializer and render spans of its request."""
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        spans = server_timing(res)
+        self.assertEqual(list(spans), ['db', 'view', 'serializer', 'render', 'total'])
+        self.assertEqual(spans['db'][1], f'{len(queries)} queries')
+        for name in ('db', 'view', 'serializer', 'render'):
+            self.assertGreater(spans[name][0], 0)
+            self.assertLessEqual(spans[name][0], spans['total'][0])
+        # The view includes the serializer, but neither the rendering nor the middleware.
+        self.assertGreaterEqual(spans['view'][0], spans['serializer'][0])
+        self.assertLessEqual(spans['view'][0] + spans['render'][0], spans['total'][0])
+
+    def test_metrics_endpoint(self):
+        """Test the timings are aggregated in per-route histograms, in the Prometheus format."""
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(RECIPES_URL)
+        query_count = len(queries)  # The next request resets the query log.
+        self.client.get(RECIPES_URL)
+
+        res = self.staff_client.get(METRICS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res['Content-Type'].startswith('text/plain; version=0.0.4'))
+        text = res.content.decode()
+        self.assertIn('# TYPE http_request_duration_seconds histogram', text)
+        labels = 'route="recipe:recipe-list",method="GET"'
+        self.assertEqual(metric_value(text, f'http_request_duration_seconds_count{{{labels}}}'), 2)
+        self.assertEqual(metric_value(text, f'http_request_view_seconds_bucket{{{labels},le="+Inf"}}'), 2)
+        self.assertEqual(metric_value(text, f'http_request_db_queries_sum{{{labels}}}'), 2 * query_count)
+        self.assertGreater(metric_value(text, f'http_request_serializer_seconds_sum{{{labels}}}'), 0)
+
+    def test_metrics_endpoint_staff_only(self):
+        """Test the metrics endpoint requires a staff user, authenticated by token."""
+        staff_token = Token.objects.create(user=get_user_model().objects.get(is_staff=True))
+        token_client = APIClient()
+        token_client.credentials(HTTP_AUTHORIZATION=f'Token {staff_token.key}')
+
+        self.assertEqual(APIClient().get(METRICS_URL).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.client.get(METRICS_URL).status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(token_client.get(METRICS_URL).status_code, status.HTTP_200_OK)
+
+    def test_histogram_buckets(self):
+        """Test the buckets are cumulative, with the values equal to a bound in its bucket."""
+        for value in (0, 1, 1, 7, 500):
+            metrics.observe('http_request_db_queries', 'route', 'GET', value)
+
+        text = metrics.prometheus_text(metrics.collect())
+
+        labels = 'route="route",method="GET"'
+        expected = {'0': 1, '1': 3, '2': 3, '5': 3, '10': 4, '100': 4, '+Inf': 5}
+        for bound, count in expected.items():
+            self.assertEqual(metric_value(text, f'http_request_db_queries_bucket{{{labels},le="{bound}"}}'), count)
+        self.assertEqual(metric_value(text, f'http_request_db_queries_sum{{{labels}}}'), 509)
+
+    def test_metrics_of_all_processes(self):
+        """Test the endpoint sums the histograms that the other processes copied to the cache."""
+        self.client.get(RECIPES_URL)
+        metrics.flush()
+        snapshot = cache.get(metrics.SNAPSHOT_KEY.format(process=metrics.process_id()))
+        cache.set(metrics.SNAPSHOT_KEY.format(process='other:1'), snapshot)
+        cache.set(metrics.PROCESSES_KEY, cache.get(metrics.PROCESSES_KEY) | {'other:1'})
+
+        text = self.staff_client.get(METRICS_URL).content.decode()
+
+        labels = 'route="recipe:recipe-list",method="GET"'
+        self.assertEqual(metric_value(text, f'http_request_duration_seconds_count{{{labels}}}'), 2)
+
+    def test_gone_processes_retired(self):
+        """Test the processes that stopped copying their histograms are dropped, and their counts kept."""
+        self.client.get(RECIPES_URL)
+        metrics.flush()
+        snapshot = cache.get(metrics.SNAPSHOT_KEY.format(process=metrics.process_id()))
+        cache.set(metrics.SNAPSHOT_KEY.format(process='exited:1'), {**snapshot, 'time': time.time() - 3600})
+        cache.set(metrics.PROCESSES_KEY, {metrics.process_id(), 'exited:1', 'expired:1'})
+
+        key = ('http_request_duration_seconds', 'recipe:recipe-list', 'GET')
+        counts = [sum(metrics.collect()[key][:-1]) for _ in range(2)]  # The buckets, without the sum.
+
+        self.assertEqual(counts, [2, 2])  # Not added again by the second collect.
+        self.assertEqual(cache.get(metrics.PROCESSES_KEY), {metrics.process_id()})
+        self.assertIsNone(cache.get(metrics.SNAPSHOT_KEY.format(process='exited:1')))
+
+    def test_unmatched_route(self):
+        """Test the requests to unknown URLs share one route label."""
+        self.client.get('/api/unknown/')
+
+        text = metrics.prometheus_text(metrics.collect())
+
+        self.assertEqual(metric_value(text, 'http_request_duration_seconds_count{route="unmatched",method="GET"}'), 1)
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_disabled(self):
+        """Test nothing is recorded when the metrics are disabled."""
+        res = self.client.get(RECIPES_URL)
+
+        self.assertNotIn('Server-Timing', res)
+        self.assertEqual(metrics.collect(), {})
+
+    @override_settings(ROOT_URLCONF='app.asgi_urls')
+    async def test_async_views(self):
+        """Test the requests to the async views are timed, with the queries that run in threads."""
+        authentication.clear()
+        token = await Token.objects.acreate(user=self.user)
+
+        res = await self.async_client.get(RECIPES_URL, headers={'Authorization': f'Token {token.key}'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        spans = server_timing(res)
+        self.assertGreater(int(spans['db'][1].split()[0]), 0)
+        for name in ('view', 'render'):
+            self.assertGreater(spans[name][0], 0)
@@ -1,13 +1,17 @@
 """
 Test cases for the models.
 """
-from unittest.mock import patch  # This is a mock function that comes with the unittest module
 from decimal import Decimal
+from unittest.mock import patch
+import hashlib
 
-from django.test import TestCase
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.test import TransactionTestCase
 from django.contrib.auth import get_user_model
 
 from core import models
+from core.tests.base import TestCase
 
 
 def create_user(email='user@example.com', password='testpass123'):
@@ -103,12 +107,195 @@ class ModelTests(TestCase):
 
         self.assertEqual(str(ingredient), ingredient.name)
 
-    @patch('core.models.uuid.uuid4')
-    def test_recipe_name_uuid(self, mock_uuid):
-        """Test generating image path."""
-        uuid = 'test-uuid'
-        mock_uuid.return_value = uuid
-        file_path = models.recipe_image_file_path(None, 'example.jpg')
+    def test_recipe_updated_at_on_m2m_changes(self):
+        """Test changing the tags/ingredients of a recipe updates it."""
+        user = create_user()
+        recipe = models.Recipe.objects.create(
+            user=user,
+            title='Sample recipe name',
+            time_minutes=5,
+            price=Decimal('5.50'),
+        )
+        tag = models.Tag.objects.create(user=user, name='Sample tag')
+        ingredient = models.Ingredient.objects.create(user=user, name='Sample ingredient')
+
+        def updated_at():
+            return models.Recipe.objects.get(pk=recipe.pk).updated_at
+
+        changes = [
+            lambda: recipe.tags.add(tag),
+            lambda: ingredient.recipe_set.add(recipe),  # From the other side of the relation.
+            lambda: tag.recipe_set.clear(),
+            lambda: setattr(ingredient, 'name', 'New name') or ingredient.save(),
+            lambda: ingredient.delete(),
+        ]
+        for change in changes:
+            before = updated_at()
+            change()
+            self.assertGreater(updated_at(), before)
+
+    def test_recipe_image_path_content_hash(self):
+        """Test the recipe image path is named by the hash of its content."""
+        recipe = models.Recipe(image=ContentFile(b'image content', name='example.JPG'))
+
+        file_path = models.recipe_image_file_path(recipe, 'example.JPG')
+
+        digest = hashlib.sha256(b'image content').hexdigest()
+        self.assertEqual(file_path, f'uploads/recipe/{digest[:2]}/{digest}.jpg')
+
+    def test_stored_image_references(self):
+        """Test an image is stored once, and deleted with the last recipe that uses it."""
+        user = create_user()
+        recipes = [
+            models.Recipe.objects.create(
+                user=user, title=f'Recipe {i}', time_minutes=5, price=Decimal('5.50'),
+                image=ContentFile(b'same image', name='image.jpg'),
+            )
+            for i in range(2)
+        ]
+        name = recipes[0].image.name
+        storage = models.recipe_image_storage
+
+        self.assertEqual(recipes[1].image.name, name)
+        self.assertEqual(models.StoredImage.objects.get(name=name).references, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            recipes[0].delete()
+        self.assertTrue(storage.exists(name))
+        self.assertEqual(models.StoredImage.objects.get(name=name).references, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            recipes[1].delete()
+            self.assertTrue(storage.exists(name))  # Deleted once the release commits.
+        self.assertFalse(storage.exists(name))
+        self.assertFalse(models.StoredImage.objects.filter(name=name).exists())
+
+    def test_stored_image_released_on_replace(self):
+        """Test replacing the image of a recipe deletes the old image (and its variants)."""
+        recipe = models.Recipe.objects.create(
+            user=create_user(), title='Recipe', time_minutes=5, price=Decimal('5.50'),
+            image=ContentFile(b'old image', name='image.jpg'),
+        )
+        storage = models.recipe_image_storage
+        old_name = recipe.image.name
+        variant = storage.save('uploads/recipe/variants/old-160.jpg', ContentFile(b'old variant'))
+        models.StoredImage.objects.filter(name=old_name).update(variants={'160': {'jpeg': variant}})
+
+        recipe.image = ContentFile(b'new image', name='image.jpg')
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.save()
+
+        self.assertFalse(storage.exists(old_name))
+        self.assertFalse(storage.exists(variant))
+        self.assertTrue(storage.exists(recipe.image.name))
+        recipe.delete()
+
+    def test_stored_image_release_rolled_back(self):
+        """Test the files of an image are kept when the transaction that released it rolls back."""
+        recipe = models.Recipe.objects.create(
+            user=create_user(), title='Recipe', time_minutes=5, price=Decimal('5.50'),
+            image=ContentFile(b'kept image', name='image.jpg'),
+        )
+        name = recipe.image.name
+
+        with self.assertRaises(RuntimeError), self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                models.Recipe.objects.get().delete()
+                raise RuntimeError
+
+        self.assertTrue(models.recipe_image_storage.exists(name))
+        self.assertEqual(models.StoredImage.objects.get(name=name).references, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.delete()
+
+    def test_stored_image_acquired_again_before_deletion(self):
+        """Test the files of a released image are kept when it is acquired again before they are deleted."""
+        user = create_user()
+        recipe = models.Recipe.objects.create(
+            user=user, title='Recipe', time_minutes=5, price=Decimal('5.50'),
+            image=ContentFile(b'same image', name='image.jpg'),
+        )
+        name = recipe.image.name
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            recipe.delete()
+        models.Recipe.objects.create(
+            user=user, title='Other recipe', time_minutes=5, price=Decimal('5.50'),
+            image=ContentFile(b'same image', name='image.jpg'),
+        )
+        for callback in callbacks:
+            callback()
+
+        self.assertTrue(models.recipe_image_storage.exists(name))
+        self.assertEqual(models.StoredImage.objects.get(name=name).references, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            models.Recipe.objects.get().delete()
+
+
+class StoredImageRollbackTests(TransactionTestCase):
+    """Test the files of the new images saved by the transactions that roll back."""
+
+    def setUp(self):
+        vars(models._acquired).pop('names', None)  # Left by the (never committed) transactions of TestCase.
+        self.user = create_user()
+
+    def create_recipe(self, content):
+        """Create a recipe with an image, and return it."""
+        return models.Recipe.objects.create(
+            user=self.user, title='Recipe', time_minutes=5, price=Decimal('5.50'),
+            image=ContentFile(content, name='image.jpg'),
+        )
+
+    def test_acquire_rolled_back(self):
+        """Test the file of a new image is deleted once the transaction that saved it rolls back."""
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            name = self.create_recipe(b'rolled back image').image.name
+            raise RuntimeError
+
+        self.assertTrue(models.recipe_image_storage.exists(name))
+        models.StoredImage.objects.delete_rolled_back()
+
+        self.assertFalse(models.recipe_image_storage.exists(name))
+        self.assertFalse(models.StoredImage.objects.exists())
+
+    def test_acquire_savepoint_rolled_back(self):
+        """Test the file of a new image is deleted when its savepoint rolls back, but not the committed ones."""
+        with transaction.atomic():
+            kept = self.create_recipe(b'kept image').image.name
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                name = self.create_recipe(b'rolled back image').image.name
+                raise RuntimeError
+            models.StoredImage.objects.delete_rolled_back()  # Not before the transaction is over.
+            self.assertTrue(models.recipe_image_storage.exists(name))
+
+        models.StoredImage.objects.delete_rolled_back()
+
+        self.assertFalse(models.recipe_image_storage.exists(name))
+        self.assertTrue(models.recipe_image_storage.exists(kept))
+        models.Recipe.objects.get().delete()
+
+    def test_acquired_again_after_rollback(self):
+        """Test a file saved again by another transaction is kept by the cleanup of a rolled back one."""
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.create_recipe(b'same image')
+            raise RuntimeError
+        recipe = self.create_recipe(b'same image')  # Saves the file again, then commits.
+
+        models.StoredImage.objects.delete_rolled_back()
+
+        self.assertTrue(models.recipe_image_storage.exists(recipe.image.name))
+        self.assertEqual(models.StoredImage.objects.get().references, 1)
+        recipe.delete()
+
+    def test_stored_file_not_saved_again(self):
+        """Test the file of an image that is already stored isn't written again."""
+        name = self.create_recipe(b'same image').image.name
+
+        with patch.object(models.recipe_image_storage, '_save') as patched_save:
+            self.create_recipe(b'same image')
 
-        expected_path = f'uploads/recipe/{uuid}.jpg'
-        self.assertEqual(file_path, expected_path)
+        patched_save.assert_not_called()
+        self.assertEqual(models.StoredImage.objects.get(name=name).references, 2)
+        for recipe in models.Recipe.objects.all():
+            recipe.delete()
+        self.assertFalse(models.recipe_image_storage.exists(name))
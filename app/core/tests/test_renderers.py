@@ -0,0 +1,85 @@
+"""
+Tests for the orjson renderer and parser.
+"""
+import uuid
+from datetime import date, datetime, time, timezone
+from decimal import Decimal
+from io import BytesIO
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from core.parsers import ORJSONParser
+from core.renderers import ORJSONRenderer
+
+
+PAYLOAD = {
+    'price': Decimal('5.50'),
+    'created': datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=timezone.utc),
+    'day': date(2024, 5, 1),
+    'time': time(8, 15),
+    'uuid': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+    'lazy': gettext_lazy('Not found.'),
+    'text': 'Ünïcode "quoted" \u2028 line \u2029 separators',
+    'nested': [{'id': 1, 'tags': []}, None, True, 1.5],
+    1: 'int key',
+}
+
+
+class ORJSONRendererTests(SimpleTestCase):
+    """Test the orjson renderer."""
+
+    def test_same_output_as_json_renderer(self):
+        """Test the renderer outputs the same bytes as DRF's JSONRenderer."""
+        self.assertEqual(ORJSONRenderer().render(PAYLOAD), JSONRenderer().render(PAYLOAD))
+
+    def test_render_none(self):
+        """Test None renders an empty body."""
+        self.assertEqual(ORJSONRenderer().render(None), b'')
+
+    def test_indent_falls_back(self):
+        """Test indented JSON is rendered by JSONRenderer."""
+        media_type = 'application/json; indent=4'
+
+        ret = ORJSONRenderer().render(PAYLOAD, media_type)
+
+        self.assertEqual(ret, JSONRenderer().render(PAYLOAD, media_type))
+        self.assertIn(b'\n    "price"', ret)
+
+    def test_without_orjson(self):
+        """Test the renderer works without orjson installed."""
+        with patch('core.renderers.orjson', None):
+            self.assertEqual(ORJSONRenderer().render(PAYLOAD), JSONRenderer().render(PAYLOAD))
+
+
+class ORJSONParserTests(SimpleTestCase):
+    """Test the orjson parser."""
+
+    def parse(self, body, parser=None, **context):
+        """Parse a body with the parser."""
+        return (parser or ORJSONParser()).parse(BytesIO(body), 'application/json', context)
+
+    def test_parse(self):
+        """Test parsing JSON gives the same data as DRF's JSONParser."""
+        body = '{"title": "Ünïcode", "price": "5.50", "tags": [{"name": "Vegan"}], "n": 1.5}'.encode()
+
+        self.assertEqual(self.parse(body), self.parse(body, JSONParser()))
+
+    def test_parse_invalid(self):
+        """Test invalid JSON, NaN included, raises a parse error."""
+        for body in [b'{"title": ', b'{"price": NaN}']:
+            with self.subTest(body=body), self.assertRaises(ParseError):
+                self.parse(body)
+
+    def test_parse_other_encoding(self):
+        """Test bodies that aren't UTF-8 are decoded with their encoding."""
+        self.assertEqual(self.parse('{"title": "Ñ"}'.encode('latin-1'), encoding='latin-1'), {'title': 'Ñ'})
+
+    def test_without_orjson(self):
+        """Test the parser works without orjson installed."""
+        with patch('core.parsers.orjson', None):
+            self.assertEqual(self.parse(b'{"a": [1]}'), {'a': [1]})
@@ -1,9 +1,15 @@
 """
 Views for the app.
 """
-from rest_framework.decorators import api_view
+from django.http import HttpResponse, JsonResponse
+from drf_spectacular.utils import extend_schema
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 
+from core import metrics
+from core.authentication import CachedTokenAuthentication
+
 
 @api_view(['GET'])
 def health_check(request):
@@ -11,3 +17,22 @@ def health_check(request):
     Health check endpoint.
     """
     return Response({'status': 'ok'})
+
+
+async def async_health_check(request):
+    """
+    Health check endpoint of the ASGI deployment, answered in the event loop.
+    """
+    return JsonResponse({'status': 'ok'})
+
+
+@extend_schema(exclude=True)  # Not part of the API.
+@api_view(['GET'])
+# Staff only: the metrics are internal, and collecting them reads the copies of every process.
+@authentication_classes([CachedTokenAuthentication])
+@permission_classes([IsAdminUser])
+def request_metrics(request):
+    """
+    Per-route request metrics of all the processes, in the Prometheus text format (see core/metrics.py).
+    """
+    return HttpResponse(metrics.prometheus_text(metrics.collect()), content_type='text/plain; version=0.0.4')
@@ -0,0 +1,13 @@
+"""
+URL mappings for the recipe app in the ASGI deployment.
+
+The same URLs as recipe/urls.py, with the hot read endpoints served by async views (see recipe/async_views.py).
+"""
+from recipe.async_views import async_urlpatterns
+from recipe.urls import router, urlpatterns as sync_urlpatterns
+
+
+app_name = 'recipe'
+
+# The async views come first, so they take their URLs from the router's views.
+urlpatterns = async_urlpatterns(router.urls) + sync_urlpatterns
@@ -0,0 +1,100 @@
+"""
+Native async views of the hot read endpoints, for the ASGI deployment (see app/asgi_urls.py).
+
+A GET is answered by the async actions of the viewsets (alist(), aretrieve()): the same
+querysets, serializers, ETags and cache as their sync actions, with the authentication,
+the cache and the queries awaited, so a request waiting on them doesn't hold a worker.
+The other methods, and the formats other than JSON (the browsable API), are passed to
+the DRF views, which Django runs in a thread.
+
+DRF has no async views, so these do the steps of APIView.dispatch() that the read
+actions need: content negotiation, authentication, permissions, exception handling and
+rendering. Django's async ORM still runs each query in a thread (the database driver is
+sync), the one the request's sync code runs in.
+"""
+from asgiref.sync import sync_to_async
+from django.urls import re_path
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions
+from rest_framework.request import Request
+
+from core.db_router import areads_from_replicas, stop_replicas, use_replicas
+from core.metrics import timer
+
+
+# The router URLs (by name) served by async views.
+ASYNC_URL_NAMES = {'recipe-list', 'recipe-detail', 'tag-list', 'ingredient-list'}
+
+
+async def authenticate(viewset, request):
+    """Return (user, auth) of the first of the viewset's authenticators that authenticates the request."""
+    for authenticator in viewset.get_authenticators():
+        user_auth = await authenticator.aauthenticate(request)
+        if user_auth is not None:
+            return user_auth
+
+    raise exceptions.NotAuthenticated()
+
+
+def async_view(drf_view):
+    """Return a view that answers GET with the async action of a DRF viewset view, and the rest with the view."""
+    viewset_class, actions, initkwargs = drf_view.cls, drf_view.actions, drf_view.initkwargs
+    sync_view = sync_to_async(drf_view)
+
+    @csrf_exempt
+    async def view(request, *args, **kwargs):
+        if request.method != 'GET':
+            return await sync_view(request, *args, **kwargs)
+
+        # The view span, like TimedViewMixin.dispatch() (the other requests are timed by the DRF view).
+        with timer('view'):
+            # Set up the viewset like ViewSetMixin.as_view() and APIView.initial() do.
+            self = viewset_class(**initkwargs)
+            self.action_map = actions
+            for method, action in actions.items():
+                setattr(self, method, getattr(self, action))
+            self.action = actions['get']
+            self.args, self.kwargs, self.format_kwarg = args, kwargs, None
+            self.headers = self.default_response_headers
+            # No authenticators: request.user is set below, it must never be authenticated synchronously.
+            self.request = drf_request = Request(request, negotiator=self.get_content_negotiator())
+
+            try:
+                renderer, media_type = self.perform_content_negotiation(drf_request)
+            except exceptions.NotAcceptable:
+                renderer = None
+            if renderer is None or renderer.format != 'json':
+                return await sync_view(request, *args, **kwargs)
+            drf_request.accepted_renderer, drf_request.accepted_media_type = renderer, media_type
+            drf_request.version, drf_request.versioning_scheme = self.determine_version(drf_request, *args, **kwargs)
+
+            replicas = None
+            try:
+                drf_request.user, drf_request.auth = await authenticate(self, drf_request)
+                self.check_permissions(drf_request)
+                # Like ReplicaReadsMixin.initial() (see core/db_router.py).
+                if await areads_from_replicas(drf_request):
+                    replicas = use_replicas()
+                response = await getattr(self, f'a{self.action}')(drf_request, *args, **kwargs)
+            except Exception as exc:
+                response = self.handle_exception(exc)
+            finally:
+                if replicas is not None:
+                    stop_replicas(replicas)
+
+            response = self.finalize_response(drf_request, response, *args, **kwargs)
+
+        # Rendered here, in the event loop (orjson), rather than in a thread by Django.
+        return response.render()
+
+    view.cls, view.actions, view.initkwargs = viewset_class, actions, initkwargs
+    return view
+
+
+def async_urlpatterns(router_urls):
+    """Return async views for the router URLs in ASYNC_URL_NAMES (without the format suffix URLs)."""
+    return [
+        re_path(pattern.pattern.regex.pattern, async_view(pattern.callback), name=pattern.name)
+        for pattern in router_urls
+        if pattern.name in ASYNC_URL_NAMES and 'format' not in pattern.pattern.regex.groupindex
+    ]
@@ -0,0 +1,167 @@
+"""
+Batch create, update and delete of recipes.
+"""
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import status
+
+from core.models import Recipe, Tag, Ingredient
+from recipe.serializers import RecipeDetailSerializer, get_or_create_by_name
+from recipe.signals import data_changed
+
+
+# Recipe M2M fields: (field, related model, through table column)
+RELATIONS = [
+    ('tags', Tag, 'tag_id'),
+    ('ingredients', Ingredient, 'ingredient_id'),
+]
+
+
+def _validate(operations, context):
+    """Validate the operations of a batch.
+
+    Return the per-operation results, and a list of (result, instance, validated_data)
+    for the valid operations.
+    """
+    user = context['request'].user
+    # One query for all the recipes to update or delete.
+    ids = [op['id'] for op in operations if op['action'] != 'create']
+    recipes = Recipe.objects.filter(user=user).in_bulk(ids)
+
+    results = []
+    valid = []
+    seen_ids = set()
+    for op in operations:
+        result = {'action': op['action']}
+        results.append(result)
+
+        instance = None
+        if op['action'] != 'create':
+            result['id'] = op['id']
+            instance = recipes.get(op['id'])
+            if instance is None:
+                result.update(status=status.HTTP_404_NOT_FOUND, errors={'detail': 'Not found.'})
+                continue
+            if op['id'] in seen_ids:
+                result.update(
+                    status=status.HTTP_400_BAD_REQUEST,
+                    errors={'id': 'The recipe is in more than one operation.'},
+                )
+                continue
+            seen_ids.add(op['id'])
+
+        validated_data = None
+        if op['action'] != 'delete':
+            serializer = RecipeDetailSerializer(
+                instance,
+                data=op['data'],
+                partial=instance is not None,  # Updates only change the given fields.
+                context=context,
+            )
+            if not serializer.is_valid():
+                result.update(status=status.HTTP_400_BAD_REQUEST, errors=serializer.errors)
+                continue
+            validated_data = dict(serializer.validated_data)
+
+        valid.append((result, instance, validated_data))
+
+    return results, valid
+
+
+def _set_relations(through, column, wanted):
+    """Set the related ids of recipes ({recipe_id: {related_id, ...}}) in a through table."""
+    if not wanted:
+        return
+
+    # One SELECT for the current rows, one DELETE for the stale ones and one INSERT for the new ones.
+    existing = set()
+    stale = []
+    for row_id, recipe_id, related_id in through.objects.filter(
+        recipe_id__in=wanted
+    ).values_list('id', 'recipe_id', column):
+        if related_id in wanted[recipe_id]:
+            existing.add((recipe_id, related_id))
+        else:
+            stale.append(row_id)
+
+    if stale:
+        through.objects.filter(id__in=stale).delete()
+    through.objects.bulk_create([
+        through(recipe_id=recipe_id, **{column: related_id})
+        for recipe_id, related_ids in wanted.items()
+        for related_id in related_ids
+        if (recipe_id, related_id) not in existing
+    ])
+
+
+def _apply(user, operations):
+    """Apply valid operations with set-based queries."""
+    creates = [(result, data) for result, _, data in operations if result['action'] == 'create']
+    updates = [(result, instance, data) for result, instance, data in operations if result['action'] == 'update']
+    deletes = [(result, instance) for result, instance, _ in operations if result['action'] == 'delete']
+
+    # Split the tags/ingredients from the recipe fields, and get or create all of them at once.
+    related = {field: [] for field, _, _ in RELATIONS}  # The names of each create/update, or None.
+    for data in [data for _, data in creates] + [data for _, _, data in updates]:
+        for field, _, _ in RELATIONS:
+            items = data.pop(field, None)
+            names = None if items is None else [item['name'] for item in items]
+            related[field].append(names)
+    objs = {
+        field: get_or_create_by_name(model, user, [name for names in related[field] if names for name in names])
+        for field, model, _ in RELATIONS
+    }
+
+    # One INSERT for the new recipes (PostgreSQL returns their ids).
+    created = Recipe.objects.bulk_create([Recipe(user=user, **data) for _, data in creates])
+    for (result, _), recipe in zip(creates, created):
+        result.update(id=recipe.id, status=status.HTTP_201_CREATED)
+
+    # One UPDATE for the changed recipes.
+    if updates:
+        now = timezone.now()
+        fields = {'updated_at'}
+        for result, instance, data in updates:
+            for attr, value in data.items():
+                setattr(instance, attr, value)
+            fields.update(data)
+            instance.updated_at = now  # bulk_update() doesn't apply auto_now.
+            result['status'] = status.HTTP_200_OK
+        Recipe.objects.bulk_update([instance for _, instance, _ in updates], sorted(fields))
+
+    recipe_ids = [recipe.id for recipe in created] + [instance.id for _, instance, _ in updates]
+    for field, _, column in RELATIONS:
+        wanted = {
+            recipe_id: {objs[field][name].id for name in names}
+            for recipe_id, names in zip(recipe_ids, related[field])
+            if names is not None  # Otherwise the operation doesn't change this relation.
+        }
+        _set_relations(getattr(Recipe, field).through, column, wanted)
+
+    # One DELETE for the deleted recipes (plus their through rows).
+    if deletes:
+        Recipe.objects.filter(id__in=[instance.id for _, instance in deletes]).delete()
+        for result, _ in deletes:
+            result['status'] = status.HTTP_204_NO_CONTENT
+
+
+def run_batch(operations, context):
+    """Validate and apply a list of recipe operations in a single transaction.
+
+    Return the per-operation results, and whether the batch was applied. If any
+    operation is invalid, none is applied.
+    """
+    results, valid = _validate(operations, context)
+    if len(valid) < len(operations):
+        for result, _, _ in valid:
+            # The operation is valid, but it wasn't applied because another one failed.
+            result['status'] = status.HTTP_424_FAILED_DEPENDENCY
+        return results, False
+
+    user = context['request'].user
+    with transaction.atomic():
+        _apply(user, valid)
+        # The bulk queries don't send the model signals: invalidate the cache and pin the reads here.
+        data_changed(user.id)
+
+    return results, True
@@ -0,0 +1,174 @@
+"""
+Per-user versioned cache for the recipe API responses.
+
+Every cached response key contains a version number stored per user. Any write to
+the user's recipes, tags or ingredients bumps that version (see recipe/signals.py),
+so the old responses are never read again and expire on their own. Invalidation is
+a single cache increment, and no key scan is needed.
+
+The a*() functions are the same for the async views (see recipe/async_views.py).
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.response import Response
+
+
+VERSION_KEY = 'recipe-api:version:{user_id}'
+RESPONSE_KEY = 'recipe-api:response:{user_id}:{version}:{digest}'
+STATS_KEY = 'recipe-api:stats:{name}'
+
+
+def _new_version():
+    """Return a version number that has never been used."""
+    # Versions start from the current time, so if a version key is evicted from
+    # the cache, its replacement never matches responses that are still cached.
+    return time.time_ns()
+
+
+def get_user_version(user_id):
+    """Return the current cache version of a user."""
+    key = VERSION_KEY.format(user_id=user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _new_version(), timeout=None)
+        version = cache.get(key)
+
+    return version
+
+
+async def aget_user_version(user_id):
+    """Async version of get_user_version()."""
+    key = VERSION_KEY.format(user_id=user_id)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, _new_version(), timeout=None)
+        version = await cache.aget(key)
+
+    return version
+
+
+def request_version(request):
+    """Return the cache version of the request's user, read once per request."""
+    # The ETag (see recipe/conditional.py) and the cache key of a response use the same version,
+    # so a cached response is only ever sent with the ETag of the version it was cached under.
+    if not hasattr(request, '_cache_version'):
+        request._cache_version = get_user_version(request.user.id)
+    return request._cache_version
+
+
+async def arequest_version(request):
+    """Async version of request_version()."""
+    if not hasattr(request, '_cache_version'):
+        request._cache_version = await aget_user_version(request.user.id)
+    return request._cache_version
+
+
+def bump_user_version(user_id):
+    """Invalidate all the cached responses of a user."""
+    key = VERSION_KEY.format(user_id=user_id)
+    try:
+        cache.incr(key)
+    except ValueError:  # The key doesn't exist (yet, or anymore).
+        cache.set(key, _new_version(), timeout=None)
+
+
+def invalidate_user(user_id):
+    """Invalidate the cached responses of a user now and when the transaction commits."""
+    bump_user_version(user_id)
+    # A concurrent request could read the old data and cache it with the new version
+    # before this transaction commits, so the version is bumped again after the commit.
+    transaction.on_commit(lambda: bump_user_version(user_id))
+
+
+def _count(name):
+    """Increment a cache statistics counter."""
+    key = STATS_KEY.format(name=name)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, timeout=None)
+
+
+async def _acount(name):
+    """Async version of _count()."""
+    key = STATS_KEY.format(name=name)
+    try:
+        await cache.aincr(key)
+    except ValueError:
+        await cache.aadd(key, 1, timeout=None)
+
+
+def get_stats():
+    """Return the hit and miss counters of the response cache."""
+    names = ('hits', 'misses')
+    values = cache.get_many([STATS_KEY.format(name=name) for name in names])
+    return {name: values.get(STATS_KEY.format(name=name), 0) for name in names}
+
+
+def _response_digest(request):
+    """Return the part of the cache key of a request that identifies its response."""
+    # The key contains the absolute URL (the paginated responses include absolute links),
+    # the query params in a normalized order and the negotiated format.
+    params = sorted(
+        (key, value)
+        for key in request.query_params
+        for value in request.query_params.getlist(key)
+    )
+    raw = f'{request.build_absolute_uri(request.path)}|{params}|{request.accepted_media_type}'
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def response_key(request):
+    """Return the cache key of the response to a request."""
+    version = request_version(request)
+    return RESPONSE_KEY.format(user_id=request.user.id, version=version, digest=_response_digest(request))
+
+
+async def aresponse_key(request):
+    """Async version of response_key()."""
+    version = await arequest_version(request)
+    return RESPONSE_KEY.format(user_id=request.user.id, version=version, digest=_response_digest(request))
+
+
+class CachedResponseMixin:
+    """Cache the successful responses of the read actions of a viewset."""
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        """Return the cached response to the request, or call handler and cache its response."""
+        if not settings.RECIPE_CACHE_ENABLED:
+            return handler(request, *args, **kwargs)
+
+        key = response_key(request)
+        data = cache.get(key)
+        if data is not None:
+            _count('hits')
+            return Response(data, headers={'X-Cache': 'HIT'})
+
+        _count('misses')
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, timeout=settings.RECIPE_CACHE_TIMEOUT)
+        response['X-Cache'] = 'MISS'
+        return response
+
+    async def acached_response(self, handler, request, *args, **kwargs):
+        """Async version of cached_response(), handler is a coroutine function."""
+        if not settings.RECIPE_CACHE_ENABLED:
+            return await handler(request, *args, **kwargs)
+
+        key = await aresponse_key(request)
+        data = await cache.aget(key)
+        if data is not None:
+            await _acount('hits')
+            return Response(data, headers={'X-Cache': 'HIT'})
+
+        await _acount('misses')
+        response = await handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            await cache.aset(key, response.data, timeout=settings.RECIPE_CACHE_TIMEOUT)
+        response['X-Cache'] = 'MISS'
+        return response
@@ -0,0 +1,69 @@
+"""
+Conditional GET (ETag / If-None-Match) support for the recipe APIs.
+"""
+import hashlib
+
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from recipe.cache import arequest_version, request_version
+
+
+def make_etag(request, *parts):
+    """Return a strong ETag for the response to a request, given the state of the data it shows."""
+    # The absolute URL (with the query params) and the negotiated format are part of the tag,
+    # since the responses contain absolute links and differ between pages and formats.
+    raw = '|'.join(str(part) for part in (request.build_absolute_uri(), request.accepted_media_type, *parts))
+    return f'"{hashlib.sha256(raw.encode()).hexdigest()}"'
+
+
+def recipe_etag(request):
+    """Return the ETag of a response showing the recipe data of the request's user, without a query."""
+    # Every write to the user's recipes, tags or ingredients bumps the user's cache version (see
+    # recipe/cache.py), which the cached responses are stored under too: a cached response always
+    # goes out with the ETag of the data it was built from.
+    return make_etag(request, request.user.id, request_version(request))
+
+
+async def arecipe_etag(request):
+    """Async version of recipe_etag()."""
+    return make_etag(request, request.user.id, await arequest_version(request))
+
+
+def etag_matches(request, etag):
+    """Return whether the request's If-None-Match header lists an ETag."""
+    etags = parse_etags(request.headers.get('If-None-Match', ''))
+    # If-None-Match uses the weak comparison, which ignores the "W/" prefix.
+    return etag in (tag.removeprefix('W/') for tag in etags)
+
+
+def _finish(request, etag, response):
+    """Tag a successful response, or answer 304 when the request's If-None-Match is "*"."""
+    if response.status_code != status.HTTP_200_OK:
+        return response
+
+    # "*" matches any current representation: the ETag doesn't tell whether the resource exists.
+    if '*' in parse_etags(request.headers.get('If-None-Match', '')):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+    response['ETag'] = etag
+    return response
+
+
+class ConditionalGetMixin:
+    """Answer the read actions of a viewset with 304 Not Modified when the client's copy is current."""
+
+    def conditional_response(self, etag, handler, request, *args, **kwargs):
+        """Return 304 if the request matches etag, otherwise call handler and tag its response."""
+        if etag_matches(request, etag):
+            # The handler (and so the serializer) doesn't run at all.
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        return _finish(request, etag, handler(request, *args, **kwargs))
+
+    async def aconditional_response(self, etag, handler, request, *args, **kwargs):
+        """Async version of conditional_response(), handler is a coroutine function."""
+        if etag_matches(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        return _finish(request, etag, await handler(request, *args, **kwargs))
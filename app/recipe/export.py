@@ -0,0 +1,61 @@
+"""
+Streaming export of recipes.
+"""
+import csv
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+
+from recipe.serializers import RecipeDetailSerializer
+
+
+CSV_FIELDS = ['id', 'title', 'description', 'time_minutes', 'price', 'link', 'image', 'tags', 'ingredients']
+
+
+class Echo:
+    """File-like object that returns what is written to it, for streaming csv.writer rows."""
+
+    def write(self, value):
+        return value
+
+
+def iter_recipes(queryset, context):
+    """Yield the serialized recipes of a queryset, one chunk of rows in memory at a time."""
+    # iterator() reads the rows through a server-side cursor, and runs the prefetches of the
+    # queryset (tags and ingredients) once per chunk, so memory doesn't grow with the queryset.
+    for recipe in queryset.iterator(chunk_size=settings.RECIPE_EXPORT_CHUNK_SIZE):
+        yield RecipeDetailSerializer(recipe, context=context).data
+
+
+def iter_ndjson(recipes):
+    """Yield the recipes as newline-delimited JSON."""
+    encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    for recipe in recipes:
+        yield encoder.encode(recipe) + '\n'
+
+
+def iter_csv(recipes):
+    """Yield the recipes as CSV rows, with the tag/ingredient names separated by "|"."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_FIELDS)
+    for recipe in recipes:
+        row = dict(recipe)
+        for field in ('tags', 'ingredients'):
+            row[field] = '|'.join(item['name'] for item in row[field])
+        yield writer.writerow([row[field] for field in CSV_FIELDS])
+
+
+# Export formats: (row generator, content type, file extension)
+EXPORT_FORMATS = {
+    'ndjson': (iter_ndjson, 'application/x-ndjson', 'ndjson'),
+    'csv': (iter_csv, 'text/csv', 'csv'),
+}
+
+
+def export_response(queryset, context, output):
+    """Return a streaming response with the recipes of a queryset in an export format."""
+    iter_rows, content_type, extension = EXPORT_FORMATS[output]
+    response = StreamingHttpResponse(iter_rows(iter_recipes(queryset, context)), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="recipes.{extension}"'
+    return response
@@ -0,0 +1,36 @@
+"""
+Facet counts of the recipes: the number of recipes of each tag and ingredient.
+"""
+from django.db.models import Count, F, Value
+
+from core.models import Recipe
+
+
+# Facets: (response field, through model, related model name in the through model)
+FACETS = [
+    ('tags', Recipe.tags.through, 'tag'),
+    ('ingredients', Recipe.ingredients.through, 'ingredient'),
+]
+
+
+def facet_counts(recipes):
+    """Return the tags and ingredients of a queryset of recipes, with their number of recipes.
+
+    The most used come first: {'tags': [{'id': ..., 'name': ..., 'count': ...}, ...], 'ingredients': [...]}.
+    """
+    recipe_ids = recipes.order_by().values('id')
+    # One GROUP BY over each through table, sent as a single UNION ALL query.
+    queries = [
+        through.objects.filter(recipe_id__in=recipe_ids)
+        .values(facet=Value(field), obj_id=F(f'{related}_id'), name=F(f'{related}__name'))
+        .annotate(count=Count('recipe_id'))
+        for field, through, related in FACETS
+    ]
+
+    facets = {field: [] for field, _, _ in FACETS}
+    for row in queries[0].union(*queries[1:], all=True):
+        facets[row['facet']].append({'id': row['obj_id'], 'name': row['name'], 'count': row['count']})
+    for items in facets.values():
+        items.sort(key=lambda item: (-item['count'], item['name'], item['id']))
+
+    return facets
@@ -0,0 +1,108 @@
+"""
+Resized and WebP variants of the recipe images.
+
+After an image is uploaded, the variants are generated by a background job (see
+core/jobs.py), outside of the request. Each size is saved in the
+original format (JPEG, or PNG for images with transparency) and as WebP, next to
+the original image, and their paths are stored in Recipe.image_variants:
+
+    {"160": {"jpeg": "uploads/recipe/ab/variants/<hash>-160.jpg", "webp": ".../<hash>-160.webp"}, ...}
+
+The variants belong to the stored image (StoredImage.variants), so they are generated
+once per content, shared by the recipes that use it, and deleted with it.
+"""
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from core.jobs import enqueue
+from core.models import Recipe, StoredImage, recipe_image_storage
+from recipe.signals import data_changed
+
+
+# Variant formats: (Pillow format, file extension, save options)
+WEBP = ('WEBP', 'webp', {'quality': 80, 'method': 4})
+JPEG = ('JPEG', 'jpg', {'quality': 85, 'optimize': True, 'progressive': True})
+PNG = ('PNG', 'png', {'optimize': True})
+
+
+def _variant_path(image_name, size, extension):
+    """Return the storage path of a variant of an image."""
+    directory, filename = os.path.split(image_name)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(directory, 'variants', f'{stem}-{size}.{extension}')
+
+
+def _encode(image, image_format, options):
+    """Return the bytes of an image in a format."""
+    buffer = BytesIO()
+    image.save(buffer, format=image_format, **options)
+    return buffer.getvalue()
+
+
+def render_variants(image_file):
+    """Yield (size, format name, extension, bytes) for each variant of an image file."""
+    with Image.open(image_file) as original:
+        original = ImageOps.exif_transpose(original)  # Phone photos are often rotated with EXIF.
+        has_alpha = original.mode in ('RGBA', 'LA', 'PA') or 'transparency' in original.info
+        image = original.convert('RGBA' if has_alpha else 'RGB')
+
+    fallback = PNG if has_alpha else JPEG
+    for size in sorted(settings.RECIPE_IMAGE_SIZES, reverse=True):
+        # Each size is resized from the previous (larger) one, which is faster and looks the same.
+        image.thumbnail((size, size), Image.LANCZOS)  # Keeps the aspect ratio, and never upscales.
+        for image_format, extension, options in (fallback, WEBP):
+            yield size, image_format.lower(), extension, _encode(image, image_format, options)
+
+
+def delete_variants(variants):
+    """Delete the files of the variants of an image."""
+    for formats in (variants or {}).values():
+        for path in formats.values():
+            recipe_image_storage.delete(path)
+
+
+def generate_variants(recipe_id, image_name):
+    """Generate the variants of the image of a recipe, if it is still its image."""
+    recipe = Recipe.objects.filter(id=recipe_id, image=image_name).only('id', 'user_id').first()
+    if recipe is None:  # The recipe was deleted, or its image replaced, in the meantime.
+        return
+
+    # Already generated when another recipe uses the same image.
+    variants = StoredImage.objects.filter(name=image_name).values_list('variants', flat=True).first()
+    if not variants:
+        variants = {}
+        with recipe_image_storage.open(image_name, 'rb') as image_file:
+            for size, format_name, extension, content in render_variants(image_file):
+                path = recipe_image_storage.save(_variant_path(image_name, size, extension), ContentFile(content))
+                variants.setdefault(str(size), {})[format_name] = path
+
+        if not StoredImage.objects.filter(name=image_name).update(variants=variants):
+            # The last reference to the image was released (and its files deleted) in the meantime.
+            delete_variants(variants)
+            return
+
+    with transaction.atomic():
+        # Only if the image didn't change while the variants were generated.
+        updated = Recipe.objects.filter(id=recipe_id, image=image_name).update(
+            image_variants=variants,
+            updated_at=timezone.now(),  # update() doesn't apply auto_now.
+        )
+        if updated:
+            data_changed(recipe.user_id)  # update() doesn't send the signals either.
+
+
+def replace_image(serializer):
+    """Save a new image of a recipe, and queue the generation of its variants."""
+    # The references to the new and old images are counted by core/signals.py.
+    with transaction.atomic():
+        recipe = serializer.save(image_variants={})  # The variants of the old image aren't served anymore.
+        # In the same transaction: the job only runs once the new image is committed.
+        enqueue(generate_variants, recipe.id, recipe.image.name)
+
+    return recipe
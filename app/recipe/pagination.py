@@ -0,0 +1,23 @@
+"""
+Pagination classes for the recipe APIs.
+"""
+from django.conf import settings
+
+from rest_framework.pagination import CursorPagination
+
+
+class RecipeCursorPagination(CursorPagination):
+    """Keyset pagination for recipes, newest first."""
+    # The cursor encodes the last seen id, so every page is an index range scan
+    # ("WHERE id < <cursor> ORDER BY id DESC LIMIT n") instead of an OFFSET scan.
+    ordering = '-id'
+    page_size = settings.RECIPE_PAGE_SIZE
+    page_size_query_param = 'page_size'  # Lets the client choose the page size...
+    max_page_size = settings.RECIPE_MAX_PAGE_SIZE  # ...up to this server-side cap.
+
+    def get_ordering(self, request, queryset, view):
+        """Order the search results (annotated with their rank) by relevance, then newest first."""
+        if 'rank' in queryset.query.annotations:
+            return ('-rank', '-id')
+
+        return super().get_ordering(request, queryset, view)
@@ -1,13 +1,39 @@
 """
 Serializers for recipe APIs.
 """
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from drf_spectacular.utils import extend_schema_field
 from rest_framework import serializers
+from rest_framework.settings import api_settings
+
+from core.metrics import TimedSerializerMixin, timed
+from core.models import Recipe, Tag, Ingredient, recipe_image_storage
+from recipe.uploads import UploadedImageField
+
 
-from core.models import Recipe, Tag, Ingredient
+def get_or_create_by_name(model, user, names):
+    """Return a {name: object} dict of the user's tags/ingredients, creating the missing ones in bulk."""
+    if not names:
+        return {}
+
+    # One SELECT for the names that already exist...
+    objs = {}
+    for obj in model.objects.filter(user=user, name__in=names):
+        objs.setdefault(obj.name, obj)
+    # ...and one INSERT for the missing ones (PostgreSQL returns their ids), deduplicated in request
+    # order so that their ids follow it too.
+    missing = [model(user=user, name=name) for name in dict.fromkeys(names) if name not in objs]
+    for obj in model.objects.bulk_create(missing):
+        objs[obj.name] = obj
+
+    return objs
 
 
 # * TAG SERIALIZERS
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for tags."""
 
     class Meta:
@@ -16,8 +42,16 @@ class TagSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
+class TagCountSerializer(TagSerializer):
+    """Serializer for tags with their number of recipes (annotated by the view)."""
+    recipe_count = serializers.IntegerField(read_only=True)
+
+    class Meta(TagSerializer.Meta):
+        fields = TagSerializer.Meta.fields + ['recipe_count']
+
+
 # * INGREDIENT SERIALIZERS
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for ingredients."""
 
     class Meta:
@@ -26,8 +60,16 @@ class IngredientSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
+class IngredientCountSerializer(IngredientSerializer):
+    """Serializer for ingredients with their number of recipes (annotated by the view)."""
+    recipe_count = serializers.IntegerField(read_only=True)
+
+    class Meta(IngredientSerializer.Meta):
+        fields = IngredientSerializer.Meta.fields + ['recipe_count']
+
+
 # * RECIPE SERIALIZERS
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for recipes."""
 
     tags = TagSerializer(many=True, required=False)
@@ -38,20 +80,25 @@ class RecipeSerializer(serializers.ModelSerializer):
         fields = ['id', 'title', 'time_minutes', 'price', 'link', 'tags', 'ingredients']
         read_only_fields = ['id']
 
+    def _get_or_create_attrs(self, model, items):
+        """Return the tags/ingredients named in items, creating the missing ones in bulk."""
+        auth_user = self.context['request'].user
+        names = list(dict.fromkeys(item['name'] for item in items))  # Unique names, in payload order.
+        objs = get_or_create_by_name(model, auth_user, names)
+
+        return [objs[name] for name in names]
+
     def _get_or_create_tags(self, tags, recipe):
         """Handle getting or creating tags as neeeded."""
-        auth_user = self.context['request'].user  # We get the authenticated user to create the tags.
-        for tag in tags:
-            tag_obj, created = Tag.objects.get_or_create(user=auth_user, **tag)  # Create the tag object.
-            recipe.tags.add(tag_obj)  # Add the tag to the recipe object.
+        # add() inserts all the through rows with a single query.
+        recipe.tags.add(*self._get_or_create_attrs(Tag, tags))
 
     def _get_or_create_ingredients(self, ingredients, recipe):
         """Handle getting or creating ingredients as needed."""
-        auth_user = self.context['request'].user
-        for ingredient in ingredients:
-            ingredient_obj, created = Ingredient.objects.get_or_create(user=auth_user, **ingredient)
-            recipe.ingredients.add(ingredient_obj)
+        recipe.ingredients.add(*self._get_or_create_attrs(Ingredient, ingredients))
 
+    # The recipe and its tags/ingredients are saved in a single transaction.
+    @transaction.atomic
     def create(self, validated_data):
         """Create a new recipe."""
         tags = validated_data.pop('tags', [])  # Remove tags from validated data.
@@ -63,6 +110,7 @@ class RecipeSerializer(serializers.ModelSerializer):
         return recipe
 
     # instance: the model instance that is being updated. validated_data: the data that is being updated.
+    @transaction.atomic
     def update(self, instance, validated_data):
         """Update a recipe."""
         tags = validated_data.pop('tags', None)
@@ -70,13 +118,12 @@ class RecipeSerializer(serializers.ModelSerializer):
 
         # An empty list is not None.
         if tags is not None:
-            # Clear all tags from the instance. This will be useful when an empty list is provided.
-            instance.tags.clear()
-            self._get_or_create_tags(tags, instance)  # Create the tags, and add them to the instance.
+            # set() compares the new tags with the current ones, and only deletes the through rows of the
+            # removed tags and inserts the rows of the added ones. An empty list removes all the tags.
+            instance.tags.set(self._get_or_create_attrs(Tag, tags))
 
         if ingredients is not None:
-            instance.ingredients.clear()
-            self._get_or_create_ingredients(ingredients, instance)
+            instance.ingredients.set(self._get_or_create_attrs(Ingredient, ingredients))
 
         # Everything outside of the tags is assigned to the instance.
         for attr, value in validated_data.items():
@@ -91,15 +138,140 @@ class RecipeSerializer(serializers.ModelSerializer):
 class RecipeDetailSerializer(RecipeSerializer):
     """Serializer for recipe detaail view."""
 
+    image_variants = serializers.SerializerMethodField()
+
     class Meta(RecipeSerializer.Meta):
-        fields = RecipeSerializer.Meta.fields + ['description', 'image']
+        fields = RecipeSerializer.Meta.fields + ['description', 'image', 'image_variants']
+        # Images are only changed through the upload endpoint (see RecipeImageSerializer).
+        read_only_fields = RecipeSerializer.Meta.read_only_fields + ['image']
 
+    @extend_schema_field({
+        'type': 'object',
+        'additionalProperties': {'type': 'object', 'additionalProperties': {'type': 'string', 'format': 'uri'}},
+        'example': {'160': {'jpeg': 'http://example.com/static/media/uploads/recipe/variants/x-160.jpg',
+                            'webp': 'http://example.com/static/media/uploads/recipe/variants/x-160.webp'}},
+    })
+    def get_image_variants(self, recipe):
+        """Return the URLs of the resized versions of the image, by size and format."""
+        # Empty until the variants of the current image are generated.
+        request = self.context.get('request')
+        return {
+            size: {
+                image_format: request.build_absolute_uri(recipe_image_storage.url(path)) if request
+                else recipe_image_storage.url(path)
+                for image_format, path in formats.items()
+            }
+            for size, formats in recipe.image_variants.items()
+        }
 
-class RecipeImageSerializer(serializers.ModelSerializer):
+
+class RecipeImageSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for uploading images to recipes."""
 
+    # The image was already checked while it was uploaded (see recipe/uploads.py).
+    image = UploadedImageField()
+
     class Meta:
         model = Recipe  # The model that we are going to use.
         fields = ['id', 'image']
         read_only_fields = ['id']
-        extra_kwargs = {'image': {'required': True}}
+
+
+# * FAST LIST SERIALIZATION
+# The recipe list renders the same output as RecipeSerializer(many=True), but built from .values()
+# rows and one grouped query per relation, instead of model instances and the per-field
+# serializer machinery. Only for reading: writes still go through RecipeSerializer.
+RECIPE_LIST_FIELDS = ['id', 'title', 'time_minutes', 'price', 'link']
+PRICE_EXPONENT = Decimal(1).scaleb(-Recipe._meta.get_field('price').decimal_places)  # Decimal('0.01')
+
+
+def _format_price(price):
+    """Format a price like serializers.DecimalField does."""
+    price = price.quantize(PRICE_EXPONENT)
+    return format(price, 'f') if api_settings.COERCE_DECIMAL_TO_STRING else price
+
+
+def _related_by_recipe(field, column, recipe_ids):
+    """Return {recipe id: [{'id': ..., 'name': ...}, ...]} for a recipe M2M field, ordered by id."""
+    through = getattr(Recipe, field).through
+    related = {}
+    for recipe_id, obj_id, name in through.objects.filter(recipe_id__in=recipe_ids).order_by(
+        f'{column}_id'
+    ).values_list('recipe_id', f'{column}_id', f'{column}__name'):
+        related.setdefault(recipe_id, []).append({'id': obj_id, 'name': name})
+
+    return related
+
+
+@timed('serializer')
+def serialize_recipe_list(rows):
+    """Return the RecipeSerializer representation of recipe rows (dicts with RECIPE_LIST_FIELDS)."""
+    recipe_ids = [row['id'] for row in rows]
+    tags = _related_by_recipe('tags', 'tag', recipe_ids)
+    ingredients = _related_by_recipe('ingredients', 'ingredient', recipe_ids)
+
+    return [
+        {
+            'id': row['id'],
+            'title': row['title'],
+            'time_minutes': row['time_minutes'],
+            'price': _format_price(row['price']),
+            'link': row['link'],
+            'tags': tags.get(row['id'], []),
+            'ingredients': ingredients.get(row['id'], []),
+        }
+        for row in rows
+    ]
+
+
+# * FACET SERIALIZERS
+class FacetSerializer(serializers.Serializer):
+    """Serializer for the recipe count of a tag or ingredient."""
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    count = serializers.IntegerField(help_text="Number of recipes with this tag/ingredient.")
+
+
+class RecipeFacetsSerializer(serializers.Serializer):
+    """Serializer for the facet counts of the recipes (documentation only, see recipe/facets.py)."""
+    tags = FacetSerializer(many=True)
+    ingredients = FacetSerializer(many=True)
+
+
+# * BATCH SERIALIZERS
+class RecipeBatchOperationSerializer(serializers.Serializer):
+    """Serializer for one operation of a recipe batch."""
+    action = serializers.ChoiceField(choices=['create', 'update', 'delete'])
+    id = serializers.IntegerField(required=False, help_text="Recipe to update or delete.")
+    data = serializers.DictField(required=False, help_text="Recipe fields to create or update.")
+
+    def validate(self, attrs):
+        """Check the fields required by the action are present."""
+        if attrs['action'] != 'create' and 'id' not in attrs:
+            raise serializers.ValidationError({'id': 'This field is required to update or delete.'})
+        if attrs['action'] != 'delete' and 'data' not in attrs:
+            raise serializers.ValidationError({'data': 'This field is required to create or update.'})
+
+        return attrs
+
+
+class RecipeBatchSerializer(serializers.Serializer):
+    """Serializer for a batch of recipe operations."""
+    operations = RecipeBatchOperationSerializer(many=True, allow_empty=False)
+
+    def validate_operations(self, value):
+        """Check the batch is not larger than the maximum size."""
+        if len(value) > settings.RECIPE_BATCH_MAX_SIZE:
+            raise serializers.ValidationError(
+                f'A batch can have at most {settings.RECIPE_BATCH_MAX_SIZE} operations.'
+            )
+
+        return value
+
+
+class RecipeBatchResultSerializer(serializers.Serializer):
+    """Serializer for the result of one operation of a recipe batch."""
+    action = serializers.CharField()
+    id = serializers.IntegerField(required=False)
+    status = serializers.IntegerField(help_text="HTTP status of the operation.")
+    errors = serializers.DictField(required=False)
@@ -0,0 +1,35 @@
+"""
+Signal handlers for the recipe APIs.
+"""
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from core import db_router
+from core.models import Recipe, Tag, Ingredient
+from recipe import cache
+
+
+def data_changed(user_id):
+    """Invalidate the cached responses of a user, and pin its reads to the primary once the change commits."""
+    cache.invalidate_user(user_id)
+    # Read-your-writes: the replicas may not have the change yet (see core/db_router.py).
+    transaction.on_commit(lambda: db_router.pin_to_primary(user_id))
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+@receiver([post_save, post_delete], sender=Tag)
+@receiver([post_save, post_delete], sender=Ingredient)
+def invalidate_cached_responses(sender, instance, **kwargs):
+    """Invalidate the cached responses of the owner of a saved or deleted object."""
+    data_changed(instance.user_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def invalidate_cached_responses_on_m2m(sender, instance, action, **kwargs):
+    """Invalidate the cached responses of a user when the tags/ingredients of a recipe change."""
+    # instance is the recipe, or the tag/ingredient when the relation is changed from that side.
+    # Both belong to the same user.
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        data_changed(instance.user_id)
@@ -0,0 +1,151 @@
+"""
+Tests for the async views of the ASGI deployment.
+"""
+from decimal import Decimal
+from inspect import iscoroutinefunction
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.test import override_settings
+from django.urls import resolve, reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag
+from core.tests.base import TestCase
+from recipe import async_views
+from recipe.serializers import RecipeDetailSerializer, RecipeSerializer, TagSerializer
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe."""
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 10,
+        'price': Decimal('5.00'),
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+@override_settings(ROOT_URLCONF='app.asgi_urls')
+class AsyncViewsTests(TestCase):
+    """Test the async views answer like the DRF views."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = get_user_model().objects.create_user('user@example.com', 'testpass123')
+        self.token = Token.objects.create(user=self.user)
+        self.auth = {'Authorization': f'Token {self.token.key}'}
+        self.recipe = create_recipe(self.user)
+        self.recipe.tags.add(Tag.objects.create(user=self.user, name='Vegan'))
+        other = get_user_model().objects.create_user('other@example.com', 'testpass123')
+        self.other_recipe = create_recipe(other)
+
+    def test_async_urls(self):
+        """Test the hot read endpoints are served by async views, and the others by the DRF views."""
+        for name in async_views.ASYNC_URL_NAMES:
+            args = [self.recipe.id] if name.endswith('-detail') else []
+            self.assertTrue(iscoroutinefunction(resolve(reverse(f'recipe:{name}', args=args)).func))
+
+        self.assertTrue(iscoroutinefunction(resolve(reverse('health-check')).func))
+        upload_url = reverse('recipe:recipe-upload-image', args=[self.recipe.id])
+        self.assertFalse(iscoroutinefunction(resolve(upload_url).func))
+
+    async def test_health_check(self):
+        """Test the async health check."""
+        res = await self.async_client.get(reverse('health-check'))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.json(), {'status': 'ok'})
+
+    async def test_list_recipes(self):
+        """Test the recipe list, with its ETag, cached response and 304."""
+        res = await self.async_client.get(reverse('recipe:recipe-list'), headers=self.auth)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['X-Cache'], 'MISS')
+        recipe = await Recipe.objects.prefetch_related('tags', 'ingredients').aget(id=self.recipe.id)
+        self.assertEqual(res.json()['results'], RecipeSerializer([recipe], many=True).data)
+
+        res = await self.async_client.get(reverse('recipe:recipe-list'), headers=self.auth)
+        self.assertEqual(res['X-Cache'], 'HIT')
+        res = await self.async_client.get(
+            reverse('recipe:recipe-list'), headers={**self.auth, 'If-None-Match': res['ETag']}
+        )
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    async def test_list_invalid_filter(self):
+        """Test the errors of the viewset are answered like by DRF."""
+        res = await self.async_client.get(reverse('recipe:recipe-list'), {'tags': 'a'}, headers=self.auth)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.json(), ['Invalid format. IDs must be integers.'])
+
+    async def test_auth_required(self):
+        """Test the async views require a valid token."""
+        for headers in ({}, {'Authorization': 'Token invalid'}):
+            res = await self.async_client.get(reverse('recipe:tag-list'), headers=headers)
+
+            self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+            self.assertEqual(res['WWW-Authenticate'], 'Token')
+
+    async def test_token_lookup_cached(self):
+        """Test the token is looked up in the database once."""
+        url = reverse('recipe:tag-list')
+        await self.async_client.get(url, headers=self.auth)
+
+        # Only the cache can authenticate the next request (an update doesn't send the signals that invalidate it).
+        await Token.objects.filter(key=self.token.key).aupdate(key='0' * 40)
+        res = await self.async_client.get(url, headers=self.auth)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    async def test_retrieve_recipe(self):
+        """Test the recipe detail, and a 404 for the recipe of another user."""
+        res = await self.async_client.get(reverse('recipe:recipe-detail', args=[self.recipe.id]), headers=self.auth)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        recipe = await Recipe.objects.prefetch_related('tags', 'ingredients').aget(id=self.recipe.id)
+        self.assertEqual(res.json(), RecipeDetailSerializer(recipe).data)
+        self.assertIn('ETag', res)
+
+        for pk in (self.other_recipe.id, 'abc'):
+            res = await self.async_client.get(reverse('recipe:recipe-detail', args=[pk]), headers=self.auth)
+            self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    async def test_list_tags(self):
+        """Test the tag list."""
+        res = await self.async_client.get(reverse('recipe:tag-list'), {'assigned_only': 1}, headers=self.auth)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        tags = [tag async for tag in Tag.objects.filter(user=self.user)]
+        self.assertEqual(res.json(), TagSerializer(tags, many=True).data)
+
+    async def test_other_methods_passed_to_drf(self):
+        """Test the writes and the browsable API are answered by the DRF views."""
+        payload = {'title': 'New recipe', 'time_minutes': 5, 'price': '2.50'}
+        res = await self.async_client.post(
+            reverse('recipe:recipe-list'), payload, content_type='application/json', headers=self.auth
+        )
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(await Recipe.objects.filter(title='New recipe').aexists())
+
+        res = await self.async_client.get(reverse('recipe:recipe-list'), headers={**self.auth, 'Accept': 'text/html'})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res['Content-Type'].startswith('text/html'))
+
+    def test_same_cache_and_etag_as_sync_views(self):
+        """Test the async and the sync views share the cached responses and the ETags."""
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        with override_settings(ROOT_URLCONF='app.urls'):
+            sync_res = client.get(reverse('recipe:recipe-list'))
+
+        res = async_to_sync(self.async_client.get)(reverse('recipe:recipe-list'), headers=self.auth)
+
+        self.assertEqual(res['X-Cache'], 'HIT')
+        self.assertEqual(res['ETag'], sync_res['ETag'])
+        self.assertEqual(res.json(), sync_res.json())
@@ -0,0 +1,193 @@
+"""
+Tests for the recipe batch API.
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from drf_spectacular.generators import SchemaGenerator
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag, Ingredient
+from core.tests.base import TestCase
+
+
+BATCH_URL = reverse('recipe:recipe-batch')
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe."""
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 10,
+        'price': Decimal('5.00'),
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+def recipe_data(**params):
+    """Return the data of a sample recipe."""
+    data = {'title': 'New recipe', 'time_minutes': 15, 'price': '7.50'}
+    data.update(params)
+    return data
+
+
+class PublicBatchApiTests(TestCase):
+    """Test unauthenticated API requests."""
+
+    def test_auth_required(self):
+        """Test that authentication is required."""
+        res = APIClient().post(BATCH_URL, {'operations': []}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateBatchApiTests(TestCase):
+    """Test authenticated API requests."""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user('user@example.com', 'testpass123')
+        self.client.force_authenticate(self.user)
+
+    def test_batch_create_update_delete(self):
+        """Test creating, updating and deleting recipes in one batch."""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        to_update = create_recipe(user=self.user, title='Old title')
+        to_update.tags.add(tag)
+        to_delete = create_recipe(user=self.user)
+        payload = {'operations': [
+            {'action': 'create', 'data': recipe_data(
+                tags=[{'name': 'Vegan'}, {'name': 'Quick'}],
+                ingredients=[{'name': 'Tofu'}],
+            )},
+            {'action': 'update', 'id': to_update.id, 'data': {'title': 'New title', 'tags': [{'name': 'Quick'}]}},
+            {'action': 'delete', 'id': to_delete.id},
+        ]}
+
+        res = self.client.post(BATCH_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        created_id = res.data[0]['id']
+        self.assertEqual(res.data, [
+            {'action': 'create', 'id': created_id, 'status': 201},
+            {'action': 'update', 'id': to_update.id, 'status': 200},
+            {'action': 'delete', 'id': to_delete.id, 'status': 204},
+        ])
+        created = Recipe.objects.get(id=created_id)
+        self.assertEqual(created.user, self.user)
+        self.assertEqual(created.price, Decimal('7.50'))
+        self.assertEqual(sorted(t.name for t in created.tags.all()), ['Quick', 'Vegan'])
+        self.assertEqual([i.name for i in created.ingredients.all()], ['Tofu'])
+        to_update.refresh_from_db()
+        self.assertEqual(to_update.title, 'New title')
+        self.assertEqual([t.name for t in to_update.tags.all()], ['Quick'])
+        self.assertFalse(Recipe.objects.filter(id=to_delete.id).exists())
+        self.assertEqual(Tag.objects.filter(user=self.user, name='Quick').count(), 1)
+
+    def test_batch_partial_update_keeps_relations(self):
+        """Test an update without tags/ingredients keeps them."""
+        recipe = create_recipe(user=self.user)
+        ingredient = Ingredient.objects.create(user=self.user, name='Salt')
+        recipe.ingredients.add(ingredient)
+        updated_at = recipe.updated_at
+        payload = {'operations': [{'action': 'update', 'id': recipe.id, 'data': {'time_minutes': 40}}]}
+
+        res = self.client.post(BATCH_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.time_minutes, 40)
+        self.assertGreater(recipe.updated_at, updated_at)
+        self.assertEqual(list(recipe.ingredients.all()), [ingredient])
+
+    def test_batch_invalid_operation_rolls_back(self):
+        """Test nothing is applied when an operation is invalid."""
+        recipe = create_recipe(user=self.user)
+        other_recipe = create_recipe(user=get_user_model().objects.create_user('other@example.com', 'test123'))
+        payload = {'operations': [
+            {'action': 'create', 'data': recipe_data()},
+            {'action': 'create', 'data': {'title': 'No price'}},
+            {'action': 'delete', 'id': recipe.id},
+            {'action': 'delete', 'id': other_recipe.id},
+        ]}
+
+        res = self.client.post(BATCH_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual([r['status'] for r in res.data], [424, 400, 424, 404])
+        self.assertIn('price', res.data[1]['errors'])
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 1)
+        self.assertTrue(Recipe.objects.filter(id=other_recipe.id).exists())
+
+    def test_batch_same_recipe_twice(self):
+        """Test a recipe cannot be changed by two operations of a batch."""
+        recipe = create_recipe(user=self.user)
+        payload = {'operations': [
+            {'action': 'update', 'id': recipe.id, 'data': {'title': 'New title'}},
+            {'action': 'delete', 'id': recipe.id},
+        ]}
+
+        res = self.client.post(BATCH_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual([r['status'] for r in res.data], [424, 400])
+        self.assertTrue(Recipe.objects.filter(id=recipe.id).exists())
+
+    def test_batch_missing_fields(self):
+        """Test operations without their required fields are rejected."""
+        payload = {'operations': [{'action': 'update', 'data': {}}, {'action': 'create'}]}
+
+        res = self.client.post(BATCH_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('id', res.data['operations'][0])
+        self.assertIn('data', res.data['operations'][1])
+
+    def test_batch_max_size(self):
+        """Test batches larger than the maximum size are rejected."""
+        payload = {'operations': [{'action': 'create', 'data': recipe_data()}] * 3}
+
+        with override_settings(RECIPE_BATCH_MAX_SIZE=2):
+            res = self.client.post(BATCH_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_batch_query_count_is_constant(self):
+        """Test the number of queries doesn't depend on the batch size."""
+        def run(count, prefix):
+            recipes = [create_recipe(user=self.user) for _ in range(count)]
+            payload = {'operations': [
+                {'action': 'create', 'data': recipe_data(tags=[{'name': f'{prefix} {i}'}])} for i in range(count)
+            ] + [
+                {'action': 'update', 'id': recipe.id, 'data': {'ingredients': [{'name': f'{prefix} {i}'}]}}
+                for i, recipe in enumerate(recipes)
+            ]}
+            with CaptureQueriesContext(connection) as queries:
+                res = self.client.post(BATCH_URL, payload, format='json')
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            return len(queries)
+
+        self.assertEqual(run(2, 'few'), run(20, 'many'))
+
+
+class BatchSchemaTests(TestCase):
+    """Test the OpenAPI schema of the batch endpoint."""
+
+    def test_results_are_unpaginated_lists(self):
+        """Test the batch has no pagination params, and both its responses are lists of results."""
+        schema = SchemaGenerator().get_schema(request=None, public=True)
+        operation = schema['paths'][BATCH_URL]['post']
+
+        self.assertNotIn('parameters', operation)
+        expected = {'type': 'array', 'items': {'$ref': '#/components/schemas/RecipeBatchResult'}}
+        for code in ('200', '400'):
+            self.assertEqual(operation['responses'][code]['content']['application/json']['schema'], expected)
@@ -0,0 +1,169 @@
+"""
+Tests for the recipe API response cache.
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag, Ingredient
+from core.tests.base import TestCase
+from recipe.cache import get_stats
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+INGREDIENTS_URL = reverse('recipe:ingredient-list')
+
+
+def detail_url(recipe_id):
+    """Create and return a recipe detail URL."""
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe."""
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 10,
+        'price': Decimal('5.00'),
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class ResponseCacheTests(TestCase):
+    """Test caching the read responses of the recipe APIs."""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user('user@example.com', 'testpass123')
+        self.client.force_authenticate(self.user)
+
+    def test_list_recipes_cached(self):
+        """Test the second identical request is served from the cache."""
+        create_recipe(user=self.user)
+
+        res1 = self.client.get(RECIPES_URL)
+        with self.assertNumQueries(0):
+            res2 = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res1['X-Cache'], 'MISS')
+        self.assertEqual(res2['X-Cache'], 'HIT')
+        self.assertEqual(res2.status_code, status.HTTP_200_OK)
+        self.assertEqual(res1.content, res2.content)
+
+    def test_query_params_normalized(self):
+        """Test the same query params in another order share the cache entry."""
+        tag1 = Tag.objects.create(user=self.user, name='Vegan')
+        tag2 = Tag.objects.create(user=self.user, name='Quick')
+
+        self.client.get(f'{RECIPES_URL}?tags={tag1.id},{tag2.id}&match=all')
+        res = self.client.get(f'{RECIPES_URL}?match=all&tags={tag1.id},{tag2.id}')
+        other = self.client.get(f'{RECIPES_URL}?tags={tag1.id},{tag2.id}')
+
+        self.assertEqual(res['X-Cache'], 'HIT')
+        self.assertEqual(other['X-Cache'], 'MISS')
+
+    def test_recipe_changes_invalidate_cache(self):
+        """Test creating, updating and deleting recipes invalidates the cache."""
+        recipe = create_recipe(user=self.user)
+        self.client.get(RECIPES_URL)
+        self.client.get(detail_url(recipe.id))
+
+        recipe.title = 'New title'
+        recipe.save()
+        res = self.client.get(detail_url(recipe.id))
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertEqual(res.data['title'], 'New title')
+
+        new_recipe = create_recipe(user=self.user)
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertEqual(len(res.data['results']), 2)
+
+        new_recipe.delete()
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_m2m_changes_invalidate_cache(self):
+        """Test adding tags or ingredients to a recipe invalidates the cache."""
+        recipe = create_recipe(user=self.user)
+        self.client.get(detail_url(recipe.id))
+
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Vegan'))
+        res = self.client.get(detail_url(recipe.id))
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertEqual(len(res.data['tags']), 1)
+
+        ingredient = Ingredient.objects.create(user=self.user, name='Tofu')
+        self.client.get(detail_url(recipe.id))
+        ingredient.recipe_set.add(recipe)  # From the other side of the relation.
+        res = self.client.get(detail_url(recipe.id))
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertEqual(len(res.data['ingredients']), 1)
+
+    def test_tag_rename_invalidates_recipes_and_tags(self):
+        """Test renaming a tag through the API invalidates the tag and recipe lists."""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe = create_recipe(user=self.user)
+        recipe.tags.add(tag)
+        self.client.get(RECIPES_URL)
+        self.client.get(TAGS_URL)
+
+        self.client.patch(reverse('recipe:tag-detail', args=[tag.id]), {'name': 'Plant based'})
+        recipes = self.client.get(RECIPES_URL)
+        tags = self.client.get(TAGS_URL)
+
+        self.assertEqual(recipes['X-Cache'], 'MISS')
+        self.assertEqual(recipes.data['results'][0]['tags'][0]['name'], 'Plant based')
+        self.assertEqual(tags['X-Cache'], 'MISS')
+        self.assertEqual(tags.data[0]['name'], 'Plant based')
+
+    def test_cache_limited_to_user(self):
+        """Test users don't share cache entries, nor invalidate each other's."""
+        other_user = get_user_model().objects.create_user('other@example.com', 'testpass123')
+        other_client = APIClient()
+        other_client.force_authenticate(other_user)
+        create_recipe(user=self.user)
+        self.client.get(RECIPES_URL)
+
+        other_res = other_client.get(RECIPES_URL)
+        Ingredient.objects.create(user=other_user, name='Salt')
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(other_res['X-Cache'], 'MISS')
+        self.assertEqual(len(other_res.data['results']), 0)
+        self.assertEqual(res['X-Cache'], 'HIT')
+
+    def test_cache_stats(self):
+        """Test the hits and misses are counted."""
+        self.client.get(INGREDIENTS_URL)
+        self.client.get(INGREDIENTS_URL)
+        self.client.get(INGREDIENTS_URL)
+
+        self.assertEqual(get_stats(), {'hits': 2, 'misses': 1})
+
+    def test_errors_not_cached(self):
+        """Test error responses are not cached."""
+        self.client.get(detail_url(0))
+        res = self.client.get(detail_url(0))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(get_stats(), {'hits': 0, 'misses': 2})
+
+    @override_settings(RECIPE_CACHE_ENABLED=False)
+    def test_cache_disabled(self):
+        """Test the responses are not cached when the cache is disabled."""
+        self.client.get(TAGS_URL)
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotIn('X-Cache', res)
+        self.assertEqual(get_stats(), {'hits': 0, 'misses': 0})
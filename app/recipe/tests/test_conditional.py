@@ -0,0 +1,141 @@
+"""
+Tests for the conditional GETs of the recipe APIs.
+"""
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag
+from core.tests.base import TestCase
+from recipe.cache import bump_user_version
+from recipe.serializers import RecipeSerializer
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def detail_url(recipe_id):
+    """Create and return a recipe detail URL."""
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe."""
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 10,
+        'price': Decimal('5.00'),
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class ConditionalGetTests(TestCase):
+    """Test ETag and If-None-Match handling."""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user('user@example.com', 'testpass123')
+        self.client.force_authenticate(self.user)
+        self.recipe = create_recipe(user=self.user)
+
+    def test_list_not_modified(self):
+        """Test a matching If-None-Match returns 304 without serializing the recipes."""
+        res = self.client.get(RECIPES_URL)
+        etag = res['ETag']
+
+        with patch.object(RecipeSerializer, 'to_representation') as to_representation:
+            with self.assertNumQueries(0):  # The ETag comes from the cache version.
+                res = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res['ETag'], etag)
+        self.assertEqual(res.content, b'')
+        to_representation.assert_not_called()
+
+    def test_detail_not_modified(self):
+        """Test a matching If-None-Match returns 304 for a recipe."""
+        etag = self.client.get(detail_url(self.recipe.id))['ETag']
+
+        res = self.client.get(detail_url(self.recipe.id), HTTP_IF_NONE_MATCH=f'"other", W/{etag}')
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_etag_changes_on_update(self):
+        """Test updating a recipe changes the list and detail ETags."""
+        list_etag = self.client.get(RECIPES_URL)['ETag']
+        detail_etag = self.client.get(detail_url(self.recipe.id))['ETag']
+
+        self.client.patch(detail_url(self.recipe.id), {'title': 'New title'})
+        res_list = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=list_etag)
+        res_detail = self.client.get(detail_url(self.recipe.id), HTTP_IF_NONE_MATCH=detail_etag)
+
+        self.assertEqual(res_list.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res_list['ETag'], list_etag)
+        self.assertEqual(res_detail.status_code, status.HTTP_200_OK)
+        self.assertEqual(res_detail.data['title'], 'New title')
+
+    def test_etag_changes_on_tag_changes(self):
+        """Test adding or renaming a tag changes the recipe ETag."""
+        etag1 = self.client.get(detail_url(self.recipe.id))['ETag']
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.recipe.tags.add(tag)
+        etag2 = self.client.get(detail_url(self.recipe.id))['ETag']
+        tag.name = 'Plant based'
+        tag.save()
+        etag3 = self.client.get(detail_url(self.recipe.id))['ETag']
+
+        self.assertEqual(len({etag1, etag2, etag3}), 3)
+
+    def test_etag_changes_on_delete(self):
+        """Test deleting a recipe changes the list ETag."""
+        other = create_recipe(user=self.user)
+        etag = self.client.get(RECIPES_URL)['ETag']
+
+        other.delete()
+        res = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_etag_depends_on_query_params(self):
+        """Test different pages or filters of the list have different ETags."""
+        etag = self.client.get(RECIPES_URL)['ETag']
+
+        res = self.client.get(RECIPES_URL, {'page_size': 1}, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_cached_response_keeps_its_etag(self):
+        """Test a cached response is sent with the ETag it was cached with, until the user's version changes."""
+        etag = self.client.get(detail_url(self.recipe.id))['ETag']
+        Recipe.objects.filter(id=self.recipe.id).update(title='New title')  # No signals: not invalidated.
+
+        res_cached = self.client.get(detail_url(self.recipe.id))
+        bump_user_version(self.user.id)
+        res = self.client.get(detail_url(self.recipe.id), HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res_cached['X-Cache'], 'HIT')
+        self.assertEqual(res_cached['ETag'], etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertNotEqual(res['ETag'], etag)
+        self.assertEqual(res.data['title'], 'New title')
+
+    def test_any_etag(self):
+        """Test If-None-Match: * returns 304 for an existing recipe."""
+        res = self.client.get(detail_url(self.recipe.id), HTTP_IF_NONE_MATCH='*')
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_detail_missing_recipe(self):
+        """Test a conditional GET of a missing recipe returns 404."""
+        res = self.client.get(detail_url(0), HTTP_IF_NONE_MATCH='*')
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
@@ -0,0 +1,125 @@
+"""
+Tests for the recipe export API.
+"""
+from decimal import Decimal
+import csv
+import io
+import json
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.http import StreamingHttpResponse
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag, Ingredient
+from core.tests.base import TestCase
+
+
+EXPORT_URL = reverse('recipe:recipe-export')
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe."""
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 10,
+        'price': Decimal('5.00'),
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class PrivateExportApiTests(TestCase):
+    """Test authenticated API requests."""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user('user@example.com', 'testpass123')
+        self.client.force_authenticate(self.user)
+
+    def test_auth_required(self):
+        """Test that authentication is required."""
+        res = APIClient().get(EXPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_export_ndjson(self):
+        """Test exporting the recipes as newline-delimited JSON."""
+        recipe = create_recipe(user=self.user, title='Pancakes', description='Fluffy')
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Breakfast'))
+        recipe.ingredients.add(Ingredient.objects.create(user=self.user, name='Flour'))
+        create_recipe(user=get_user_model().objects.create_user('other@example.com', 'test123'))
+
+        res = self.client.get(EXPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIsInstance(res, StreamingHttpResponse)
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(res.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 1)
+        row = json.loads(lines[0])
+        self.assertEqual(row['id'], recipe.id)
+        self.assertEqual(row['title'], 'Pancakes')
+        self.assertEqual(row['description'], 'Fluffy')
+        self.assertEqual(row['price'], '5.00')
+        self.assertEqual(row['tags'], [{'id': recipe.tags.get().id, 'name': 'Breakfast'}])
+        self.assertEqual(row['ingredients'][0]['name'], 'Flour')
+
+    def test_export_csv(self):
+        """Test exporting the recipes as CSV."""
+        recipe = create_recipe(user=self.user, title='Pancakes, with syrup')
+        recipe.tags.add(
+            Tag.objects.create(user=self.user, name='Breakfast'),
+            Tag.objects.create(user=self.user, name='Sweet'),
+        )
+
+        res = self.client.get(EXPORT_URL, {'output': 'csv'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'text/csv')
+        content = b''.join(res.streaming_content).decode()
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['title'], 'Pancakes, with syrup')
+        self.assertEqual(rows[0]['tags'], 'Breakfast|Sweet')
+        self.assertEqual(rows[0]['ingredients'], '')
+
+    def test_export_filtered(self):
+        """Test the export applies the tags/ingredients filters."""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        r1 = create_recipe(user=self.user)
+        r1.tags.add(tag)
+        create_recipe(user=self.user)
+
+        res = self.client.get(EXPORT_URL, {'tags': tag.id})
+
+        lines = b''.join(res.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in lines], [r1.id])
+
+    def test_export_invalid_output(self):
+        """Test an unknown export format returns an error."""
+        res = self.client.get(EXPORT_URL, {'output': 'xml'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(RECIPE_EXPORT_CHUNK_SIZE=2)
+    def test_export_reads_chunks(self):
+        """Test the recipes and their relations are read one chunk at a time."""
+        for i in range(5):
+            recipe = create_recipe(user=self.user, title=f'Recipe {i}')
+            recipe.tags.add(Tag.objects.create(user=self.user, name=f'Tag {i}'))
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(EXPORT_URL)
+            lines = b''.join(res.streaming_content).decode().splitlines()
+
+        self.assertEqual(len(lines), 5)
+        # Three chunks of recipes (2 + 2 + 1), each with one tags and one ingredients query.
+        prefetches = [q for q in queries if 'core_recipe_tags' in q['sql'] and 'IN' in q['sql']]
+        self.assertEqual(len(prefetches), 3)
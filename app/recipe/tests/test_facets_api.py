@@ -0,0 +1,102 @@
+"""
+Tests for the recipe facets API.
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag, Ingredient
+from core.tests.base import TestCase
+
+
+FACETS_URL = reverse('recipe:recipe-facets')
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe."""
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 10,
+        'price': Decimal('5.00'),
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class PublicFacetsApiTests(TestCase):
+    """Test unauthenticated API requests."""
+
+    def test_auth_required(self):
+        """Test that authentication is required."""
+        res = APIClient().get(FACETS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateFacetsApiTests(TestCase):
+    """Test authenticated API requests."""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user('user@example.com', 'testpass123')
+        self.client.force_authenticate(self.user)
+
+        self.vegan = Tag.objects.create(user=self.user, name='Vegan')
+        self.quick = Tag.objects.create(user=self.user, name='Quick')
+        self.tofu = Ingredient.objects.create(user=self.user, name='Tofu')
+        self.curry = create_recipe(user=self.user, title='Tofu curry')
+        self.curry.tags.add(self.vegan)
+        self.curry.ingredients.add(self.tofu)
+        self.salad = create_recipe(user=self.user, title='Salad')
+        self.salad.tags.add(self.vegan, self.quick)
+        Tag.objects.create(user=self.user, name='Unused')
+
+        other_user = get_user_model().objects.create_user('other@example.com', 'testpass123')
+        other_recipe = create_recipe(user=other_user)
+        other_recipe.tags.add(Tag.objects.create(user=other_user, name='Vegan'))
+
+    def test_facets(self):
+        """Test counting the recipes of the user by tag and ingredient."""
+        # One query for both facets.
+        with self.assertNumQueries(1):
+            res = self.client.get(FACETS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, {
+            'tags': [
+                {'id': self.vegan.id, 'name': 'Vegan', 'count': 2},
+                {'id': self.quick.id, 'name': 'Quick', 'count': 1},
+            ],
+            'ingredients': [{'id': self.tofu.id, 'name': 'Tofu', 'count': 1}],
+        })
+
+    def test_facets_filtered(self):
+        """Test the facets count the recipes that match the filters."""
+        res_tags = self.client.get(FACETS_URL, {'tags': self.quick.id})
+        res_search = self.client.get(FACETS_URL, {'q': 'curry'})
+
+        self.assertEqual(res_tags.data['tags'], [
+            {'id': self.quick.id, 'name': 'Quick', 'count': 1},
+            {'id': self.vegan.id, 'name': 'Vegan', 'count': 1},
+        ])
+        self.assertEqual(res_tags.data['ingredients'], [])
+        self.assertEqual(res_search.data['ingredients'], [{'id': self.tofu.id, 'name': 'Tofu', 'count': 1}])
+
+    def test_facets_cached(self):
+        """Test the facets are cached until the recipes change."""
+        self.client.get(FACETS_URL)
+        res_cached = self.client.get(FACETS_URL)
+        etag = res_cached['ETag']
+
+        self.salad.tags.remove(self.vegan)
+        res = self.client.get(FACETS_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res_cached['X-Cache'], 'HIT')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertEqual(res.data['tags'][1], {'id': self.vegan.id, 'name': 'Vegan', 'count': 1})
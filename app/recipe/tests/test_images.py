@@ -0,0 +1,168 @@
+"""
+Tests for the recipe image variants.
+"""
+from io import StringIO
+from unittest.mock import patch
+import os
+import tempfile
+
+from PIL import Image
+
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Job, Recipe, StoredImage
+from core.tests.base import TestCase
+
+from recipe import images
+
+
+def image_upload_url(recipe_id):
+    """Create and return an image upload URL."""
+    return reverse("recipe:recipe-upload-image", args=[recipe_id])
+
+
+def detail_url(recipe_id):
+    """Create and return a recipe detail URL."""
+    return reverse("recipe:recipe-detail", args=[recipe_id])
+
+
+@override_settings(RECIPE_IMAGE_SIZES=[160, 480])
+class ImageVariantsTests(TestCase):
+    """Test the resized and WebP variants of the recipe images."""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user('user@example.com', 'testpass123')
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(user=self.user, title='Sample recipe', time_minutes=5, price=5)
+
+    def tearDown(self):
+        self.recipe.refresh_from_db()
+        images.delete_variants(self.recipe.image_variants)
+        self.recipe.image.delete()
+
+    def upload(self, size=(1000, 500), mode='RGB', image_format='JPEG', color='black', recipe=None, run_jobs=True):
+        """Upload an image to a recipe, and run the background jobs."""
+        recipe = recipe or self.recipe
+        with tempfile.NamedTemporaryFile(suffix=f'.{image_format.lower()}') as image_file:
+            Image.new(mode, size, color).save(image_file, format=image_format)
+            image_file.seek(0)
+            with self.captureOnCommitCallbacks(execute=True):  # The replaced image is deleted on commit.
+                res = self.client.post(image_upload_url(recipe.id), {'image': image_file}, format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        if run_jobs:
+            call_command('run_worker', burst=True, threads=1, stdout=StringIO())
+        recipe.refresh_from_db()
+        return recipe.image_variants
+
+    def test_variants_generated(self):
+        """Test uploading an image generates the resized JPEG and WebP variants."""
+        variants = self.upload()
+
+        self.assertEqual(set(variants), {'160', '480'})
+        for size, formats in variants.items():
+            self.assertEqual(set(formats), {'jpeg', 'webp'})
+            for image_format, path in formats.items():
+                with default_storage.open(path) as variant, Image.open(variant) as image:
+                    self.assertEqual(image.format, image_format.upper())
+                    self.assertEqual(image.size, (int(size), int(size) // 2))  # The aspect ratio is kept.
+
+    def test_transparent_image_variants(self):
+        """Test images with transparency keep it, as PNG instead of JPEG."""
+        variants = self.upload(mode='RGBA', image_format='PNG')
+
+        self.assertEqual(set(variants['160']), {'png', 'webp'})
+        with default_storage.open(variants['160']['png']) as variant, Image.open(variant) as image:
+            self.assertEqual(image.mode, 'RGBA')
+
+    def test_small_image_not_upscaled(self):
+        """Test the variants of images smaller than a size aren't upscaled."""
+        variants = self.upload(size=(200, 100))
+
+        with default_storage.open(variants['480']['webp']) as variant, Image.open(variant) as image:
+            self.assertEqual(image.size, (200, 100))
+
+    def test_replace_image_regenerates_variants(self):
+        """Test replacing the image deletes the old variants and generates new ones."""
+        old_variants = self.upload()
+
+        new_variants = self.upload(color='white')
+
+        self.assertNotEqual(old_variants, new_variants)
+        for formats in old_variants.values():
+            for path in formats.values():
+                self.assertFalse(default_storage.exists(path))
+        for formats in new_variants.values():
+            for path in formats.values():
+                self.assertTrue(default_storage.exists(path))
+
+    def test_detail_variant_urls(self):
+        """Test the recipe detail returns the absolute URLs of the variants."""
+        variants = self.upload()
+
+        res = self.client.get(detail_url(self.recipe.id))
+
+        self.assertEqual(
+            res.data['image_variants']['160']['webp'],
+            f'http://testserver{default_storage.url(variants["160"]["webp"])}',
+        )
+
+    def test_image_released_during_generation(self):
+        """Test the variants of an image whose last reference was released in the meantime are discarded."""
+        images.delete_variants(self.upload())
+        StoredImage.objects.update(variants={})
+        render_variants, save = images.render_variants, default_storage.save
+        saved = []
+
+        def release_and_render(image_file):
+            StoredImage.objects.all().delete()
+            yield from render_variants(image_file)
+
+        def save_and_record(name, content):
+            saved.append(save(name, content))
+            return saved[-1]
+
+        with patch('recipe.images.render_variants', release_and_render), \
+                patch.object(images.recipe_image_storage, 'save', side_effect=save_and_record):
+            images.generate_variants(self.recipe.id, self.recipe.image.name)
+
+        self.assertTrue(saved)
+        for path in saved:
+            self.assertFalse(default_storage.exists(path))
+
+    def test_same_image_variants_shared(self):
+        """Test the variants of an image used by several recipes are generated once."""
+        other = Recipe.objects.create(user=self.user, title='Other recipe', time_minutes=5, price=5)
+        variants = self.upload()
+
+        with patch('recipe.images.render_variants') as mock_render:
+            other_variants = self.upload(recipe=other)
+
+        mock_render.assert_not_called()
+        self.assertEqual(other.image.name, self.recipe.image.name)
+        self.assertEqual(other_variants, variants)
+
+        other.delete()  # The image and its variants are still used by self.recipe.
+        for formats in variants.values():
+            for path in formats.values():
+                self.assertTrue(default_storage.exists(path))
+        self.assertTrue(default_storage.exists(self.recipe.image.name))
+
+    def test_variants_generated_in_job(self):
+        """Test the variants are generated by a background job, outside of the request."""
+        variants = self.upload(run_jobs=False)
+
+        self.assertEqual(variants, {})
+        self.assertTrue(os.path.exists(self.recipe.image.path))
+        job = Job.objects.get()
+        self.assertEqual(job.func, 'recipe.images.generate_variants')
+        self.assertEqual(job.args, [self.recipe.id, self.recipe.image.name])
@@ -5,12 +5,13 @@ from decimal import Decimal
 
 from django.contrib.auth import get_user_model
 from django.urls import reverse
-from django.test import TestCase
+from django.test import override_settings
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
 from core.models import Ingredient, Recipe
+from core.tests.base import TestCase
 
 from recipe.serializers import IngredientSerializer
 
@@ -32,6 +33,7 @@ class PublicIngredientsApiTests(TestCase):
     """Tests unauthenticated API requests."""
 
     def setUp(self):
+        super().setUp()
         self.client = APIClient()
 
     def test_auth_required(self):
@@ -45,6 +47,7 @@ class PrivateIngredientsApiTests(TestCase):
     """Tests authenticated API requests."""
 
     def setUp(self):
+        super().setUp()
         self.client = APIClient()
         self.user = create_user()
         self.client.force_authenticate(self.user)
@@ -137,3 +140,54 @@ class PrivateIngredientsApiTests(TestCase):
         res = self.client.get(INGREDIENTS_URL, {'assigned_only': 1})
 
         self.assertEqual(len(res.data), 1)
+
+    def test_autocomplete_prefix(self):
+        """Test listing the ingredients that start with a prefix, closest first."""
+        for name in ['Tomato paste', 'Cherry tomatoes', 'tomato', 'Potato']:
+            Ingredient.objects.create(user=self.user, name=name)
+        Ingredient.objects.create(user=create_user(email='other@example.com'), name='Tomato')
+
+        res = self.client.get(INGREDIENTS_URL, {'prefix': 'TOM'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([i['name'] for i in res.data], ['tomato', 'Tomato paste'])
+
+    def test_autocomplete_prefix_special_characters(self):
+        """Test the prefix is matched literally."""
+        Ingredient.objects.create(user=self.user, name='Salt (coarse)')
+        Ingredient.objects.create(user=self.user, name='Salted butter')
+
+        res = self.client.get(INGREDIENTS_URL, {'prefix': 'salt (c'})
+
+        self.assertEqual([i['name'] for i in res.data], ['Salt (coarse)'])
+
+    def test_autocomplete_similar(self):
+        """Test listing the ingredients similar to a misspelled name, best matches first."""
+        for name in ['Cherry tomatoes', 'Tomato', 'Potato', 'Kale']:
+            Ingredient.objects.create(user=self.user, name=name)
+
+        res = self.client.get(INGREDIENTS_URL, {'similar': 'tomatos'})
+
+        self.assertEqual([i['name'] for i in res.data], ['Cherry tomatoes', 'Tomato'])
+
+    @override_settings(RECIPE_AUTOCOMPLETE_LIMIT=2)
+    def test_autocomplete_limited(self):
+        """Test the autocomplete returns a limited number of ingredients."""
+        for i in range(5):
+            Ingredient.objects.create(user=self.user, name=f'Salt {i}')
+
+        res = self.client.get(INGREDIENTS_URL, {'prefix': 'salt'})
+
+        self.assertEqual([i['name'] for i in res.data], ['Salt 0', 'Salt 1'])
+
+    def test_assigned_ingredients_with_counts(self):
+        """Test listing the assigned ingredients with their number of recipes."""
+        salt = Ingredient.objects.create(user=self.user, name='Salt')
+        Ingredient.objects.create(user=self.user, name='Kale')
+        for title in ['Fries', 'Soup', 'Bread']:
+            recipe = Recipe.objects.create(user=self.user, title=title, time_minutes=5, price=Decimal('3.00'))
+            recipe.ingredients.add(salt)
+
+        res = self.client.get(INGREDIENTS_URL, {'assigned_only': 1, 'with_counts': 1})
+
+        self.assertEqual(res.data, [{'id': salt.id, 'name': 'Salt', 'recipe_count': 3}])
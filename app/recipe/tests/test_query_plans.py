@@ -0,0 +1,108 @@
+"""
+Tests for the query plans of the recipe APIs.
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchQuery
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import SEARCH_CONFIG, Recipe, Tag, Ingredient
+from core.tests.base import TestCase
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+INGREDIENTS_URL = reverse('recipe:ingredient-list')
+
+
+def explain(sql, params=None):
+    """Return the query plan of a SQL query."""
+    with connection.cursor() as cursor:
+        # The test tables are tiny, so PostgreSQL would prefer a sequential scan for any query.
+        # Disabling them (for the current test transaction only) shows which index the planner picks.
+        cursor.execute('SET LOCAL enable_seqscan = off')
+        cursor.execute(f'EXPLAIN {sql}', params)
+        return '\n'.join(row[0] for row in cursor.fetchall())
+
+
+class QueryPlanTests(TestCase):
+    """Test the list queries are served by the composite indexes."""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user('user@example.com', 'testpass123')
+        self.client.force_authenticate(self.user)
+        self.tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.ingredient = Ingredient.objects.create(user=self.user, name='Tofu')
+        recipe = Recipe.objects.create(
+            user=self.user,
+            title='Tofu scramble',
+            time_minutes=10,
+            price=Decimal('4.50'),
+        )
+        recipe.tags.add(self.tag)
+        recipe.ingredients.add(self.ingredient)
+
+    def _list_query_plan(self, url):
+        """Request a list endpoint and return the plan of its first query."""
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        return explain(queries[0]['sql'])
+
+    def test_recipe_list_uses_user_id_index(self):
+        """Test the recipe list is read from the (user_id, id DESC) index."""
+        plan = self._list_query_plan(RECIPES_URL)
+
+        self.assertIn('recipe_user_id_desc_idx', plan)
+        self.assertNotIn('Seq Scan', plan)
+        self.assertNotIn('Sort', plan)
+
+    def test_recipe_search_uses_search_vector_index(self):
+        """Test the text search condition is served by the GIN index of the search vector."""
+        # The planner combines it with the user index on real tables, the tiny test table only needs the latter.
+        query = SearchQuery('tofu', search_type='websearch', config=SEARCH_CONFIG)
+
+        plan = explain(*Recipe.objects.filter(search_vector=query).values('id').query.sql_with_params())
+
+        self.assertIn('recipe_search_vector_idx', plan)
+        self.assertNotIn('Seq Scan', plan)
+
+    def test_tag_list_uses_user_name_index(self):
+        """Test the tag list is read from the (user_id, name) index."""
+        plan = self._list_query_plan(TAGS_URL)
+
+        self.assertIn('tag_user_name_idx', plan)
+        self.assertNotIn('Seq Scan', plan)
+        self.assertNotIn('Unique', plan)  # No DISTINCT.
+
+    def test_ingredient_list_uses_user_name_index(self):
+        """Test the ingredient list is read from the (user_id, name) index."""
+        plan = self._list_query_plan(INGREDIENTS_URL)
+
+        self.assertIn('ingredient_user_name_idx', plan)
+        self.assertNotIn('Seq Scan', plan)
+        self.assertNotIn('Unique', plan)  # No DISTINCT.
+
+    def test_through_tables_reverse_lookup_indexes(self):
+        """Test looking up the recipes of a tag or ingredient uses the reverse lookup indexes."""
+        tag_recipes = Recipe.tags.through.objects.filter(tag=self.tag).values_list('recipe_id')
+        ingredient_recipes = Recipe.ingredients.through.objects.filter(
+            ingredient=self.ingredient
+        ).values_list('recipe_id')
+
+        tag_plan = explain(str(tag_recipes.query))
+        ingredient_plan = explain(str(ingredient_recipes.query))
+
+        self.assertIn('core_recipe_tags_tag_recipe_idx', tag_plan)
+        self.assertNotIn('Seq Scan', tag_plan)
+        self.assertIn('core_recipe_ingredients_ingredient_recipe_idx', ingredient_plan)
+        self.assertNotIn('Seq Scan', ingredient_plan)
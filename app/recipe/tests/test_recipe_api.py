@@ -2,20 +2,27 @@
 Tests for recipe APIs.
 """
 from decimal import Decimal
+from unittest.mock import patch
 import tempfile
 import os
 
 from PIL import Image
 
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.db import connection
+from django.db.models import Prefetch
+from django.db.models.signals import m2m_changed
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from rest_framework import status
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient
 
 from core.models import Recipe, Tag, Ingredient
+from core.tests.base import TestCase
 
+from recipe.pagination import RecipeCursorPagination
 from recipe.serializers import RecipeSerializer, RecipeDetailSerializer
 
 
@@ -56,6 +63,7 @@ class PublicRecipeAPITests(TestCase):
     """Test unauthenticated API requests."""
 
     def setUp(self):
+        super().setUp()
         self.client = APIClient()
 
     def test_auth_required(self):
@@ -69,6 +77,7 @@ class PrivateRecipeAPITests(TestCase):
     """Test authenticated API requests."""
 
     def setUp(self):
+        super().setUp()
         self.client = APIClient()
         self.user = create_user(email='test@example.com', password='testpass123')
         self.client.force_authenticate(self.user)
@@ -84,7 +93,7 @@ class PrivateRecipeAPITests(TestCase):
         serializer = RecipeSerializer(recipes, many=True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_recipe_list_limited_to_user(self):
         """Test list of recipes is limited to authenticated user."""
@@ -98,8 +107,8 @@ class PrivateRecipeAPITests(TestCase):
         serializer = RecipeSerializer(recipes, many=True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
-        self.assertEqual(len(res.data), 1)
+        self.assertEqual(res.data['results'], serializer.data)
+        self.assertEqual(len(res.data['results']), 1)
 
     def test_get_recipe_detail(self):
         """Test get recipe detail."""
@@ -252,6 +261,61 @@ class PrivateRecipeAPITests(TestCase):
             ).exists()
             self.assertTrue(exists)
 
+    def test_create_recipe_with_duplicate_tags(self):
+        """Test repeated tag names in the payload are created and added once."""
+        payload = {
+            'title': 'Pongal',
+            'time_minutes': 60,
+            'price': Decimal('10.50'),
+            'tags': [{'name': 'Indian'}, {'name': 'Breakfast'}, {'name': 'Indian'}],
+        }
+        res = self.client.post(RECIPES_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        recipe = Recipe.objects.get(id=res.data['id'])
+        self.assertEqual(recipe.tags.count(), 2)
+        self.assertEqual(Tag.objects.filter(user=self.user, name='Indian').count(), 1)
+
+    def test_create_recipe_new_tags_in_payload_order(self):
+        """Test the tags created with a recipe get their ids in the order of the payload."""
+        names = [f'Tag {i}' for i in range(20)]
+        payload = {
+            'title': 'Pongal',
+            'time_minutes': 60,
+            'price': Decimal('10.50'),
+            'tags': [{'name': name} for name in names],
+        }
+        res = self.client.post(RECIPES_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(list(Tag.objects.filter(user=self.user).order_by('id').values_list('name', flat=True)), names)
+
+    def test_create_recipe_nested_query_count_is_constant(self):
+        """Test tags and ingredients are saved with a fixed number of queries."""
+        def create(count, prefix):
+            payload = {
+                'title': 'Sample recipe',
+                'time_minutes': 10,
+                'price': Decimal('5.00'),
+                'tags': [{'name': f'{prefix} tag {i}'} for i in range(count)],
+                'ingredients': [{'name': f'{prefix} ingredient {i}'} for i in range(count)],
+            }
+            with CaptureQueriesContext(connection) as queries:
+                res = self.client.post(RECIPES_URL, payload, format='json')
+            self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+            return queries
+
+        Tag.objects.create(user=self.user, name='many tag 0')
+        few = create(1, 'few')
+        many = create(30, 'many')
+
+        # Saving the items one by one took about 5 queries per tag/ingredient (303 for this payload).
+        self.assertEqual(len(few), len(many))
+        inserts = [q['sql'] for q in many if q['sql'].startswith('INSERT')]
+        # The recipe, the new tags, the new ingredients and the two through tables.
+        self.assertEqual(len(inserts), 5)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 31)
+
     def test_create_tag_on_update(self):
         """Test creating tag when updating a recipe."""
         recipe = create_recipe(user=self.user)
@@ -281,6 +345,33 @@ class PrivateRecipeAPITests(TestCase):
         self.assertIn(tag_lunch, recipe.tags.all())
         self.assertNotIn(tag_breakfast, recipe.tags.all())
 
+    def test_update_recipe_tags_only_changes_diff(self):
+        """Test updating tags only removes and adds the tags that changed."""
+        tags = [Tag.objects.create(user=self.user, name=name) for name in ('Vegan', 'Lunch', 'Quick')]
+        recipe = create_recipe(user=self.user)
+        recipe.tags.add(*tags)
+        through = Recipe.tags.through
+        kept_rows = set(through.objects.filter(recipe=recipe, tag__in=tags[:2]).values_list('id', flat=True))
+
+        changes = []
+
+        def record_change(sender, action, pk_set, **kwargs):
+            if action in ('post_add', 'post_remove', 'post_clear'):
+                changes.append((action, pk_set))
+
+        m2m_changed.connect(record_change, sender=through)
+        self.addCleanup(m2m_changed.disconnect, record_change, sender=through)
+
+        payload = {'tags': [{'name': 'Vegan'}, {'name': 'Lunch'}, {'name': 'Dinner'}]}
+        res = self.client.patch(detail_url(recipe.id), payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(sorted(t['name'] for t in res.data['tags']), ['Dinner', 'Lunch', 'Vegan'])
+        dinner = Tag.objects.get(user=self.user, name='Dinner')
+        self.assertEqual(changes, [('post_remove', {tags[2].id}), ('post_add', {dinner.id})])
+        # The through rows of the tags that were kept are left untouched.
+        self.assertTrue(kept_rows <= set(through.objects.filter(recipe=recipe).values_list('id', flat=True)))
+
     def test_clear_recipe_tags(self):
         """Test clearing a recipe tags."""
         tag = Tag.objects.create(user=self.user, name='Dessert')
@@ -396,9 +487,9 @@ class PrivateRecipeAPITests(TestCase):
         s2 = RecipeSerializer(r2)
         s3 = RecipeSerializer(r3)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertIn(s1.data, res.data)
-        self.assertIn(s2.data, res.data)
-        self.assertNotIn(s3.data, res.data)
+        self.assertIn(s1.data, res.data['results'])
+        self.assertIn(s2.data, res.data['results'])
+        self.assertNotIn(s3.data, res.data['results'])
 
     def test_filter_by_ingredients(self):
         """Test filtering recipes by ingredients."""
@@ -417,9 +508,221 @@ class PrivateRecipeAPITests(TestCase):
         s2 = RecipeSerializer(r2)
         s3 = RecipeSerializer(r3)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertIn(s1.data, res.data)
-        self.assertIn(s2.data, res.data)
-        self.assertNotIn(s3.data, res.data)
+        self.assertIn(s1.data, res.data['results'])
+        self.assertIn(s2.data, res.data['results'])
+        self.assertNotIn(s3.data, res.data['results'])
+
+    def test_filter_by_tags_returns_unique_recipes(self):
+        """Test a recipe matching several of the filter tags is returned once."""
+        recipe = create_recipe(user=self.user)
+        tag1 = Tag.objects.create(user=self.user, name='Vegan')
+        tag2 = Tag.objects.create(user=self.user, name='Dessert')
+        recipe.tags.add(tag1, tag2)
+
+        res = self.client.get(RECIPES_URL, {'tags': f'{tag1.id},{tag2.id}'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['id'] for r in res.data['results']], [recipe.id])
+
+    def test_filter_by_all_tags(self):
+        """Test filtering recipes that have all the given tags."""
+        tag1 = Tag.objects.create(user=self.user, name='Vegan')
+        tag2 = Tag.objects.create(user=self.user, name='Dessert')
+        tag3 = Tag.objects.create(user=self.user, name='Quick')
+        r1 = create_recipe(user=self.user, title='Vegan brownies')
+        r1.tags.add(tag1, tag2, tag3)
+        r2 = create_recipe(user=self.user, title='Vegan chili')
+        r2.tags.add(tag1, tag3)
+
+        params = {'tags': f'{tag1.id},{tag2.id}', 'match': 'all'}
+        res = self.client.get(RECIPES_URL, params)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['id'] for r in res.data['results']], [r1.id])
+
+    def test_filter_by_all_ingredients(self):
+        """Test filtering recipes that have all the given ingredients."""
+        ingredient1 = Ingredient.objects.create(user=self.user, name='Eggs')
+        ingredient2 = Ingredient.objects.create(user=self.user, name='Flour')
+        r1 = create_recipe(user=self.user, title='Pancakes')
+        r1.ingredients.add(ingredient1, ingredient2)
+        r2 = create_recipe(user=self.user, title='Omelette')
+        r2.ingredients.add(ingredient1)
+
+        params = {'ingredients': f'{ingredient1.id},{ingredient2.id},{ingredient1.id}', 'match': 'all'}
+        res = self.client.get(RECIPES_URL, params)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['id'] for r in res.data['results']], [r1.id])
+
+    def test_filter_invalid_match(self):
+        """Test an unknown match mode returns an error."""
+        res = self.client.get(RECIPES_URL, {'tags': '1', 'match': 'some'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_search_recipes(self):
+        """Test searching recipes in their title and description."""
+        r1 = create_recipe(user=self.user, title='Thai vegetable curry')
+        r2 = create_recipe(user=self.user, title='Soup', description='A spicy curry soup.')
+        create_recipe(user=self.user, title='Porridge')
+        create_recipe(user=create_user(email='other@example.com'), title='Curry')
+
+        res = self.client.get(RECIPES_URL, {'q': 'curries'})  # Stemmed, like "curry".
+
+        # Title matches rank higher than description matches.
+        self.assertEqual([r['id'] for r in res.data['results']], [r1.id, r2.id])
+        self.assertNotIn('rank', res.data['results'][0])
+
+    def test_search_websearch_syntax(self):
+        """Test the search supports phrases and excluded words."""
+        r1 = create_recipe(user=self.user, title='Green curry')
+        create_recipe(user=self.user, title='Red curry')
+        create_recipe(user=self.user, title='Curry green beans')
+
+        res = self.client.get(RECIPES_URL, {'q': '"green curry" -red'})
+
+        self.assertEqual([r['id'] for r in res.data['results']], [r1.id])
+
+    def test_search_with_tag_filter(self):
+        """Test the search combines with the tag filter."""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        r1 = create_recipe(user=self.user, title='Tofu curry')
+        r1.tags.add(tag)
+        create_recipe(user=self.user, title='Chicken curry')
+
+        res = self.client.get(RECIPES_URL, {'q': 'curry', 'tags': tag.id})
+
+        self.assertEqual([r['id'] for r in res.data['results']], [r1.id])
+
+    def test_search_vector_updated_on_save(self):
+        """Test the search uses the current title of a recipe."""
+        recipe = create_recipe(user=self.user, title='Pancakes')
+        self.client.patch(detail_url(recipe.id), {'title': 'Waffles'})
+
+        self.assertEqual(len(self.client.get(RECIPES_URL, {'q': 'pancakes'}).data['results']), 0)
+        self.assertEqual(len(self.client.get(RECIPES_URL, {'q': 'waffles'}).data['results']), 1)
+
+    def test_search_paginated(self):
+        """Test the cursor pages of the search results follow the rank order."""
+        recipes = [
+            create_recipe(user=self.user, title='Lentil soup', description='Lentil soup with lentils.'),
+            create_recipe(user=self.user, title='Soup', description='With lentils.'),
+            create_recipe(user=self.user, title='Lentil salad'),
+            create_recipe(user=self.user, title='Lentil stew'),
+        ]
+
+        res = self.client.get(RECIPES_URL, {'q': 'lentil', 'page_size': 1})
+        ids = [r['id'] for r in res.data['results']]
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            ids.extend(r['id'] for r in res.data['results'])
+
+        # The best match first, then equal ranks newest first, then the description-only match.
+        self.assertEqual(ids, [recipes[0].id, recipes[3].id, recipes[2].id, recipes[1].id])
+
+    def _create_recipes_with_relations(self, count):
+        """Create recipes that each have a tag and an ingredient."""
+        for i in range(count):
+            recipe = create_recipe(user=self.user, title=f'Recipe {i}')
+            recipe.tags.add(Tag.objects.create(user=self.user, name=f'Tag {i}'))
+            recipe.ingredients.add(Ingredient.objects.create(user=self.user, name=f'Ingredient {i}'))
+
+    def test_list_recipes_query_count_is_constant(self):
+        """Test listing recipes does not run extra queries per recipe."""
+        self._create_recipes_with_relations(2)
+        with CaptureQueriesContext(connection) as few:
+            res = self.client.get(RECIPES_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        self._create_recipes_with_relations(10)
+        with CaptureQueriesContext(connection) as many:
+            res = self.client.get(RECIPES_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        self.assertEqual(len(few), len(many))
+
+    def test_list_recipes_same_json_as_serializer(self):
+        """Test the recipe list renders the same JSON as RecipeSerializer."""
+        tags = [Tag.objects.create(user=self.user, name=name) for name in ['Zesty', 'Vegan', 'Ünïcode "quoted"']]
+        ingredient = Ingredient.objects.create(user=self.user, name='Salt')
+        for i, price in enumerate([Decimal('5.5'), Decimal('0.05'), Decimal('999.99')]):
+            recipe = create_recipe(user=self.user, title=f'Recipe {i}', price=price, link=f'http://example.com/{i}')
+            recipe.tags.add(*tags[i:])
+            if i:
+                recipe.ingredients.add(ingredient)
+
+        res = self.client.get(RECIPES_URL)
+
+        recipes = Recipe.objects.filter(user=self.user).order_by('-id').prefetch_related(
+            Prefetch('tags', queryset=Tag.objects.order_by('id')),
+            Prefetch('ingredients', queryset=Ingredient.objects.order_by('id')),
+        )
+        expected = RecipeSerializer(recipes, many=True).data
+        self.assertEqual(JSONRenderer().render(res.data['results']), JSONRenderer().render(expected))
+
+    def test_list_recipes_paginated(self):
+        """Test the recipe list is split in pages linked by a cursor."""
+        recipes = [create_recipe(user=self.user, title=f'Recipe {i}') for i in range(5)]
+
+        res = self.client.get(RECIPES_URL, {'page_size': 2})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIsNone(res.data['previous'])
+        self.assertEqual([r['id'] for r in res.data['results']], [recipes[4].id, recipes[3].id])
+
+        ids = []
+        next_url = res.data['next']
+        while next_url:
+            res = self.client.get(next_url)
+            ids.extend(r['id'] for r in res.data['results'])
+            next_url = res.data['next']
+
+        self.assertEqual(ids, [recipes[2].id, recipes[1].id, recipes[0].id])
+
+    def test_list_recipes_page_size_capped(self):
+        """Test the requested page size cannot exceed the server-side maximum."""
+        for i in range(3):
+            create_recipe(user=self.user, title=f'Recipe {i}')
+
+        with patch.object(RecipeCursorPagination, 'max_page_size', 2):
+            res = self.client.get(RECIPES_URL, {'page_size': 1000})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['results']), 2)
+        self.assertIsNotNone(res.data['next'])
+
+    def test_paginate_filtered_recipes(self):
+        """Test the cursor keeps the filters of the first page."""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        tagged = []
+        for i in range(3):
+            recipe = create_recipe(user=self.user, title=f'Tagged {i}')
+            recipe.tags.add(tag)
+            tagged.append(recipe.id)
+            create_recipe(user=self.user, title=f'Untagged {i}')
+
+        res = self.client.get(RECIPES_URL, {'tags': tag.id, 'page_size': 2})
+        ids = [r['id'] for r in res.data['results']]
+        res = self.client.get(res.data['next'])
+        ids.extend(r['id'] for r in res.data['results'])
+
+        self.assertEqual(ids, sorted(tagged, reverse=True))
+        self.assertIsNone(res.data['next'])
+
+    def test_get_recipe_detail_prefetches_relations(self):
+        """Test the recipe detail loads tags and ingredients with one query each."""
+        recipe = create_recipe(user=self.user)
+        recipe.tags.add(*[Tag.objects.create(user=self.user, name=f'Tag {i}') for i in range(3)])
+        recipe.ingredients.add(*[Ingredient.objects.create(user=self.user, name=f'Ing {i}') for i in range(3)])
+
+        # One query for the recipe, one for the tags and one for the ingredients.
+        with self.assertNumQueries(3):
+            res = self.client.get(detail_url(recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['tags']), 3)
+        self.assertEqual(len(res.data['ingredients']), 3)
 
 
 class ImageUploadTests(TestCase):
@@ -427,6 +730,7 @@ class ImageUploadTests(TestCase):
 
     # Runs before every test.
     def setUp(self):
+        super().setUp()
         self.client = APIClient()
         self.user = get_user_model().objects.create_user(
             'user@example.com',
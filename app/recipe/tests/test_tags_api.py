@@ -4,12 +4,12 @@ Tests for the tags API.
 from decimal import Decimal
 from django.contrib.auth import get_user_model
 from django.urls import reverse
-from django.test import TestCase
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
 from core.models import Tag, Recipe
+from core.tests.base import TestCase
 from recipe.serializers import TagSerializer
 
 TAGS_URL = reverse('recipe:tag-list')
@@ -29,6 +29,7 @@ class PublicTagsApiTests(TestCase):
     """Test unauthenticated API requests."""
 
     def setUp(self):
+        super().setUp()
         self.client = APIClient()
 
     def test_auth_required(self):
@@ -42,6 +43,7 @@ class PrivateTagsApiTests(TestCase):
     """Test authenticated API requests."""
 
     def setUp(self):
+        super().setUp()
         self.user = create_user()
         self.client = APIClient()
         self.client.force_authenticate(self.user)
@@ -138,3 +140,40 @@ class PrivateTagsApiTests(TestCase):
         res = self.client.get(TAGS_URL, {'assigned_only': 1})
 
         self.assertEqual(len(res.data), 1)
+
+    def test_autocomplete_tags(self):
+        """Test the tags autocomplete combines with assigned_only."""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        Tag.objects.create(user=self.user, name='Vegetarian')
+        recipe = Recipe.objects.create(user=self.user, title='Salad', time_minutes=5, price=Decimal('3.00'))
+        recipe.tags.add(tag)
+
+        res = self.client.get(TAGS_URL, {'prefix': 'veg'})
+        res_assigned = self.client.get(TAGS_URL, {'prefix': 'veg', 'assigned_only': 1})
+
+        self.assertEqual([t['name'] for t in res.data], ['Vegan', 'Vegetarian'])
+        self.assertEqual([t['name'] for t in res_assigned.data], ['Vegan'])
+
+    def test_tags_with_counts(self):
+        """Test listing the tags with their number of recipes in one query."""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        Tag.objects.create(user=self.user, name='Unused')
+        for title in ['Salad', 'Curry']:
+            recipe = Recipe.objects.create(user=self.user, title=title, time_minutes=5, price=Decimal('3.00'))
+            recipe.tags.add(tag)
+
+        with self.assertNumQueries(1):
+            res = self.client.get(TAGS_URL, {'with_counts': 1})
+
+        self.assertEqual(res.data, [
+            {'id': tag.id, 'name': 'Vegan', 'recipe_count': 2},
+            {'id': tag.id + 1, 'name': 'Unused', 'recipe_count': 0},
+        ])
+
+    def test_invalid_flags(self):
+        """Test the assigned_only and with_counts params other than 0/1 are rejected."""
+        for params in [{'with_counts': 'yes'}, {'with_counts': ''}, {'assigned_only': 'true'}, {'assigned_only': '2'}]:
+            with self.subTest(params=params):
+                res = self.client.get(TAGS_URL, params)
+
+                self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
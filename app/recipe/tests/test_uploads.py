@@ -0,0 +1,162 @@
+"""
+Tests for the streamed recipe image uploads.
+"""
+from io import BytesIO
+from unittest.mock import patch
+import hashlib
+import os
+
+from PIL import Image
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile, TemporaryUploadedFile
+from django.test import override_settings
+from django.urls import reverse
+
+from rest_framework import serializers, status
+from rest_framework.test import APIClient
+
+from core.models import Recipe
+from core.tests.base import TestCase
+
+from recipe.uploads import ImageUploadHandler, UploadTooLarge
+
+
+def image_upload_url(recipe_id):
+    """Create and return an image upload URL."""
+    return reverse("recipe:recipe-upload-image", args=[recipe_id])
+
+
+def image_bytes(size=(100, 50), image_format='JPEG'):
+    """Return the bytes of an image."""
+    buffer = BytesIO()
+    Image.new('RGB', size).save(buffer, format=image_format)
+    return buffer.getvalue()
+
+
+def upload_chunks(handler, content, chunk_size=64 * 1024):
+    """Send a file through an upload handler in chunks, and return the uploaded file."""
+    handler.new_file('image', 'image.jpg', 'image/jpeg', len(content))
+    for start in range(0, len(content), chunk_size):
+        handler.receive_data_chunk(content[start:start + chunk_size], start)
+
+    return handler.file_complete(len(content))
+
+
+class ImageUploadApiTests(TestCase):
+    """Test the image upload endpoint with the streamed uploads."""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user('user@example.com', 'testpass123')
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(user=self.user, title='Sample recipe', time_minutes=5, price=5)
+
+    def tearDown(self):
+        self.recipe.refresh_from_db()
+        self.recipe.image.delete()
+
+    def upload(self, content, name='image.jpg'):
+        """Upload a file as the recipe image."""
+        image_file = SimpleUploadedFile(name, content, content_type='image/jpeg')
+        return self.client.post(image_upload_url(self.recipe.id), {'image': image_file}, format='multipart')
+
+    def test_upload_image_not_decoded(self):
+        """Test a valid image is saved without decoding it (only its header is read)."""
+        with patch('PIL.ImageFile.ImageFile.load') as mock_load, patch('PIL.Image.Image.verify') as mock_verify:
+            res = self.upload(image_bytes())
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        mock_load.assert_not_called()
+        mock_verify.assert_not_called()
+        self.recipe.refresh_from_db()
+        self.assertTrue(os.path.exists(self.recipe.image.path))
+
+    @override_settings(RECIPE_IMAGE_MAX_UPLOAD_SIZE=1000)
+    def test_upload_too_large(self):
+        """Test an upload over the maximum size is rejected with a 413."""
+        res = self.upload(image_bytes(size=(1000, 1000)))
+
+        self.assertEqual(res.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.recipe.refresh_from_db()
+        self.assertFalse(self.recipe.image)
+
+    def test_upload_not_an_image(self):
+        """Test a file that isn't an image is rejected."""
+        res = self.upload(b'This is not an image, but it is long enough.' * 100, name='image.txt')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('image', res.data)
+
+    def test_upload_format_not_allowed(self):
+        """Test an image in a format that isn't in RECIPE_IMAGE_FORMATS is rejected."""
+        res = self.upload(image_bytes(image_format='BMP'), name='image.bmp')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(RECIPE_IMAGE_MAX_PIXELS=100 * 100)
+    def test_upload_too_many_pixels(self):
+        """Test an image with too many pixels is rejected."""
+        res = self.upload(image_bytes(size=(200, 100)))
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('image', res.data)
+
+
+class ImageUploadHandlerTests(TestCase):
+    """Test the image upload handler."""
+
+    def test_content_length_rejected_before_reading(self):
+        """Test a too large Content-Length is rejected before reading the body."""
+        handler = ImageUploadHandler()
+        body = BytesIO(b'')
+
+        with override_settings(RECIPE_IMAGE_MAX_UPLOAD_SIZE=1000), self.assertRaises(UploadTooLarge):
+            handler.handle_raw_input(body, {}, 1001, b'boundary')
+
+    def test_non_image_rejected_on_first_chunk(self):
+        """Test a file that isn't an image is rejected on its first chunk, and its temporary file deleted."""
+        handler = ImageUploadHandler()
+        handler.new_file('image', 'image.jpg', 'image/jpeg', None)
+        path = handler.file.temporary_file_path()
+
+        with self.assertRaises(serializers.ValidationError):
+            handler.receive_data_chunk(b'<html>not an image</html>', 0)
+
+        self.assertFalse(os.path.exists(path))
+
+    @override_settings(RECIPE_IMAGE_MAX_UPLOAD_SIZE=100 * 1024)
+    def test_size_checked_while_streaming(self):
+        """Test the size is checked chunk by chunk, even without a (correct) Content-Length."""
+        handler = ImageUploadHandler()
+        handler.handle_raw_input(BytesIO(b''), {}, 0, b'boundary')
+        handler.new_file('image', 'image.jpg', 'image/jpeg', None)
+        handler.receive_data_chunk(image_bytes()[:64 * 1024], 0)
+
+        with self.assertRaises(UploadTooLarge):
+            handler.receive_data_chunk(b'\0' * 64 * 1024, 64 * 1024)
+
+    def test_image_streamed_to_temporary_file(self):
+        """Test the image is written to a temporary file, with its format, size and hash."""
+        handler = ImageUploadHandler()
+        content = image_bytes(size=(300, 200))
+
+        uploaded = upload_chunks(handler, content, chunk_size=100)
+
+        self.assertIsInstance(uploaded, TemporaryUploadedFile)
+        self.assertEqual(uploaded.image_format, 'JPEG')
+        self.assertEqual(uploaded.image_size, (300, 200))
+        self.assertEqual(uploaded.content_hash, hashlib.sha256(content).hexdigest())
+        uploaded.close()
+
+    def test_header_not_identified_until_complete(self):
+        """Test a format that needs more than the header is identified when the upload completes."""
+        handler = ImageUploadHandler()
+
+        with patch('recipe.uploads.HEADER_SIZE', 32):
+            uploaded = upload_chunks(handler, image_bytes(size=(300, 200), image_format='WEBP'), chunk_size=16)
+
+        self.assertEqual(uploaded.image_format, 'WEBP')
+        self.assertEqual(uploaded.image_size, (300, 200))
+        uploaded.close()
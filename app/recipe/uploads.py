@@ -0,0 +1,135 @@
+"""
+Streamed and size-bounded recipe image uploads.
+
+ImageUploadHandler replaces Django's default upload handlers on the image upload
+endpoint. The upload is always streamed to a temporary file (never buffered in
+memory), and it is rejected as soon as possible:
+
+- A Content-Length over RECIPE_IMAGE_MAX_UPLOAD_SIZE is rejected before reading the body.
+- The size is also checked chunk by chunk (the Content-Length may be missing or wrong).
+- The first bytes must be the signature of one of RECIPE_IMAGE_FORMATS.
+- The format and dimensions are read from the header (without decoding the pixels),
+  and images with more than RECIPE_IMAGE_MAX_PIXELS pixels are rejected.
+
+The format and dimensions are saved on the uploaded file (image_format, image_size), so
+UploadedImageField doesn't open the image again, and so is the SHA-256 of its content
+(content_hash), which names the stored file (see core.models.recipe_image_path).
+"""
+import hashlib
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.utils.translation import gettext_lazy as _
+from PIL import Image
+from rest_framework import exceptions, serializers, status
+
+
+SIGNATURE_SIZE = 16  # Bytes Pillow checks to identify a format.
+HEADER_SIZE = 64 * 1024  # Bytes kept to read the dimensions, enough for the header (and EXIF) of most images.
+
+
+class UploadTooLarge(exceptions.APIException):
+    """The upload is larger than RECIPE_IMAGE_MAX_UPLOAD_SIZE."""
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = _('The upload is too large.')
+    default_code = 'upload_too_large'
+
+
+def invalid_image(message):
+    """Return the error of an invalid image, like the serializer errors."""
+    return serializers.ValidationError({'image': [message]})
+
+
+def accepts_signature(prefix):
+    """Return whether the first bytes of a file are the signature of an allowed format."""
+    Image.init()
+    for image_format in settings.RECIPE_IMAGE_FORMATS:
+        accept = Image.OPEN.get(image_format, (None, None))[1]
+        if accept is not None and accept(prefix):
+            return True
+
+    return False
+
+
+def sniff_image(image_file):
+    """Return the (format, (width, height)) of an image from its header, or None if it isn't identified."""
+    try:
+        # Image.open only reads the header, the pixels are decoded on load().
+        with Image.open(image_file, formats=settings.RECIPE_IMAGE_FORMATS) as image:
+            return image.format, image.size
+    except Image.DecompressionBombError:
+        raise invalid_image(_('The image has too many pixels.'))
+    except (OSError, ValueError):  # Not an image, or the header is incomplete.
+        return None
+
+
+class ImageUploadHandler(TemporaryFileUploadHandler):
+    """Upload handler that streams an image to a temporary file, checking it while it arrives."""
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        """Reject the request before reading the body if it is too large."""
+        if content_length > settings.RECIPE_IMAGE_MAX_UPLOAD_SIZE:
+            raise UploadTooLarge()
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.header = b''
+        self.image = None  # (format, (width, height)), once read from the header.
+        self.sha256 = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > settings.RECIPE_IMAGE_MAX_UPLOAD_SIZE:
+            self.reject(UploadTooLarge())
+
+        if self.image is None and len(self.header) < HEADER_SIZE:
+            checked_signature = len(self.header) >= SIGNATURE_SIZE
+            self.header += raw_data[:HEADER_SIZE - len(self.header)]
+            if len(self.header) >= SIGNATURE_SIZE:
+                if not checked_signature and not accepts_signature(self.header[:SIGNATURE_SIZE]):
+                    self.reject(invalid_image(_('Upload a valid image.')))
+                self.check_image(BytesIO(self.header))
+
+        self.sha256.update(raw_data)
+        super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        if self.image is None:
+            # The header didn't fit in HEADER_SIZE bytes (or the format needs the whole file to be identified).
+            self.file.seek(0)
+            self.check_image(self.file)
+            if self.image is None:
+                self.reject(invalid_image(_('Upload a valid image.')))
+
+        image_file = super().file_complete(file_size)
+        image_file.image_format, image_file.image_size = self.image
+        image_file.content_hash = self.sha256.hexdigest()
+        return image_file
+
+    def check_image(self, image_file):
+        """Save the format and dimensions of the image, rejecting it if it has too many pixels."""
+        try:
+            image = sniff_image(image_file)
+        except serializers.ValidationError as error:
+            self.reject(error)
+        if image is None:
+            return
+        width, height = image[1]
+        if width * height > settings.RECIPE_IMAGE_MAX_PIXELS:
+            self.reject(invalid_image(_('The image has too many pixels.')))
+        self.image = image
+
+    def reject(self, error):
+        """Delete the temporary file and raise the error, without reading the rest of the body."""
+        self.upload_interrupted()
+        raise error
+
+
+class UploadedImageField(serializers.ImageField):
+    """ImageField that trusts the checks of ImageUploadHandler, instead of opening the image again."""
+
+    def to_internal_value(self, data):
+        if getattr(data, 'image_format', None) is None:  # Not uploaded through ImageUploadHandler.
+            return super().to_internal_value(data)
+
+        return serializers.FileField.to_internal_value(self, data)
@@ -1,16 +1,35 @@
 """
 Views for the recipe APIs.
 """
+import re
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity, TrigramWordSimilarity
+from django.db.models import Count, Exists, F, FloatField, OuterRef, Prefetch
+from django.db.models.functions import Cast
+from django.http import Http404
 from drf_spectacular.utils import extend_schema_view, extend_schema, OpenApiParameter, OpenApiTypes
 from rest_framework import viewsets, mixins, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.exceptions import ValidationError
 
-from core.models import Recipe, Tag, Ingredient
+from core.authentication import CachedTokenAuthentication
+from core.db_router import ReplicaReadsMixin
+from core.metrics import TimedViewMixin
+from core.models import SEARCH_CONFIG, Recipe, Tag, Ingredient
 from recipe import serializers
+from recipe.batch import run_batch
+from recipe.cache import CachedResponseMixin
+from recipe.conditional import ConditionalGetMixin, arecipe_etag, recipe_etag
+from recipe.export import EXPORT_FORMATS, export_response
+from recipe.facets import facet_counts
+from recipe.images import replace_image
+from recipe.pagination import RecipeCursorPagination
+from recipe.uploads import ImageUploadHandler
 
 
 # * RECIPE VIEWSET
@@ -28,18 +47,74 @@ from recipe import serializers
                 type=OpenApiTypes.STR,
                 description="Comma separated list of ingredients to filter by.",
             ),
+            OpenApiParameter(
+                name='match',
+                type=OpenApiTypes.STR,
+                enum=['any', 'all'],
+                description="Return recipes with any (default) or all of the given tags/ingredients.",
+            ),
+            OpenApiParameter(
+                name='q',
+                type=OpenApiTypes.STR,
+                description="Full-text search in the title and description, most relevant recipes first. "
+                            "Supports \"quoted phrases\", OR and -excluded words.",
+            ),
         ]
-    )
+    ),
+    export=extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name='output',
+                type=OpenApiTypes.STR,
+                enum=list(EXPORT_FORMATS),
+                description="Export format: newline-delimited JSON (default) or CSV.",
+            ),
+            OpenApiParameter(name='tags', type=OpenApiTypes.STR, description="Comma separated list of tags."),
+            OpenApiParameter(
+                name='ingredients',
+                type=OpenApiTypes.STR,
+                description="Comma separated list of ingredients.",
+            ),
+            OpenApiParameter(name='match', type=OpenApiTypes.STR, enum=['any', 'all']),
+            OpenApiParameter(name='q', type=OpenApiTypes.STR, description="Full-text search."),
+        ],
+        responses={
+            (200, 'application/x-ndjson'): OpenApiTypes.STR,
+            (200, 'text/csv'): OpenApiTypes.STR,
+        },
+    ),
+    facets=extend_schema(
+        parameters=[
+            OpenApiParameter(name='tags', type=OpenApiTypes.STR, description="Comma separated list of tags."),
+            OpenApiParameter(
+                name='ingredients',
+                type=OpenApiTypes.STR,
+                description="Comma separated list of ingredients.",
+            ),
+            OpenApiParameter(name='match', type=OpenApiTypes.STR, enum=['any', 'all']),
+            OpenApiParameter(name='q', type=OpenApiTypes.STR, description="Full-text search."),
+        ],
+        responses=serializers.RecipeFacetsSerializer,
+    ),
+    batch=extend_schema(
+        responses={
+            200: serializers.RecipeBatchResultSerializer(many=True),
+            400: serializers.RecipeBatchResultSerializer(many=True),
+        },
+    ),
 )
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(TimedViewMixin, ReplicaReadsMixin, ConditionalGetMixin, CachedResponseMixin, viewsets.ModelViewSet):
     """View for manage recipe APIs."""
 
     serializer_class = serializers.RecipeDetailSerializer
     # queryset represents the objects that are available for this ViewSet,
     # since a ViewSet is expected to work with a model.
     queryset = Recipe.objects.all()
-    authentication_classes = [TokenAuthentication]  # Tells Django to use TokenAuthentication for this view.
+    # Tells Django to use token authentication (with the token lookups cached) for this view.
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]  # Tells Django to use IsAuthenticated for this view.
+    # Only the list action is paginated. The ordering ("-id") is applied by the paginator.
+    pagination_class = RecipeCursorPagination
 
     def _params_to_ints(self, qs):
         """Convert a list of strings to integers."""
@@ -52,26 +127,61 @@ class RecipeViewSet(viewsets.ModelViewSet):
         except ValueError:
             raise ValidationError("Invalid format. IDs must be integers.")
 
-    # We override the get_queryset method to return only the recipes that belong to the authenticated user.
+    def _get_match(self):
+        """Return the match mode ("any" or "all") of the tags/ingredients filters."""
+        match = self.request.query_params.get("match", "any")
+        if match not in ("any", "all"):
+            raise ValidationError("Invalid match. It must be 'any' or 'all'.")
+        return match
+
+    def _related_filter(self, through, related_field, ids, match):
+        """Return an EXISTS condition on a recipe M2M through table."""
+        # Filtering through a correlated EXISTS on the through table (instead of joining it)
+        # returns each recipe at most once, so the queryset doesn't need a DISTINCT.
+        rows = through.objects.filter(recipe_id=OuterRef("pk"), **{f"{related_field}__in": ids})
+        if match == "all":
+            # The recipe must have a through row for each of the given ids:
+            # GROUP BY recipe_id HAVING COUNT(*) = <number of ids>.
+            rows = rows.values("recipe_id").annotate(matches=Count("*")).filter(matches=len(ids))
+        return Exists(rows)
 
+    # We override the get_queryset method to return only the recipes that belong to the authenticated user.
     def get_queryset(self):
         """Retrieve the recipes for the authenticated user."""
         tags = self.request.query_params.get("tags")
         ingredients = self.request.query_params.get("ingredients")
+        match = self._get_match()
         queryset = self.queryset
         if tags:
-            tag_ids = self._params_to_ints(tags)
-            # This syntax allows us to filter related fields on a database table. The syntax works as follows:
-            # tags is the related field we want to filter on.
-            # __id is the field we want to filter on.
-            # __in is the filter we want to apply.
-            queryset = queryset.filter(tags__id__in=tag_ids)
+            tag_ids = set(self._params_to_ints(tags))
+            queryset = queryset.filter(self._related_filter(Recipe.tags.through, "tag_id", tag_ids, match))
         if ingredients:
-            ingredient_ids = self._params_to_ints(ingredients)
-            queryset = queryset.filter(ingredients__id__in=ingredient_ids)
+            ingredient_ids = set(self._params_to_ints(ingredients))
+            queryset = queryset.filter(
+                self._related_filter(Recipe.ingredients.through, "ingredient_id", ingredient_ids, match)
+            )
 
         auth_user = self.request.user  # Retrieve the authenticated user.
-        return queryset.filter(user=auth_user).order_by("-id").distinct()
+        queryset = queryset.filter(user=auth_user)
+
+        search = self.request.query_params.get("q", "").strip()
+        if search:
+            # websearch syntax: "quoted phrases", OR and -excluded words. The search_vector column is
+            # GIN-indexed, and the most relevant recipes come first (see RecipeCursorPagination).
+            query = SearchQuery(search, search_type="websearch", config=SEARCH_CONFIG)
+            queryset = queryset.filter(search_vector=query).annotate(
+                # ts_rank() returns a real: as a double, the cursor position round-trips exactly.
+                rank=Cast(SearchRank(F("search_vector"), query), FloatField()),
+            ).order_by("-rank", "-id")
+        else:
+            queryset = queryset.order_by("-id")
+
+        # Prefetch the nested tags and ingredients in one query each (instead of two per recipe),
+        # loading only the fields that the nested serializers render. The search vector is never rendered.
+        return queryset.defer("search_vector").prefetch_related(
+            Prefetch('tags', queryset=Tag.objects.only('id', 'name').order_by('id')),
+            Prefetch('ingredients', queryset=Ingredient.objects.only('id', 'name').order_by('id')),
+        )
 
     # We override the get_serializer_class method to return the appropriate serializer class for the request.
     # We need different serializers for list and detail views, for example.
@@ -81,9 +191,70 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return serializers.RecipeSerializer
         elif self.action == 'upload_image':
             return serializers.RecipeImageSerializer
+        elif self.action == 'batch':
+            return serializers.RecipeBatchSerializer
+        elif self.action == 'facets':
+            return serializers.RecipeFacetsSerializer
 
         return self.serializer_class
 
+    # The ETag is checked first (it only needs the user's cache version): a client that already has
+    # the response gets a 304 without reading the cached response or running the serializer.
+    def list(self, request, *args, **kwargs):
+        """List the recipes."""
+        etag = recipe_etag(request)
+        handler = partial(self.cached_response, self._list_rows)
+        return self.conditional_response(etag, handler, request, *args, **kwargs)
+
+    def _list_rows(self, request, *args, **kwargs):
+        """List the recipes from .values() rows (same output as RecipeSerializer, see serialize_recipe_list)."""
+        # The tags/ingredients are loaded by serialize_recipe_list, not by the queryset prefetches.
+        queryset = self.filter_queryset(self.get_queryset()).prefetch_related(None)
+        fields = serializers.RECIPE_LIST_FIELDS
+        if 'rank' in queryset.query.annotations:
+            fields = fields + ['rank']  # The cursor of the search results encodes the rank.
+        rows = queryset.values(*fields)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(serializers.serialize_recipe_list(page))
+
+        return Response(serializers.serialize_recipe_list(list(rows)))
+
+    def retrieve(self, request, *args, **kwargs):
+        """Retrieve a recipe."""
+        etag = recipe_etag(request)
+        handler = partial(self.cached_response, super().retrieve)
+        return self.conditional_response(etag, handler, request, *args, **kwargs)
+
+    # * ASYNC ACTIONS
+    # The same list and retrieve, for the async views of the ASGI deployment (see recipe/async_views.py).
+    async def alist(self, request, *args, **kwargs):
+        """List the recipes (async)."""
+        etag = await arecipe_etag(request)
+        handler = partial(self.acached_response, self._alist_rows)
+        return await self.aconditional_response(etag, handler, request, *args, **kwargs)
+
+    async def _alist_rows(self, request, *args, **kwargs):
+        """List the recipes from .values() rows (async)."""
+        # DRF's cursor paginator is sync: the page is fetched in the request's thread,
+        # which is also where the async ORM runs its queries.
+        return await sync_to_async(self._list_rows)(request, *args, **kwargs)
+
+    async def aretrieve(self, request, *args, **kwargs):
+        """Retrieve a recipe (async)."""
+        etag = await arecipe_etag(request)
+        handler = partial(self.acached_response, self._aretrieve)
+        return await self.aconditional_response(etag, handler, request, *args, **kwargs)
+
+    async def _aretrieve(self, request, pk=None):
+        """Return the detail of a recipe, a 404 like get_object() when it isn't one of the user's."""
+        try:
+            recipe = await self.get_queryset().aget(pk=pk)
+        except (Recipe.DoesNotExist, TypeError, ValueError):
+            raise Http404(f'No {Recipe._meta.object_name} matches the given query.')
+
+        return Response(self.get_serializer(recipe).data)
+
     def perform_create(self, serializer):
         """Create a new recipe."""
         serializer.save(user=self.request.user)
@@ -93,16 +264,51 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def upload_image(self, request, pk=None):
         """Upload an image to a recipe."""
         recipe = self.get_object()  # Get the recipe object.
+        # The image is streamed to a temporary file and checked while it arrives (see recipe/uploads.py).
+        # This must be set before request.data parses the body.
+        request._request.upload_handlers = [ImageUploadHandler(request._request)]
         # We get the serializer, which it will indirectly run through the get_serializer_class class and
         # return the RecipeImageSerializer class.
         serializer = self.get_serializer(recipe, data=request.data)
 
         if serializer.is_valid():
-            serializer.save()
+            # The resized/WebP variants are generated in the background (see recipe/images.py).
+            replace_image(serializer)
             return Response(serializer.data, status=status.HTTP_200_OK)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(methods=['GET'], detail=False, url_path='export')
+    def export(self, request):
+        """Stream all the (filtered) recipes of the user as NDJSON or CSV."""
+        output = request.query_params.get('output', 'ndjson')
+        if output not in EXPORT_FORMATS:
+            raise ValidationError(f"Invalid output. It must be one of: {', '.join(EXPORT_FORMATS)}.")
+
+        return export_response(self.get_queryset(), self.get_serializer_context(), output)
+
+    @action(methods=['GET'], detail=False, url_path='facets')
+    def facets(self, request):
+        """Count the (filtered) recipes of the user by tag and ingredient."""
+        # Like the list, the facets have an ETag and are cached until the user's data changes.
+        etag = recipe_etag(request)
+        handler = partial(self.cached_response, self._facets)
+        return self.conditional_response(etag, handler, request)
+
+    def _facets(self, request):
+        """Return the facet counts of the (filtered) recipes of the user."""
+        return Response(facet_counts(self.get_queryset()))
+
+    # Not paginated: the results are a plain list, one per operation.
+    @action(methods=['POST'], detail=False, url_path='batch', pagination_class=None)
+    def batch(self, request):
+        """Create, update and delete recipes in a single transaction."""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        results, applied = run_batch(serializer.validated_data['operations'], self.get_serializer_context())
+        return Response(results, status=status.HTTP_200_OK if applied else status.HTTP_400_BAD_REQUEST)
+
 
 # * TAG AND INGREDIENT VIEWSETS
 # ! The mixins provide the actions that can be performed on the view.
@@ -116,39 +322,118 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 enum=[0, 1],
                 description="Filter by items assigned to recipes.",
             ),
+            OpenApiParameter(
+                name='with_counts',
+                type=OpenApiTypes.INT,
+                enum=[0, 1],
+                description="Include the number of recipes of each item (recipe_count).",
+            ),
+            OpenApiParameter(
+                name='prefix',
+                type=OpenApiTypes.STR,
+                description="Autocomplete: names starting with this text (case insensitive), best matches first.",
+            ),
+            OpenApiParameter(
+                name='similar',
+                type=OpenApiTypes.STR,
+                description="Autocomplete: names with a word similar to this text (typos allowed), best matches first.",
+            ),
         ]
     )
 )
-class BaseRecipeAttrViewSet(mixins.DestroyModelMixin,
+class BaseRecipeAttrViewSet(TimedViewMixin,
+                            ReplicaReadsMixin,
+                            CachedResponseMixin,
+                            mixins.DestroyModelMixin,
                             mixins.UpdateModelMixin,
                             mixins.ListModelMixin,
                             viewsets.GenericViewSet):
     """Base viewset for recipe attributes."""
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
+    def _get_flag(self, name):
+        """Return the value of a 0/1 query param (0 by default) as a boolean."""
+        value = self.request.query_params.get(name, "0")
+        if value not in ("0", "1"):
+            raise ValidationError(f"Invalid {name}. It must be 0 or 1.")
+        return value == "1"
+
     def get_queryset(self):
         """Filter queryset to authenticated user."""
-        assigned_only = bool(  # Convert the int to a boolean.
-            int(self.request.query_params.get("assigned_only", 0))  # Default value is 0.
-        )
-        queryset = self.queryset
+        assigned_only = self._get_flag("assigned_only")
+        queryset = self.queryset.filter(user=self.request.user).order_by("-name")
         if assigned_only:
-            # recipe is the related field we want to filter on, and __isnull is the filter we want to apply
-            queryset = queryset.filter(recipe__isnull=False)
+            # A semi-join: each tag/ingredient is checked once for a row in the through table,
+            # so there is no join to de-duplicate with DISTINCT.
+            through = self.queryset.model.recipe_set.through
+            column = self.queryset.model._meta.model_name  # "tag" or "ingredient".
+            queryset = queryset.filter(Exists(through.objects.filter(**{column: OuterRef("pk")})))
+
+        if self._with_counts():
+            # The number of recipes of each tag/ingredient (LEFT JOIN + GROUP BY), in the same query.
+            queryset = queryset.annotate(recipe_count=Count("recipe"))
+
+        prefix = self.request.query_params.get("prefix", "").strip()
+        similar = self.request.query_params.get("similar", "").strip()
+        if self.action == 'list' and (prefix or similar):
+            queryset = self._autocomplete(queryset, prefix, similar)
+
+        return queryset
+
+    def _autocomplete(self, queryset, prefix, similar):
+        """Return the first names that match a prefix and/or are similar to a text, best matches first."""
+        # Both lookups are served by the (user, name) trigram index.
+        if prefix:
+            # An anchored case-insensitive regex, since the UPPER(name) of istartswith can't use the index.
+            queryset = queryset.filter(name__iregex=f"^{re.escape(prefix)}")
+        if similar:
+            # A word of the name is similar to the text: "tomatos" matches "Cherry tomatoes".
+            queryset = queryset.filter(name__trigram_word_similar=similar)
+            similarity = TrigramWordSimilarity(similar, "name")
+        else:
+            similarity = TrigramSimilarity("name", prefix)  # The closest to the prefix (the shortest) first.
+
+        return queryset.annotate(similarity=similarity).order_by(
+            "-similarity", "name"
+        )[:settings.RECIPE_AUTOCOMPLETE_LIMIT]
+
+    def _with_counts(self):
+        """Return whether the list includes the recipe count of each tag/ingredient."""
+        return self.action == 'list' and self._get_flag("with_counts")
+
+    def get_serializer_class(self):
+        """Return the serializer class for request."""
+        if self._with_counts():
+            return self.count_serializer_class
+
+        return self.serializer_class
+
+    def list(self, request, *args, **kwargs):
+        """List the tags/ingredients, from the cache when possible."""
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    async def alist(self, request, *args, **kwargs):
+        """List the tags/ingredients (async, see recipe/async_views.py)."""
+        return await self.acached_response(self._alist, request, *args, **kwargs)
 
-        return queryset.filter(user=self.request.user).order_by("-name").distinct()
+    async def _alist(self, request, *args, **kwargs):
+        """List the tags/ingredients with the async ORM."""
+        queryset = self.filter_queryset(self.get_queryset())
+        return Response(self.get_serializer([obj async for obj in queryset], many=True).data)
 
 
 class TagViewSet(BaseRecipeAttrViewSet):
     """Manage tags in the database."""
     serializer_class = serializers.TagSerializer
+    count_serializer_class = serializers.TagCountSerializer
     queryset = Tag.objects.all()
 
 
 class IngredientViewSet(BaseRecipeAttrViewSet):
     """Manage ingredients in the database."""
     serializer_class = serializers.IngredientSerializer
+    count_serializer_class = serializers.IngredientCountSerializer
     queryset = Ingredient.objects.all()  # What models we want to be managable by this view set.
 
 
@@ -1,13 +1,14 @@
 """
 Tests for the user API.
 """
-from django.test import TestCase
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 
 from rest_framework.test import APIClient
 from rest_framework import status
 
+from core.tests.base import TestCase
+
 
 CREATE_USER_URL = reverse('user:create')
 TOKEN_URL = reverse('user:token')
@@ -23,6 +24,7 @@ class PublicUserApiTests(TestCase):
     """Test the public features of the user API."""
 
     def setUp(self):
+        super().setUp()
         self.client = APIClient()
 
     def test_create_user_success(self):
@@ -115,6 +117,7 @@ class PrivateUserApiTests(TestCase):
     """Test API requests that require authentication."""
 
     def setUp(self):
+        super().setUp()
         # Create a user that we can use for authentication.
         self.user = create_user(
             email='test@example.com',
@@ -1,17 +1,19 @@
 """
 Views for the user API.
 """
-from rest_framework import generics, authentication, permissions
+from rest_framework import generics, permissions
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.settings import api_settings
 
+from core.authentication import CachedTokenAuthentication
+from core.metrics import TimedViewMixin
 from user.serializers import (UserSerializer, AuthTokenSerializer)
 
 
 # generics.CreateAPIView is a generic view that provides the following features:
 # - Create a model instance (POST).
 # - Provide a serializer_class attribute, an authentication_classes attribute, and a permission_classes attribute.
-class CreateUserView(generics.CreateAPIView):
+class CreateUserView(TimedViewMixin, generics.CreateAPIView):
     """Create a new user in the system."""
     serializer_class = UserSerializer
 
@@ -20,11 +22,11 @@ class CreateUserView(generics.CreateAPIView):
 # - Retrieve a model instance (GET).
 # - Update a model instance (PUT and PATCH).
 # - Provide a serializer_class attribute, an authentication_classes attribute, a permission_classes attribute, etc.
-class ManagerUserView(generics.RetrieveUpdateAPIView):
+class ManagerUserView(TimedViewMixin, generics.RetrieveUpdateAPIView):
     """Manage the authenticated user."""
     serializer_class = UserSerializer
-    # Authentication (token based).
-    authentication_classes = [authentication.TokenAuthentication]
+    # Authentication (token based, with the token lookups cached).
+    authentication_classes = [CachedTokenAuthentication]
     # Authorization (authenticated users only).
     permission_classes = [permissions.IsAuthenticated]
 
@@ -34,7 +36,7 @@ class ManagerUserView(generics.RetrieveUpdateAPIView):
 
 
 # ObtainAuthToken is a view provided by Django REST framework that allows users to authenticate and receive a token.
-class CreateTokenView(ObtainAuthToken):
+class CreateTokenView(TimedViewMixin, ObtainAuthToken):
     """Create a new auth token for user."""
     serializer_class = AuthTokenSerializer  # This is the custom serializer used to validate the user input.
     # Optional: Enables the view in the Django admin site.
@@ -5,9 +5,15 @@ server {
         alias /vol/static;
     }
 
+    # The recipe images (and their variants) are named by the hash of their content,
+    # so the content of a URL never changes.
+    location /static/media/uploads/recipe/ {
+        alias /vol/static/media/uploads/recipe/;
+        add_header Cache-Control "public, max-age=31536000, immutable";
+    }
+
     location / {
-        uwsgi_pass              ${APP_HOST}:${APP_PORT};
-        include                 /etc/nginx/uwsgi_params;
+        include                 /etc/nginx/app.conf;
         client_max_body_size    10M;
     }
 }
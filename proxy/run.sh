@@ -3,4 +3,7 @@
 set -e
 
 envsubst < /etc/nginx/default.conf.tpl > /etc/nginx/conf.d/default.conf
+# How to pass the requests to the app: uwsgi_pass (wsgi) or proxy_pass (asgi), see scripts/run.sh.
+# Only our variables are substituted, the nginx ones ($host...) are kept.
+envsubst '${APP_HOST} ${APP_PORT}' < /etc/nginx/app-${APP_SERVER}.conf.tpl > /etc/nginx/app.conf
 nginx -g 'daemon off;'
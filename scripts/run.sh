@@ -6,9 +6,17 @@ python manage.py wait_for_db
 python manage.py collectstatic --noinput # collect all static files into a single directory
 python manage.py migrate
 
-# --socket :9000: uWSGI will listen on port 9000
-# --workers 4: uWSGI will start 4 worker processes
-# --master: uWSGI will start a master process
-# --enable-threads: uWSGI will enable threading, so multiple requests can be handled concurrently
-# --module app.wsgi: tells uWSGI where is the entry point of the application (wsgi.py file)
-uwsgi --socket :9000 --workers 4 --master --enable-threads --module app.wsgi
+if [ "${APP_SERVER:-wsgi}" = "asgi" ]; then
+    # ASGI deployment: the hot read endpoints are async views (see app/asgi_urls.py).
+    # --port 9000: uvicorn will listen for HTTP on port 9000 (the proxy uses proxy_pass instead of uwsgi_pass)
+    # --workers 4: uvicorn will start 4 worker processes, each with an event loop
+    # --proxy-headers: the client address and scheme come from the proxy's X-Forwarded-* headers
+    uvicorn app.asgi:application --host 0.0.0.0 --port 9000 --workers 4 --proxy-headers --forwarded-allow-ips '*'
+else
+    # --socket :9000: uWSGI will listen on port 9000
+    # --workers 4: uWSGI will start 4 worker processes
+    # --master: uWSGI will start a master process
+    # --enable-threads: uWSGI will enable threading, so multiple requests can be handled concurrently
+    # --module app.wsgi: tells uWSGI where is the entry point of the application (wsgi.py file)
+    uwsgi --socket :9000 --workers 4 --master --enable-threads --module app.wsgi
+fi